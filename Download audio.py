@@ -19,4 +19,6 @@ Japanese audio from Japanesepod.
 # Flake8 complains, but that is OK. We need the imports here. RAS 2012-10-17
 import downloadaudio.conflanguage
 import downloadaudio.download
+import downloadaudio.batch
+import downloadaudio.prefetch
 from downloadaudio import __version__
@@ -0,0 +1,397 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""
+Download audio for many notes at once.
+
+Select notes in the browser and download audio for all their empty
+audio fields. Looking at the notes and the downloads run in a
+background thread, while a progress dialog is shown. There is no
+review dialog. For each field, the first file that is not on the
+blacklist is added.
+
+The run is kept in a journal (see journal.py), and the notes are
+saved to the collection every flush_every notes. After a crash, the
+files that didn't make it into a saved note are removed and the
+batch can go on where it stopped.
+"""
+
+import os
+import Queue
+import threading
+
+from PyQt4.QtCore import QTimer, Qt, SIGNAL
+from PyQt4.QtGui import QAction, QIcon, QProgressDialog
+
+from aqt import mw
+from aqt.utils import askUser, tooltip
+from anki.hooks import addHook
+from anki.lang import _
+from anki.utils import ids2str, splitFields
+
+from .download import icons_dir, retrieve_files
+from .downloaders import routing
+from .get_fields import get_note_fields
+from .journal import BatchJournal, belongs_to, collect_garbage, \
+    journal_path, read_journal, settle_pending
+from .journal import remove as remove_file
+from .language import get_language_code
+
+
+flush_every = 50
+"""Save the changed notes to the collection after this many notes."""
+
+first_hit = True
+"""
+Stop asking the sites for a field once one had a good file.
+
+We only use the first file for each field anyway.
+"""
+
+poll_interval = 100
+"""Milliseconds between two looks for notes the download has done."""
+
+running_batch = None
+"""The BatchProgress of the batch download that is running, or None."""
+
+
+class NoteData(object):
+    """
+    The bits of a note plan_batch() looks at.
+
+    Looks enough like a note for get_note_fields() and
+    get_language_code(). The collection may only be used in the main
+    thread, so we read the notes there, in one go, and look at them
+    in the download thread. The language comes from the deck conf,
+    so it is looked up in the main thread, too, see load_notes().
+    """
+    def __init__(self, nid, model, flds, tags):
+        self.id = nid
+        self.the_model = model
+        self.fields = splitFields(flds)
+        self.tags = tags
+        self.field_map = dict(
+            (fld['name'], fld['ord']) for fld in model['flds'])
+        self.language = None
+
+    def model(self):
+        return self.the_model
+
+    def __getitem__(self, key):
+        return self.fields[self.field_map[key]]
+
+
+def load_notes(nids):
+    """
+    Return NoteData for the notes with the ids in nids, in that order.
+
+    Notes that don't exist (any more) are left out. Call this in the
+    main thread. The language of each note is looked up here, too.
+    """
+    rows = dict(
+        (nid, (mid, flds, tags)) for nid, mid, flds, tags in mw.col.db.all(
+            'select id, mid, flds, tags from notes where id in '
+            + ids2str(nids)))
+    notes = []
+    for nid in nids:
+        try:
+            mid, flds, tags = rows[nid]
+        except KeyError:
+            continue
+        note = NoteData(
+            nid, mw.col.models.get(mid), flds, mw.col.tags.split(tags))
+        note.language = get_language_code(note=note)
+        notes.append(note)
+    return notes
+
+
+def plan_batch(notes):
+    """
+    Return a list of (note id, field data, language) tuples.
+
+    notes is a list of NoteData from load_notes(), with their
+    languages. Only keep the field data for audio fields that are
+    still empty. The notes are grouped by language,
+    so that we ask the same sites one note after the other and can
+    use their open connections.
+    """
+    plan = []
+    for note in notes:
+        field_data = [fd for fd in get_note_fields(note) if not note[fd[1]]]
+        if field_data:
+            plan.append((note.id, field_data, note.language))
+    # Sorting is stable, so within a language the order stays.
+    plan.sort(key=lambda item: item[2])
+    return plan
+
+
+class BatchDownload(object):
+    """
+    Download audio for a list of notes in a background thread.
+
+    First the notes are looked at, see plan_batch(). The number of
+    notes we download for is put into self.results. Then the results
+    are put there as (note id, retrieved files list) tuples, followed
+    by a None when we are done. The notes themselves are not touched
+    here. That has to be done in the main thread.
+    """
+    def __init__(self, notes, journal=None):
+        self.notes = notes
+        self.plan = []
+        self.journal = journal
+        self.results = Queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """Stop after the note we are working on."""
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self.plan = plan_batch(self.notes)
+            if self.plan and self.journal:
+                self.journal.start(
+                    nid for nid, field_data, language in self.plan)
+            self.results.put(len(self.plan))
+            for nid, field_data, language in self.plan:
+                if self.cancelled.is_set():
+                    break
+                note_journal = None
+                if self.journal:
+                    note_journal = self.journal.for_note(nid)
+                try:
+                    retrieved_files_list, dummy_skull = retrieve_files(
+                        field_data, language, first_hit=first_hit,
+                        journal=note_journal)
+                except Exception:
+                    retrieved_files_list = []
+                self.results.put((nid, retrieved_files_list))
+        finally:
+            self.results.put(None)
+
+
+def pick_files(retrieved_files_list):
+    """
+    Return a dict of field name: file name, remove the other files.
+
+    Take the first file for each audio field. The files come in the
+    order of the downloaders list.
+    """
+    picked = {}
+    for source, dest, text, dl_fname, dl_hash, extras, icon \
+            in retrieved_files_list:
+        if dest in picked:
+            os.remove(os.path.join(mw.col.media.dir(), dl_fname))
+            continue
+        picked[dest] = dl_fname
+    return picked
+
+
+def flush_notes(notes, done_nids, names, journal):
+    """
+    Save the notes, and note in the journal that they are done.
+
+    done_nids are the ids of all notes done since the last flush,
+    with or without new files. names are the new files.
+    """
+    # When we crash during the save, this tells us to look whether
+    # it went through before we remove any files.
+    journal.committing(done_nids, names)
+    for note in notes:
+        note.flush()
+    # Really write them to disk. Only then are they safe from a crash.
+    mw.col.save()
+    journal.committed(done_nids, names)
+    for pending in (notes, done_nids, names):
+        del pending[:]
+
+
+class BatchProgress(QProgressDialog):
+    """
+    Show how far the batch download is, and save its notes.
+
+    The dialog is shown first, then the notes are read and looked at.
+    Every poll_interval we take the notes the download has done and
+    add their files.
+    """
+    def __init__(self, nids, journal, parent=None):
+        QProgressDialog.__init__(
+            self, _(u"Looking at the notes."), _(u"Cancel"), 0, 0, parent)
+        self.nids = nids
+        self.journal = journal
+        self.batch = None
+        self.setWindowTitle(_(u'Anki – Download audio'))
+        self.setWindowModality(Qt.WindowModal)
+        self.setMinimumDuration(0)
+        self.planned = 0
+        self.done_count = 0
+        self.notes_with_audio = 0
+        self.changed_notes = []
+        self.done_nids = []
+        self.new_names = []
+        self.timer = QTimer(self)
+        self.connect(self.timer, SIGNAL("timeout()"), self.poll_batch)
+
+    def start(self):
+        self.show()
+        # Let the dialog come up before we read the notes.
+        QTimer.singleShot(0, self.start_batch)
+
+    def start_batch(self):
+        self.batch = BatchDownload(load_notes(self.nids), self.journal)
+        self.connect(self, SIGNAL("canceled()"), self.batch.cancel)
+        if self.wasCanceled():
+            self.batch.cancel()
+        self.batch.start()
+        self.timer.start(poll_interval)
+
+    def poll_batch(self):
+        """Add the files for the notes done since last time."""
+        while True:
+            try:
+                result = self.batch.results.get_nowait()
+            except Queue.Empty:
+                return
+            if result is None:
+                self.batch_done()
+                return
+            if isinstance(result, int):
+                self.planned = result
+                self.setLabelText(_(u"Downloading audio."))
+                self.setMaximum(result)
+                continue
+            self.add_files(*result)
+
+    def add_files(self, nid, retrieved_files_list):
+        self.done_count += 1
+        self.setValue(self.done_count)
+        self.done_nids.append(nid)
+        picked = pick_files(retrieved_files_list)
+        if picked:
+            try:
+                # Get the note again. It may have changed while we
+                # were downloading.
+                note = mw.col.getNote(nid)
+                for dest, dl_fname in picked.items():
+                    note[dest] += '[sound:' + dl_fname + ']'
+            except Exception:
+                # It may even be gone, or its type may have lost the
+                # field. Then we don't need the files.
+                for dl_fname in picked.values():
+                    remove_file(os.path.join(mw.col.media.dir(), dl_fname))
+            else:
+                self.new_names.extend(picked.values())
+                self.changed_notes.append(note)
+                self.notes_with_audio += 1
+        if len(self.done_nids) >= flush_every:
+            flush_notes(self.changed_notes, self.done_nids, self.new_names,
+                        self.journal)
+
+    def batch_done(self):
+        global running_batch
+        self.timer.stop()
+        running_batch = None
+        flush_notes(self.changed_notes, self.done_nids, self.new_names,
+                    self.journal)
+        self.journal.finish()
+        routing.site_stats.save(force=True)
+        self.close()
+        # Not on close. Closing the dialog only cancels the batch,
+        # and we still have to save what it did.
+        self.deleteLater()
+        if not self.planned:
+            tooltip(u'Nothing to download.')
+            return
+        mw.reset()
+        tooltip(_(u'Added audio to {0} of {1} notes.').format(
+            self.notes_with_audio, self.planned))
+
+
+def download_for_notes(nids, parent=None):
+    """
+    Start the download of audio for the notes with the ids in nids.
+
+    This returns at once. The progress dialog takes care of the rest.
+    """
+    global running_batch
+    if running_batch:
+        tooltip(u'A batch download is already running.')
+        return
+    # We save the collection as we go, so this can't be undone.
+    journal = BatchJournal(mw.col.media.dir())
+    running_batch = BatchProgress(nids, journal, parent)
+    running_batch.start()
+
+
+def download_for_selected(browser):
+    nids = browser.selectedNotes()
+    if not nids:
+        tooltip(u'No notes selected.')
+        return
+    if not askUser(_(u'Download audio for {0} notes?').format(len(nids)),
+                   parent=browser):
+        return
+    # When the batch is done, mw is reset, and so the browser.
+    download_for_notes(nids, browser)
+
+
+def file_used(name):
+    """Return whether a note has a sound tag for the file name."""
+    pattern = u'%[sound:{0}]%'.format(
+        name.replace('\\', '\\\\').replace('%', '\\%').replace(
+            '_', '\\_'))
+    return bool(mw.col.db.scalar(
+        "select 1 from notes where flds like ? escape '\\' limit 1",
+        pattern))
+
+
+def maybe_resume():
+    """
+    Clean up after a batch download that didn't finish.
+
+    Remove the files that are not in a saved note and offer to go on
+    with the rest of the notes. Only look at the journal of this
+    profile's media folder.
+    """
+    media_dir = mw.col.media.dir()
+    state = read_journal(journal_path(media_dir))
+    if state is None or not belongs_to(state, media_dir):
+        # No batch, or not ours after all. Leave it alone.
+        return
+    settle_pending(state, file_used)
+    collect_garbage(state, media_dir)
+    remove_file(journal_path(media_dir))
+    remaining = [nid for nid in state['nids'] if nid not in state['done']]
+    if remaining:
+        # Some notes may have been deleted since.
+        remaining = mw.col.db.list(
+            'select id from notes where id in ' + ids2str(remaining))
+    if not remaining:
+        return
+    if askUser(_(u'A batch audio download was interrupted. '
+                 u'Download audio for the remaining {0} notes?').format(
+                     len(remaining))):
+        download_for_notes(remaining, mw)
+
+
+def setup_browser_menu(browser):
+    action = QAction(_(u"Download audio"), browser)
+    action.setIcon(QIcon(os.path.join(icons_dir, 'download_note_audio.png')))
+    action.setToolTip(
+        _(u"Download audio for the empty audio fields of the selected notes."))
+    browser.connect(action, SIGNAL("triggered()"),
+                    lambda browser=browser: download_for_selected(browser))
+    browser.form.menuEdit.addSeparator()
+    browser.form.menuEdit.addAction(action)
+
+
+addHook("browser.setupMenus", setup_browser_menu)
+addHook("profileLoaded", maybe_resume)
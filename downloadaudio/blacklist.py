@@ -8,10 +8,23 @@
 
 '''
 Maintain a blacklist of undesired files.
+
+The hashes are kept in a set. On disk, there is the list in
+blacklist.json and a log file that new hashes are appended to. Now
+and then the log is merged into the list.
+
+Where we know them, we also keep the sizes of the blacklisted
+files. A file with a size that doesn't match any of them can only be
+on the list as one of the entries without a size. When there are
+none of those, we don't have to hash it. Old lists have no sizes.
+The size of such an entry is filled in the first time a file with
+its hash shows up.
 '''
 
 import hashlib
 import os
+import tempfile
+import threading
 
 # As in the main Anki code.
 try:
@@ -20,47 +33,198 @@ except ImportError:
     import json
 
 
-from aqt import mw
-
 blacklist_hashes = None
-bl_file_path = os.path.join(
-    mw.pm.addonFolder(), 'downloadaudio', 'blacklist.json')
+blacklist_sizes = {}
+"""The sizes of the blacklisted files we know, by hash."""
+size_index = set()
+"""The sizes in blacklist_sizes, for quick lookup."""
+unsized_hashes = set()
+"""The blacklisted hashes we don't know the size of."""
+addon_path = os.path.dirname(os.path.abspath(__file__))
+bl_file_path = os.path.join(addon_path, 'blacklist.json')
+bl_log_path = os.path.join(addon_path, 'blacklist.log')
+
+compact_after = 50
+"""Merge the log into the list when it has more lines than this."""
+
+chunk_size = 64 * 1024
+"""Read files in pieces this big when we hash them."""
+
+blacklist_lock = threading.Lock()
+
+
+class FileHash(object):
+    """
+    The hash of a file, together with its size.
+
+    Looks like a hashlib hash for our purposes.
+    """
+    def __init__(self, hex_digest, size):
+        self.hex_digest = hex_digest
+        self.size = size
+
+    def hexdigest(self):
+        return self.hex_digest
 
 
-def get_hash(file_name):
+def hash_file(file_name):
+    """Return the SHA-256 hash of a file, reading it in chunks."""
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as hash_file:
+        for chunk in iter(lambda: hash_file.read(chunk_size), ''):
+            file_hash.update(chunk)
+    return file_hash
+
+
+def get_hash(file_name, file_hash=None, need_hash=True):
     """
     Return hash of the file.
 
-    Return hash of the file file_name.  The more important function is
-    that this throws a ValueError when the hash of the file is already
-    in the list.
+    Return hash of the file file_name, as FileHash.  The more
+    important function is that this throws a ValueError when the hash
+    of the file is already in the list.
+
+    When the hash is already known, pass it in as file_hash. When
+    need_hash is False and the size of the file shows that it can't
+    be on the list, don't hash the file at all and return None.
     """
-    if not blacklist_hashes:
+    if blacklist_hashes is None:
         load_hashes()
-    retrieved_hash = hashlib.sha256(file(file_name, 'rb').read())
-    if retrieved_hash.hexdigest() in blacklist_hashes:
+    size = os.path.getsize(file_name)
+    if file_hash is None:
+        if not need_hash and not may_be_listed(size):
+            return None
+        file_hash = hash_file(file_name)
+    hex_hash = file_hash.hexdigest()
+    if hex_hash in blacklist_hashes:
+        if hex_hash in unsized_hashes:
+            # Now we know the size of this one.
+            add_black_hash(FileHash(hex_hash, size))
         raise ValueError('Retrieved file is in blacklist. ' +
                          '(No pronunciation found.)')
-    return retrieved_hash
+    return FileHash(hex_hash, size)
+
+
+def may_be_listed(size):
+    """
+    Return whether a file of this size may be on the list.
+
+    It may when one of the sized entries has this size, or when there
+    are entries without a size.
+    """
+    return size in size_index or bool(unsized_hashes)
 
 
 def add_black_hash(black_hash):
-    """Add a new hash to the list of blacklisted hashes."""
-    global blacklist_hashes
-    if not blacklist_hashes:
+    """
+    Add a new hash to the list of blacklisted hashes.
+
+    Use a FileHash to store the size as well.
+    """
+    if blacklist_hashes is None:
         load_hashes()
-    blacklist_hashes.append(black_hash.hexdigest())
-    save_hashes()
+    hex_hash = black_hash.hexdigest()
+    size = getattr(black_hash, 'size', None)
+    with blacklist_lock:
+        if hex_hash in blacklist_hashes \
+                and (size is None or hex_hash not in unsized_hashes):
+            return
+        add_entry(hex_hash, size)
+        with open(bl_log_path, 'a') as log_file:
+            if size is None:
+                log_file.write(hex_hash + '\n')
+            else:
+                log_file.write('{0} {1}\n'.format(hex_hash, size))
+
+
+def add_entry(hex_hash, size):
+    blacklist_hashes.add(hex_hash)
+    if size is not None:
+        blacklist_sizes[hex_hash] = size
+        size_index.add(size)
+        unsized_hashes.discard(hex_hash)
+    elif hex_hash not in blacklist_sizes:
+        unsized_hashes.add(hex_hash)
 
 
 def load_hashes():
-    """Load the blacklist from disk."""
+    """
+    Load the blacklist from disk.
+
+    Read the list and the log. When the log has grown long, merge
+    it into the list.
+
+    The entries in the list are either just the hash or a [hash,
+    size] pair. The lines in the log either just the hash or hash
+    and size.
+    """
     global blacklist_hashes
-    blacklist_hashes = json.load(open(bl_file_path, 'r'))
+    with blacklist_lock:
+        if blacklist_hashes is not None:
+            return
+        try:
+            with open(bl_file_path, 'r') as bl_file:
+                entries = json.load(bl_file)
+        except IOError:
+            entries = []
+        log_entries = []
+        try:
+            with open(bl_log_path, 'r') as log_file:
+                log_entries = [line.split() for line in log_file
+                               if line.strip()]
+        except IOError:
+            # No log yet.
+            pass
+        blacklist_hashes = set()
+        blacklist_sizes.clear()
+        size_index.clear()
+        unsized_hashes.clear()
+        for entry in entries + log_entries:
+            if isinstance(entry, basestring):
+                add_entry(entry, None)
+            elif len(entry) > 1:
+                add_entry(entry[0], int(entry[1]))
+            else:
+                add_entry(entry[0], None)
+        if len(log_entries) > compact_after:
+            save_hashes()
 
 
 def save_hashes():
-    """Save the blacklist back to disk."""
-    blacklist_file = open(bl_file_path, 'w')
-    json.dump(blacklist_hashes, blacklist_file, indent=1)
-    blacklist_file.close()
+    """
+    Save the blacklist back to disk.
+
+    Write the whole list in one go and remove the log. Call this with
+    the lock held.
+
+    When the list can't be written, e.g. because the disk is full,
+    leave list and log as they are and try again next time. We have
+    the hashes in memory anyway.
+    """
+    entries = []
+    for hex_hash in sorted(blacklist_hashes):
+        try:
+            entries.append([hex_hash, blacklist_sizes[hex_hash]])
+        except KeyError:
+            entries.append(hex_hash)
+    temp_file = None
+    try:
+        temp_file = tempfile.NamedTemporaryFile(
+            delete=False, dir=addon_path, suffix='.tmp')
+        with temp_file:
+            json.dump(entries, temp_file, indent=1)
+        if 'nt' == os.name and os.path.exists(bl_file_path):
+            # os.rename doesn't replace files on Windows.
+            os.remove(bl_file_path)
+        os.rename(temp_file.name, bl_file_path)
+    except (IOError, OSError):
+        if temp_file:
+            try:
+                os.remove(temp_file.name)
+            except OSError:
+                pass
+        return
+    try:
+        os.remove(bl_log_path)
+    except OSError:
+        pass
@@ -12,7 +12,8 @@ from aqt.qt import QHBoxLayout, QLabel, QLineEdit
 from aqt.utils import getText, tooltip
 from anki.lang import _
 
-from language import default_audio_language_code, al_code_code
+from language import default_audio_language_code, al_code_code, \
+    forget_deck_languages
 
 
 def setup_ui(self, Dialog):
@@ -38,6 +39,7 @@ def load_conf(self):
 
 def save_conf(self):
     self.conf[al_code_code] = self.form.audio_download_language.text()
+    forget_deck_languages()
 
 
 def ask_and_set_language_code():
@@ -66,6 +68,7 @@ of the language you are learning.<br>
             conf[al_code_code] = lang_code
             mw.col.decks.save(conf)
     mw.col.decks.flush()
+    forget_deck_languages()
 
 
 def maybe_ask_language():
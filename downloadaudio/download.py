@@ -34,7 +34,11 @@ manual.
    strings that can be modified before the requests are sent.
 """
 
+import multiprocessing
 import os
+import Queue
+import threading
+import time
 from PyQt4.QtGui import QAction, QIcon, QMenu
 from PyQt4.QtCore import SIGNAL
 
@@ -43,7 +47,12 @@ from aqt.utils import tooltip
 from anki.hooks import addHook
 
 from .blacklist import get_hash
-from .downloaders import downloaders
+from .downloaders import downloaders, DownloadJob
+from .downloaders.downloader import NotFoundError
+from .downloaders import misses, routing
+from .downloaders import throttle
+from .downloaders.throttle import HostDownError, RequestCancelled
+from .downloaders.workers import Task, WorkerPool
 from .get_fields import get_note_fields, get_side_fields
 from .language import get_language_code
 from .processors import processor
@@ -54,6 +63,56 @@ from .update_gui import update_data
 icons_dir = os.path.join(mw.pm.addonFolder(), 'downloadaudio', 'icons')
 """Place were we keep our megaphone icon.."""
 
+concurrent_downloads = True
+"""
+Ask the sites all at the same time.
+
+Set this to False to ask one site after the other, as we did
+before. That is slower, but easier to debug.
+"""
+
+max_download_threads = 8
+"""How many downloads we run at the same time, at most."""
+
+worker_pool = WorkerPool(max_download_threads)
+
+concurrent_processing = True
+"""
+Process (normalize) the files while the other downloads go on.
+
+Only used with audio processors that can run in more than one
+thread at a time.
+"""
+
+try:
+    max_processing_threads = multiprocessing.cpu_count()
+except NotImplementedError:
+    max_processing_threads = 2
+"""
+How many files we process at the same time, at most.
+
+The work is done by the sox program, so a thread is enough to keep
+one core busy.
+"""
+
+processing_pool = WorkerPool(max_processing_threads)
+
+first_hit_wins = False
+"""
+Stop asking the sites for a text when we have wanted_hits files.
+
+Then the sites are asked one after the other, in order, for each
+text. (The texts are still done at the same time.) This means fewer
+requests, but also fewer files to choose from. The batch download
+in the browser always works like this.
+"""
+
+wanted_hits = 1
+"""How many sites with good files we want, with first_hit_wins."""
+
+router = routing.make_router(downloaders)
+"""Decides which downloaders we ask for a language."""
+
 # A bit of set-up
 for downloader in downloaders:
     # We have two audio "processors". One that is actually processing,
@@ -62,63 +121,469 @@ for downloader in downloaders:
     downloader.use_temp_files = processor.useful
 
 
-def do_download(note, field_data, language, hide_text=False):
+def run_job(downloader, job):
     """
-    Download audio data.
+    Let the downloader do the job.
 
-    Go through the list of words and list of sites and download each
-    word from each site. Then call a function that asks the user what
-    to do.
+    Return the job, or None when something went wrong. Remember how
+    that went for the routing. When the site said it doesn't have the
+    word, that is not "something went wrong": return the job, so that
+    the miss is remembered.
+
+    When we return None, the files the downloader made are removed.
+    Otherwise, only the ones it made but didn't list.
     """
-    retrieved_files_list = []
-    show_skull_and_bones = False
-    for (source, dest, text, base, ruby, split) in field_data:
-        for downloader in downloaders:
-            # Use a public variable to set the language.
-            downloader.language = language
+    # Remember the language we were asked for, in case the downloader
+    # changes job.language after all.
+    language = job.language
+    start_time = time.time()
+    try:
+        # Make it easer inside the downloader. If anything
+        # goes wrong, don't catch or rais whatever you want.
+        downloader.download_files(job)
+    except (HostDownError, RequestCancelled):
+        # We didn't really ask. Don't count that against the site.
+        job.remove_stray_files(keep_listed=False)
+        return None
+    except NotFoundError:
+        router.record(downloader, language, False, time.time() - start_time)
+        job.remove_stray_files()
+        return job
+    except:
+        ## Uncomment this raise while testing a new
+        ## downloaders.  Also comment out all the others in the
+        ## downloaders list in downloaders.__init__
+        # raise
+        router.record(downloader, language, False, time.time() - start_time)
+        job.remove_stray_files(keep_listed=False)
+        return None
+    job.remove_stray_files()
+    router.record(
+        downloader, language, good_hit(job), time.time() - start_time)
+    return job
+
+
+def good_hit(job):
+    """Return whether the job got at least one file not on the blacklist."""
+    if not job:
+        return False
+    for word_path, file_name, extras in job.downloads_list:
+        try:
+            get_hash(word_path, job.file_hashes.get(word_path),
+                     need_hash=job.show_skull_and_bones)
+        except ValueError:
+            continue
+        return True
+    return False
+
+
+def retrieve_all(field_data, language, skip_misses=True, first_hit=False,
+                 journal=None, in_order=True, cancelled=None):
+    """
+    Run the downloaders and return their results.
+
+    Return an iterator over (field data item, downloader, job)
+    tuples, with the field data items in the outer and the downloaders
+    in the inner loop. The job is None when that download didn't
+    work. Each tuple is available as soon as that download and the
+    ones before it are done.
+
+    Only the downloaders the router picks for the language are
+    used. When concurrent_downloads is set, all these downloads run
+    at the same time. When skip_misses is set, downloaders that
+    recently had nothing for a text, or that hardly ever have
+    anything for the language, are not asked again. When first_hit
+    is set, the downloaders are asked one after the other for each
+    text, until wanted_hits of them had good files. The journal, when
+    given, is passed on to the jobs, as the part for their field and
+    site.
+
+    When in_order is False, the tuples come as soon as the download
+    is done, in any order. (With first_hit, that is per field data
+    item.) When the threading.Event cancelled is set, no new
+    downloads are started, the running ones stop waiting for and
+    retrying requests, and the rest of the tuples come at once, with
+    None as job.
+    """
+    route_list = router.route(language, prune=skip_misses)
+
+    def work_items(field_item):
+        source, dest, text, base, ruby, split = field_item
+        for downloader in route_list:
+            job = DownloadJob(text, base, ruby, split, language)
+            if skip_misses and misses.is_miss(downloader, job):
+                continue
+            if journal:
+                job.journal = journal.for_site(
+                    dest, routing.site_name(downloader))
+            yield field_item, downloader, job
+
+    def run(work_item):
+        field_item, downloader, job = work_item
+        if cancelled and cancelled.is_set():
+            return field_item, downloader, None
+        # Let the requests give up early, too.
+        throttle.watch(cancelled)
+        try:
+            return field_item, downloader, run_job(downloader, job)
+        finally:
+            throttle.watch(None)
+
+    def run_until_hit(field_item):
+        results = []
+        hits = 0
+        for work_item in work_items(field_item):
+            results.append(run(work_item))
+            if good_hit(results[-1][2]):
+                hits += 1
+                if hits >= wanted_hits:
+                    break
+        return results
+    if in_order:
+        pool_imap = worker_pool.imap
+    else:
+        pool_imap = worker_pool.imap_unordered
+    if first_hit:
+        if concurrent_downloads:
+            field_results = pool_imap(run_until_hit, field_data)
+        else:
+            field_results = (run_until_hit(fi) for fi in field_data)
+        return (result for results in field_results for result in results)
+    work_list = [
+        work_item for field_item in field_data
+        for work_item in work_items(field_item)]
+    if concurrent_downloads:
+        return pool_imap(run, work_list)
+    return (run(work_item) for work_item in work_list)
+
+
+def start_processing(word_path, base_name, done_queue=None, journal=None):
+    """
+    Start processing the downloaded file. Return the Task.
+
+    The Task's get() returns the name of the file in the media
+    folder. When we can, the file is processed in the processing
+    pool, otherwise right now. The Task is put into done_queue, when
+    given, once it is done. The journal, when given, gets the new
+    file before it is put into the media folder.
+    """
+    task = Task(processor.process_and_move, (word_path, base_name, journal),
+                done_queue)
+    if concurrent_processing and processor.thread_safe:
+        return processing_pool.submit_task(task)
+    task.run()
+    return task
+
+
+class Retrieval(object):
+    """
+    What we do with the downloaded files, for one download.
+
+    Drop blacklisted files and files we already have, start
+    processing the others, and remember which sites had something
+    for which text. Used by retrieve_files() and StreamingDownload.
+    The processing tasks are put into done_queue, when given, once
+    they are done.
+    """
+    def __init__(self, skip_misses=True, done_queue=None):
+        self.skip_misses = skip_misses
+        self.done_queue = done_queue
+        self.show_skull_and_bones = False
+        self.miss_list = []
+        self.hit_list = []
+        self.kept_files = {}
+        """The extras of the files we keep, by (dest, hash)."""
+
+    def add_job(self, field_item, downloader, job):
+        """
+        Look at the files of a finished job.
+
+        Return a list of (source, dest, job, word_path, file_name,
+        item_hash, extras, processing_task) tuples for the files we
+        keep. Pass them to finish_file() to get the retrieved files.
+        """
+        source, dest, text, base, ruby, split = field_item
+        if not job:
+            # Something went wrong. That is not the same as "nothing
+            # there", so don't remember anything.
+            return []
+        self.show_skull_and_bones = \
+            self.show_skull_and_bones or job.show_skull_and_bones
+        processing_list = []
+        # Only files that are not on the blacklist count as a hit.
+        job_hit = False
+        for word_path, file_name, extras in job.downloads_list:
             try:
-                # Make it easer inside the downloader. If anything
-                # goes wrong, don't catch or rais whatever you want.
-                downloader.download_files(text, base, ruby, split)
-            except:
-                ## Uncomment this raise while testing a new
-                ## downloaders.  Also comment out all the others in the
-                ## downloaders list in downloaders.__init__
-                # raise
+                # The downloaders hash the data when they write the
+                # files. We only need the hash of other files when
+                # the user may want to blacklist them.
+                item_hash = get_hash(
+                    word_path, job.file_hashes.get(word_path),
+                    need_hash=job.show_skull_and_bones)
+            except ValueError:
+                # Now the downloader downloads, doesn't remove
+                # files with bad hashes. So do it here.
+                # print 'bad hash'
+                os.remove(word_path)
                 continue
-            show_skull_and_bones = \
-                show_skull_and_bones or downloader.show_skull_and_bones
-            for word_path, file_name, extras in downloader.downloads_list:
-                try:
-                    item_hash = get_hash(word_path)
-                except ValueError:
-                    # Now the downloader downloads, doesn't remove
-                    # files with bad hashes. So do it here.
-                    # print 'bad hash'
+            job_hit = True
+            try:
+                content_key = (dest, job.file_hashes[word_path].hexdigest())
+            except KeyError:
+                content_key = None
+            if content_key in self.kept_files:
+                # We already have this very file for this field, from
+                # another site or another link on the same page. Just
+                # keep the extra information.
+                merge_extras(self.kept_files[content_key], extras)
+                os.remove(word_path)
+                continue
+            extras = dict(extras)
+            if content_key:
+                self.kept_files[content_key] = extras
+            processing_task = None
+            if processor.useful:
+                # if not processor.useful we write directly to the
+                # media dir.  Otherwise the downloader downloaded to
+                # a temp file. Start processing and moving it now,
+                # while we wait for the other downloads.
+                processing_task = start_processing(
+                    word_path, job.base_name, self.done_queue, job.journal)
+            processing_list.append((
+                source, dest, job, word_path, file_name, item_hash, extras,
+                processing_task))
+        if job_hit:
+            self.hit_list.append(misses.miss_key(downloader, job))
+        else:
+            self.miss_list.append(misses.miss_key(downloader, job))
+        return processing_list
+
+    def finish_file(self, processing_item):
+        """
+        Wait for the processing of a file to finish.
+
+        Return the (source, dest, display text, file name, hash,
+        extras, icon) tuple for the file, or None when processing
+        didn't work.
+        """
+        source, dest, job, word_path, file_name, item_hash, extras, \
+            processing_task = processing_item
+        if processing_task:
+            try:
+                file_name = processing_task.get()
+            except Exception:
+                # raise  # Use this to debug an audio processor.
+                if os.path.exists(word_path):
                     os.remove(word_path)
-                    continue
-                if processor.useful:
-                    # if not processor.useful we write directly to the
-                    # media dir.
-                    try:
-                        # As above. Audio processing/file moving. The
-                        # downloader downloads to a temp file, so move
-                        # here.
-                        file_name = processor.process_and_move(
-                            word_path, downloader.base_name)
-                    except Exception:
-                        # raise  # Use this to debug an audio processor.
+                return None
+            if job.journal:
+                job.journal.processed(word_path, file_name)
+        # else:
+        #    file_name = file_name
+        # We pass the file name around for this case.
+        return (source, dest, job.display_text,
+                file_name, item_hash, extras, job.site_icon)
+
+    def finish(self):
+        """
+        Store what we have learned about the sites.
+
+        The site statistics are only written every few seconds, see
+        routing.save_interval.
+        """
+        if misses.use_miss_cache:
+            misses.miss_cache.add_misses(self.miss_list)
+            if not self.skip_misses:
+                # We may have asked a site that had nothing before.
+                misses.miss_cache.remove_misses(self.hit_list)
+        routing.site_stats.save()
+
+
+def retrieve_files(field_data, language, skip_misses=True, first_hit=False,
+                   journal=None):
+    """
+    Download audio data and return the files we can use.
+
+    Go through the list of words and list of sites and download each
+    word from each site. Drop blacklisted files, process the others
+    and return a (retrieved_files_list, show_skull_and_bones) tuple.
+    The files are processed while the later downloads go on, but the
+    list keeps the order of the downloads. Files with the same content
+    for the same field are only kept once.
+
+    Sites that had nothing for a word are remembered, and not asked
+    again for a while when skip_misses is True. For first_hit, see
+    retrieve_all(). The journal, when given, gets every file written,
+    processed and moved to the media folder.
+    """
+    retrieval = Retrieval(skip_misses)
+    processing_list = []
+    for field_item, downloader, job in retrieve_all(
+            field_data, language, skip_misses, first_hit, journal):
+        processing_list += retrieval.add_job(field_item, downloader, job)
+    retrieved_files_list = []
+    for processing_item in processing_list:
+        retrieved_file = retrieval.finish_file(processing_item)
+        if retrieved_file:
+            retrieved_files_list.append(retrieved_file)
+    retrieval.finish()
+    return retrieved_files_list, retrieval.show_skull_and_bones
+
+
+class StreamingDownload(object):
+    """
+    Download audio in a background thread, one file after the other.
+
+    Like retrieve_files(), but every file is put into self.results as
+    soon as it is ready, as a (retrieved file, show_skull_and_bones)
+    tuple, followed by a None when we are done. The files come in the
+    order the downloads and their processing finish. The extras of a
+    file are a copy. Information from files with the same content
+    that come later is not added there.
+
+    After cancel(), no new downloads are started, and the running
+    ones don't wait for or retry requests any more. The files from
+    the downloads still running, and the ones nobody took from
+    self.results yet, are removed.
+    """
+    def __init__(self, field_data, language, skip_misses=True,
+                 first_hit=False):
+        self.field_data = field_data
+        self.language = language
+        self.skip_misses = skip_misses
+        self.first_hit = first_hit
+        self.media_dir = mw.col.media.dir()
+        self.results = Queue.Queue()
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """Stop the download and remove the files not yet taken."""
+        with self.lock:
+            self.cancelled.set()
+            while True:
+                try:
+                    result = self.results.get_nowait()
+                except Queue.Empty:
+                    break
+                if result:
+                    self.remove_file(result[0][3])
+            # Let whoever waits know that we are done, in any case.
+            self.results.put(None)
+
+    def remove_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.media_dir, file_name))
+        except OSError:
+            pass
+
+    def feed(self, events):
+        """Put the finished downloads into events, then a None."""
+        try:
+            for download_result in retrieve_all(
+                    self.field_data, self.language, self.skip_misses,
+                    self.first_hit, in_order=False,
+                    cancelled=self.cancelled):
+                events.put(download_result)
+        finally:
+            events.put(None)
+
+    def run(self):
+        # Finished downloads, as (field data item, downloader, job)
+        # tuples, and finished processing Tasks, in the order they
+        # finish.
+        events = Queue.Queue()
+        retrieval = Retrieval(self.skip_misses, done_queue=events)
+        feeder = threading.Thread(target=self.feed, args=(events, ))
+        feeder.daemon = True
+        feeder.start()
+        # The files being processed, by processing Task.
+        pending = {}
+        downloads_done = False
+        try:
+            while not downloads_done or pending:
+                event = events.get()
+                if event is None:
+                    downloads_done = True
+                elif isinstance(event, Task):
+                    self.report(retrieval, pending.pop(event))
+                else:
+                    self.add_job(retrieval, pending, *event)
+            retrieval.finish()
+        finally:
+            with self.lock:
+                if not self.cancelled.is_set():
+                    self.results.put(None)
+
+    def add_job(self, retrieval, pending, field_item, downloader, job):
+        if self.cancelled.is_set():
+            if job:
+                for word_path, file_name, extras in job.downloads_list:
+                    if os.path.exists(word_path):
                         os.remove(word_path)
-                        continue
-                # else:
-                #    file_name = file_name
-                # We pass the file name around for this case.
-                retrieved_files_list.append((
-                    source, dest, downloader.display_text,
-                    file_name, item_hash, extras, downloader.site_icon))
+            return
+        for processing_item in retrieval.add_job(
+                field_item, downloader, job):
+            processing_task = processing_item[-1]
+            if processing_task:
+                # We hear from it again through events when it is
+                # done. Even when it is done already, we only look
+                # there after we are through here.
+                pending[processing_task] = processing_item
+            else:
+                self.report(retrieval, processing_item)
+
+    def report(self, retrieval, processing_item):
+        """Put the processed file into self.results."""
+        retrieved_file = retrieval.finish_file(processing_item)
+        if not retrieved_file:
+            return
+        source, dest, text, file_name, item_hash, extras, icon = \
+            retrieved_file
+        # The dialog shows this copy. Don't change it behind its back.
+        retrieved_file = (
+            source, dest, text, file_name, item_hash, dict(extras), icon)
+        job = processing_item[2]
+        with self.lock:
+            if self.cancelled.is_set():
+                self.remove_file(file_name)
+            else:
+                self.results.put((retrieved_file, job.show_skull_and_bones))
+
+
+def merge_extras(extras, other_extras):
+    """
+    Add the information from other_extras to extras.
+
+    Where both have different values for the same key, keep both.
+    """
+    for key, value in other_extras.items():
+        old_value = extras.get(key)
+        if not old_value:
+            extras[key] = value
+        elif value and value not in old_value.split(u', '):
+            extras[key] = u'{0}, {1}'.format(old_value, value)
+
+
+def do_download(note, field_data, language, hide_text=False,
+                skip_misses=True):
+    """
+    Download audio data.
+
+    Start the download and show the dialog that asks the user what to
+    do with the files as they come in.
+    """
+    download = StreamingDownload(
+        field_data, language, skip_misses, first_hit_wins)
+    download.start()
     try:
-        store_or_blacklist(
-            note, retrieved_files_list, show_skull_and_bones, hide_text)
+        store_or_blacklist(note, download, hide_text)
     except ValueError as ve:
         tooltip(str(ve))
     except RuntimeError as rte:
@@ -174,7 +639,8 @@ def download_for_note(note=False, ask_user=False):
             else:
                 # Don't know how to handle this after all
                 raise
-    do_download(note, field_data, language_code)
+    # When the user asks explicitly, ask every site again.
+    do_download(note, field_data, language_code, skip_misses=not ask_user)
 
 
 def download_manual():
@@ -258,4 +724,9 @@ mw.edit_media_submenu.addAction(mw.manual_download_action)
 # download_off()
 
 
+def save_site_stats():
+    routing.site_stats.save(force=True)
+
+
 addHook("setupEditorButtons", editor_add_download_editing_button)
+addHook("unloadProfile", save_site_stats)
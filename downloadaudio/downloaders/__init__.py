@@ -8,15 +8,17 @@
 A list of audio downloaders.
 
 They are intended for use with the Anki2 audiodownload add-on, but can
-possibly be used alone. For each downloader in the list, setting its
-language variable and then calling download_files(text, base, ruby)
-downloads audio files to temp files and fills its downloads_list with
-the file names.
+possibly be used alone. For each downloader in the list, calling
+download_files(job) with a DownloadJob downloads audio files to temp
+files and fills the job's downloads_list with the file names. One
+downloader can work on several jobs at the same time.
 
 When PyQt4 is installed, this downolads the site icon (favicon) for
-each site first.
+each site, the first time that site has something. The icons are kept
+on disk, see site_icons.
 """
 
+from .downloader import DownloadJob
 from .beolingus import BeolingusDownloader
 from .duden import DudenDownloader
 from .google_tts import GooglettsDownloader
@@ -48,4 +50,4 @@ These sites are tried in the order they appear here. Lines starting
 with a '#' are not tried.
 """
 
-__all__ = ['downloaders']
+__all__ = ['downloaders', 'DownloadJob']
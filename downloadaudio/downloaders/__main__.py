@@ -1,22 +1,184 @@
 #!/usr/bin/env python
 # -*- mode: python ; coding: utf-8 -*-
 #
-# Copyright © 2012 Roland Sieker, <ospalh@gmail.com>
+# Copyright © 2012–2013 Roland Sieker, <ospalh@gmail.com>
 # License: GNU GPL, version 3 or later; http://www.gnu.org/copyleft/gpl.html
 
+"""
+Download audio without Anki.
+
+Read a list of words and download audio for them with all the
+downloaders, writing the files and a manifest.json to a folder.
+
+    python -m downloadaudio.downloaders -l de -o audio words.txt
+
+Each line of the input file is a text to download, optionally
+followed by a tab and a language code and another tab and a reading
+(kana for Japanese, pinyin for Chinese). Empty columns use the
+defaults. Lines starting with # are ignored.
+
+The manifest lists, for every line, the files we got with the site,
+the sha256 hash and the extra information the site gave. Lines with
+a reading are downloaded with and without it, split says which one
+the file is from.
+"""
 
 import argparse
+import codecs
+import os
+import re
+import shutil
 import sys
+import threading
+
+# As in the main Anki code.
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from . import downloaders, routing, throttle
+from .downloader import DownloadJob
+from .workers import WorkerPool
+from ..blacklist import get_hash
+
+
+def read_words(input_name, default_language):
+    """
+    Return a list of (text, language, reading) tuples from the file.
+    """
+    words = []
+    if '-' == input_name:
+        in_file = codecs.getreader('utf-8-sig')(sys.stdin)
+    else:
+        in_file = codecs.open(input_name, 'r', 'utf-8-sig')
+    with in_file:
+        for line in in_file:
+            line = line.rstrip(u'\r\n')
+            if not line.strip() or line.startswith(u'#'):
+                continue
+            columns = line.split(u'\t') + [u'', u'']
+            text = columns[0].strip()
+            language = columns[1].strip() or default_language
+            reading = columns[2].strip()
+            words.append((text, language, reading))
+    return words
+
+
+class OutputFolder(object):
+    """Move the downloaded files to a folder, with free names."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.used = set()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def move_here(self, temp_path, base_name):
+        """Move the file to the folder, return the new file name."""
+        end = os.path.splitext(temp_path)[1]
+        base = re.sub(u'[\\\\/:\\*?\'"<>\\|\\s]', u'_', base_name) or u'audio'
+        with self.lock:
+            name = base + end
+            number = 0
+            while name.lower() in self.used \
+                    or os.path.exists(os.path.join(self.directory, name)):
+                number += 1
+                name = u'{0}_{1}{2}'.format(base, number, end)
+            self.used.add(name.lower())
+        shutil.move(temp_path, os.path.join(self.directory, name))
+        return name
+
+
+def download_word(word, route_list, output, first_hit):
+    """
+    Download the word from the downloaders in route_list.
+
+    Return the manifest entry for the word. As in the add-on, a word
+    with a reading is downloaded twice: once split into text and
+    reading, for the sites that want both, and once as plain text.
+    With first_hit, we stop after the first site with audio for each
+    of the two.
+    """
+    text, language, reading = word
+    entry = dict(text=text, language=language, reading=reading,
+                 files=[], errors=[])
+    if reading:
+        splits = [True, False]
+    else:
+        splits = [False]
+    for split in splits:
+        found = False
+        for downloader in route_list:
+            job = DownloadJob(text, text, reading, split, language)
+            site = routing.site_name(downloader)
+            try:
+                downloader.download_files(job)
+            except Exception as e:
+                entry['errors'].append(
+                    dict(site=site, split=split, error=unicode(e)))
+                continue
+            for temp_path, dummy_name, extras in job.downloads_list:
+                try:
+                    file_hash = get_hash(
+                        temp_path, job.file_hashes.get(temp_path))
+                except ValueError:
+                    os.remove(temp_path)
+                    continue
+                found = True
+                entry['files'].append(dict(
+                    site=site, split=split,
+                    file=output.move_here(temp_path, job.base_name),
+                    display_text=job.display_text,
+                    sha256=file_hash.hexdigest(), extras=extras))
+            if first_hit and found:
+                break
+    return entry
+
 
-from . import downloaders
-from .japanesepod import JapanesepodDownloader
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m downloadaudio.downloaders',
+        description='Download audio for a list of words.')
+    parser.add_argument(
+        'input', help='word list or TSV file (text, language, reading), '
+        'or - for stdin')
+    parser.add_argument('-l', '--language', default='en',
+                        help='language for lines without one (default: en)')
+    parser.add_argument('-o', '--output', default='audio',
+                        help='folder for the files and manifest.json')
+    parser.add_argument('-j', '--threads', type=int, default=8,
+                        help='words to download at the same time')
+    parser.add_argument('--first-hit', action='store_true',
+                        help='stop after the first site with audio')
+    parser.add_argument('--host-report', action='store_true',
+                        help='show the rate limiter and breaker states')
+    args = parser.parse_args(argv)
+    for downloader in downloaders:
+        downloader.use_temp_files = True
+    router = routing.Router(downloaders, routing.site_stats)
+    output = OutputFolder(args.output)
+    words = read_words(args.input, args.language)
+    pool = WorkerPool(args.threads)
 
-def move_here(dl):
+    def run(word):
+        return download_word(
+            word, router.candidates(word[1]), output, args.first_hit)
+    manifest = []
+    for number, entry in enumerate(pool.imap(run, words), 1):
+        manifest.append(entry)
+        sys.stderr.write(u'{0}/{1} {2}: {3} files\n'.format(
+            number, len(words), entry['text'],
+            len(entry['files'])).encode('utf-8'))
+    with open(os.path.join(args.output, 'manifest.json'), 'w') as m_file:
+        json.dump(manifest, m_file, indent=1)
+    if args.host_report:
+        for state in throttle.report():
+            sys.stderr.write(
+                '{host}: {breaker}, {requests} requests, {errors} errors, '
+                '{skipped} skipped, {waited:.1f} s waited\n'.format(**state))
+    return 0
 
-    pass
 
-jpd = JapanesepodDownloader()
-jpd.language = 'ja'
-print u'Test: downloading 今度 こんど from Japanesepod'
-jpd.download_files('', u'今度', u'こんど')
-print jpd.downloads_list[0]
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,6 +15,7 @@ import urlparse
 import re
 
 from .downloader import AudioDownloader
+from .extract import Target
 
 
 class BeolingusDownloader(AudioDownloader):
@@ -32,36 +33,37 @@ class BeolingusDownloader(AudioDownloader):
         # match wasn't good enough.
         # self.text_code = 'text='
         self.text_re = u'text={0}(?:%20{{([a-zA-Z ]+)}})?$'
+        self.link_targets = dict(links=Target('a', {'href': True}))
         self.services_dict = {'de': 'de-en', 'en': 'en-de', 'es': 'es-de'}
         """
         Mapping of languages to "services".
 
         We can get pronunciations for the three keys in this dictionary.
         """
-        self.service = None
+        self.languages = self.services_dict.keys()
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get pronunciations of a word from BeoLingus
 
         Get pronunciations for words in one of three languages.
         """
-        self.downloads_list = []
-        if split:
+        if job.split:
             # Avoid double downloads
             return
-        self.set_names(word, base, ruby)
+        self.set_names(job)
         # EAFP. When we call this with a wrong language we fly right
         # out of this with a KeyError.
-        self.service = self.services_dict[self.language[:2].lower()]
+        service = self.services_dict[job.language[:2].lower()]
+        word = job.word
         if not word:
             return
-        word_soup = self.get_soup_from_url(self.build_word_url(word))
-        a_list = word_soup.findAll('a')
+        a_list = self.extract_from_url(
+            self.build_word_url(word, service), self.link_targets)['links']
         href_list = [a['href'] for a in a_list]
         href_list = self.uniqify_list(href_list)
         href_list = [href for href in href_list
-                     if (self.speak_code + self.language) in href]
+                     if (self.speak_code + job.language) in href]
         # Unroll this step, so the adding of the extra element becomes
         # more readable.
         speak_list = []
@@ -81,12 +83,13 @@ class BeolingusDownloader(AudioDownloader):
                 # As said above, the bit in the curly braces may not be there.
                 extras['Part of speech'] = part_of_speech
             try:
-                word_path, word_fname = self.get_word_file(url_to_get, word)
+                word_path, word_fname = self.get_word_file(
+                    job, url_to_get, word)
             except ValueError:
                 continue
-            self.downloads_list.append((word_path, word_fname, extras))
+            job.downloads_list.append((word_path, word_fname, extras))
 
-    def get_word_file(self, popup_url, word):
+    def get_word_file(self, job, popup_url, word):
         """
         Get an audio file from Beolingus
 
@@ -97,9 +100,9 @@ class BeolingusDownloader(AudioDownloader):
         word = urllib.quote(word.encode('utf-8'))
         popup_url = re.sub(';text=.*$', ';text=' + word, popup_url)
         popup_url = urlparse.urljoin(self.site_url, popup_url)
-        popup_soup = self.get_soup_from_url(popup_url)
         # The audio link should be the only link.
-        a_list = popup_soup.findAll('a')
+        a_list = self.extract_from_url(
+            popup_url, self.link_targets)['links']
         href_list = [a['href'] for a in a_list]
         href_list = [href for href in href_list if "speak" in href]
         href_list = [href for href in href_list
@@ -109,11 +112,9 @@ class BeolingusDownloader(AudioDownloader):
         word_url = href_list[0]
         word_url = urlparse.urljoin(self.site_url, word_url)
         word_data = self.get_data_from_url(word_url)
-        word_path, word_fname = self.get_file_name()
-        with open(word_path, 'wb') as word_file:
-            word_file.write(word_data)
+        word_path, word_fname = self.save_data(job, word_data)
         return word_path, word_fname
 
-    def build_word_url(self, source):
-        qdict = dict(service=self.service, query=source.encode('utf-8'))
+    def build_word_url(self, source, service):
+        qdict = dict(service=service, query=source.encode('utf-8'))
         return self.url + urllib.urlencode(qdict)
@@ -10,19 +10,127 @@
 Class to download a files from a speaking dictionary or TTS service.
 '''
 
+import hashlib
+import os
 import tempfile
+import threading
 import urllib
-import urllib2
 import urlparse
 from BeautifulSoup import BeautifulSoup as soup
 
-# Make this work without PyQt
-with_pyqt = True
-try:
-    from PyQt4.QtGui import QImage
-    from PyQt4.QtCore import QSize, Qt
-except ImportError:
-    with_pyqt = False
+from . import extract, http_cache, http_pool, site_icons
+from .extract import Target
+
+media_name_lock = threading.Lock()
+"""
+Lock used while we look for a free name in the media directory.
+
+Downloaders may run at the same time. Without this, two of them could
+pick the same free name for the same word.
+"""
+
+not_found_codes = (404, 410)
+"""HTTP status codes that mean the site doesn't have the word."""
+
+
+class NotFoundError(ValueError):
+    """
+    Raised when the site doesn't have what we asked for.
+
+    For the miss cache this is the same as a download that found
+    nothing, not a download that went wrong.
+    """
+    pass
+
+
+class DownloadJob(object):
+    """
+    One download request and its results.
+
+    The downloaders themselves are shared. Everything that belongs to
+    one request is kept here, so that one downloader can work on more
+    than one request at the same time.
+    """
+    def __init__(self, word, base, ruby, split, language):
+        self.word = word
+        """The text to download, for most languages."""
+        self.base = base
+        """The base (kanji) part of the text."""
+        self.ruby = ruby
+        """The ruby (kana, reading) part of the text."""
+        self.split = split
+        """Whether this request uses base and ruby rather than word."""
+        self.language = language
+        """The language used."""
+        self.downloads_list = []
+        """
+        Store for downloaded data.
+
+        This is where the downloader stores its results. A list of
+        (file_path, file_name, extras) 3-tuples. See the docstring of
+        AudioDownloader.download_job().
+        """
+        self.display_text = u''
+        """Text shown as source after download"""
+        self.base_name = u''
+        """Base of the final file name."""
+        self.show_skull_and_bones = False
+        """
+        Should we show the skull and crossbones in the review dialog?
+
+        See the AudioDownloader.show_skull_and_bones docstring.
+        """
+        self.site_icon = None
+        """
+        The icon to show for the results of this request.
+
+        When the downloader doesn't set this, its site_icon is used.
+        """
+        self.use_temp_files = None
+        """
+        Write to temp files even when the downloader normally doesn't.
+
+        None means: do what the downloader does.
+        """
+        self.journal = None
+        """
+        Where we note the files before we write them, or None.
+
+        Used by batch downloads, see journal.NoteJournal.
+        """
+        self.file_hashes = {}
+        """
+        SHA-256 hashes of the files we wrote, by file path.
+
+        Filled by AudioDownloader.save_data(), so that the files don't
+        have to be read again for the blacklist check.
+        """
+        self.files_made = []
+        """
+        The paths of all the files made for this job.
+
+        Also the ones that never made it into downloads_list, so that
+        they can be removed when the job goes wrong.
+        """
+
+    def remove_stray_files(self, keep_listed=True):
+        """
+        Remove the files we made that are not in downloads_list.
+
+        With keep_listed False, remove all the files we made. That
+        includes the empty files that keep a media name free.
+        """
+        keep = set()
+        if keep_listed:
+            keep = set(path for path, name, extras in self.downloads_list)
+        for path in self.files_made:
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.files_made = [path for path in self.files_made if path in keep]
 
 
 class AudioDownloader(object):
@@ -32,34 +140,45 @@ class AudioDownloader(object):
     This is the base class for the downloaders of spoken
     pronunciations.
 
-    The derived classes must implement self.download_files()
+    The derived classes must implement self.download_job()
     """
     def __init__(self):
         self.language = ''
         """
         The language used.
 
-        This is used as a public variable and set for every download.
+        Only used by the old interface, where this is set before
+        calling download_files() with the texts. New code should pass
+        a DownloadJob instead.
         """
         self.downloads_list = []
         """
         Store for downloaded data.
 
-        This is where self.download_files should store the
-        results. See that method's docstring.
+        Only used by the old interface. A copy of the downloads_list
+        of the last request.
         """
         self.display_text = u''
-        """Text shown as source after download"""
+        """Text shown as source after download. Old interface."""
         self.base_name = u''
-        """Base of the final file name."""
+        """Base of the final file name. Old interface."""
         self.file_extension = u'.wav'
+        self.languages = None
+        """
+        The languages this downloader can do something with.
+
+        A list of two-letter language codes, or None when we should
+        try every language. Used to decide which downloaders to ask
+        at all, see routing.
+        """
         # A typical downloaders will need something like this.
         self.url = ''
         """The base URL used for (the first step of) the download."""
         self.icon_url = ''
         """URL to get the address of the site icon from."""
-        self.max_icon_size = 20
-        """Max size we scale the site icon down to, if larger."""
+        self.icon_targets = dict(
+            icon=Target('link', {'rel': 'icon', 'href': True}, limit=1))
+        """The tag with the site icon on the icon_url page."""
         self.user_agent = 'Mozilla/5.0'
         """
         User agent string that can be used for requests.
@@ -95,146 +214,182 @@ class AudioDownloader(object):
         whole blacklist mechanism is that JapanesePod can't say
         no. Only when there is a chance that we have a file we want to
         blacklist (that is, when we actually downloaded something from
-        Japanesepod) should we set this to True.
+        Japanesepod) should we set this to True. The downloaders set
+        this on the job, this copy is for the old interface.
         """
 
         self.site_icon = None
         """The sites's favicon."""
 
-    def download_files(self, word, base, ruby, split):
+    def download_files(self, job, base=None, ruby=None, split=None):
+        """
+        Download the files for a job and return its downloads_list.
+
+        Pass in a DownloadJob. The results are stored in the job and
+        nowhere else, so this can be called for several jobs at the
+        same time.
+
+        The old interface, download_files(text, base, ruby, split)
+        with the language set in self.language, still works. Then the
+        results are also copied to self.downloads_list, self.base_name
+        &c.
+        """
+        if isinstance(job, DownloadJob):
+            self.download_job(job)
+            if not job.site_icon:
+                job.site_icon = self.site_icon
+            return job.downloads_list
+        job = DownloadJob(job, base, ruby, split, self.language)
+        try:
+            self.download_files(job)
+        finally:
+            self.downloads_list = job.downloads_list
+            self.display_text = job.display_text
+            self.base_name = job.base_name
+            self.show_skull_and_bones = job.show_skull_and_bones
+            if job.site_icon:
+                self.site_icon = job.site_icon
+        return self.downloads_list
+
+    def download_job(self, job):
         """
         Downloader functon.
 
         This is the main worker function. It has to be reimplemented
         by the derived classes.
 
-        The input is the text to use for the download, either the
-        whole text (for most languages) or split into kanji and kana,
-        base and ruby.
-
-        This function should clear the self.downloads_list, call
-        self.set_names(), and try to get pronunciation files from its
-        source, put those into tempfiles, and add a (temp_file_path,
-        base_name, extras) 3-tuple to self_downloads_lists for each of
-        the zero or more downloaded files. (Zero when the
-        self.language is wrong, there is no file, ...) extras should
-        be a dict with strings of interesting informations, like
-        meaning numbers or name of speaker, or an empty dict.
+        The input is the job, with the text to use for the download,
+        either the whole text (for most languages) or split into
+        kanji and kana, base and ruby, and the language.
+
+        This function should call self.set_names(job), and try to get
+        pronunciation files from its source, put those into
+        tempfiles (use self.save_data()), and add a (temp_file_path,
+        base_name, extras) 3-tuple to job.downloads_list for each of
+        the zero or more
+        downloaded files. (Zero when the job.language is wrong, there
+        is no file, ...) extras should be a dict with strings of
+        interesting informations, like meaning numbers or name of
+        speaker, or an empty dict.
+
+        Don't store anything that belongs to the request in self.
         """
         raise NotImplementedError("Use a class derived from this.")
 
-    def set_names(self, text, base, ruby):
+    def set_names(self, job):
         """
         Set the display text and file base name variables.
 
-        Set self.display_text and self.base_name with the text used
+        Set job.display_text and job.base_name with the text used
         for download, formated in a form useful for display and for a
         file name, respectively.
         This version uses just the text. It
         should be reimplemented for Japanese (Chinese, ...)
         downloaders that use the base and ruby.
         """
-        self.base_name = text
-        self.display_text = text
+        job.base_name = job.word
+        job.display_text = job.word
 
     def maybe_get_icon(self):
         """
-        Get icon for the site as a QImage if we haven't already.
+        Get icon for the site as a QImage.
+
+        The icons are kept in memory and on disk by site_icons, so the
+        site is only asked the first time and then again after a long
+        time. This function can be called repeatedly. Ask site_icons
+        every time, so that we get the new icon after it was loaded
+        again, or one that didn't load the first time.
+        """
+        self.site_icon = self.get_site_icon()
+
+    def get_site_icon(self, language=None):
+        """
+        Return the site icon for the language as QImage, or None.
+
+        Only downloaders that show different icons for different
+        languages have to pass in the language.
+        """
+        return site_icons.get_icon(
+            self.__class__.__name__, language,
+            lambda: self.get_icon_data(language))
+
+    def get_icon_data(self, language=None):
+        """
+        Load the site icon from the site. Return the data or None.
 
         Get the site icon, either the 'rel="icon"' or the favicon, for
-        the web page at url or passed in as page_html and store it as
-        a QImage. This function can be called repeatedly and loads the
-        icon only once.
-        """
-        if self.site_icon:
-            return
-        if not with_pyqt:
-            self.site_icon = None
-            return
-        page_request = urllib2.Request(self.icon_url)
-        if self.user_agent:
-            page_request.add_header('User-agent', self.user_agent)
-        page_response = urllib2.urlopen(page_request)
+        the web page at self.icon_url. Reimplement this for sites
+        where the icon is somewhere else.
+        """
+        page_response = self.get_response(self.icon_url)
         if 200 != page_response.code:
-            self.get_favicon()
-            return
-        page_soup = soup(page_response)
+            return self.get_favicon_data()
         try:
-            icon_url = page_soup.find(
-                name='link', attrs={'rel': 'icon'})['href']
-        except (TypeError, KeyError):
-            self.get_favicon()
-            return
+            icon_url = extract.extract(
+                page_response.read(), self.icon_targets)['icon'][0]['href']
+        except IndexError:
+            return self.get_favicon_data()
         # The url may be absolute or relative.
         if not urlparse.urlsplit(icon_url).netloc:
             icon_url = urlparse.urljoin(
                 self.url, urllib.quote(icon_url.encode('utf-8')))
-        icon_request = urllib2.Request(icon_url)
-        if self.user_agent:
-            icon_request.add_header('User-agent', self.user_agent)
-        icon_response = urllib2.urlopen(icon_request)
+        icon_response = self.get_response(icon_url)
         if 200 != icon_response.code:
-            self.site_icon = None
-            return
-        self.site_icon = QImage.fromData(icon_response.read())
-        max_size = QSize(self.max_icon_size, self.max_icon_size)
-        icon_size = self.site_icon.size()
-        if icon_size.width() > max_size.width() \
-                or icon_size.height() > max_size.height():
-            self.site_icon = self.site_icon.scaled(
-                max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            return None
+        return icon_response.read()
 
-    def get_favicon(self):
+    def get_favicon_data(self):
         """
-        Get favicon for the site.
+        Load the favicon for the site. Return the data or None.
 
         This is called when the icon_url can't be loaded or when that
         page doesn't contain a link tag with rel set to icon (the new
         way of doing site icons.)
         """
-        if self.site_icon:
-            return
-        if not with_pyqt:
-            self.site_icon = None
-            return
         ico_url = urlparse.urljoin(self.icon_url, "/favicon.ico")
-        ico_request = urllib2.Request(ico_url)
-        if self.user_agent:
-            ico_request.add_header('User-agent', self.user_agent)
-        ico_response = urllib2.urlopen(ico_request)
+        ico_response = self.get_response(ico_url)
         if 200 != ico_response.code:
-            self.site_icon = None
-            return
-        self.site_icon = QImage.fromData(ico_response.read())
-        max_size = QSize(self.max_icon_size, self.max_icon_size)
-        ico_size = self.site_icon.size()
-        if ico_size.width() > max_size.width() \
-                or ico_size.height() > max_size.height():
-            self.site_icon = self.site_icon.scaled(
-                max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            return None
+        return ico_response.read()
 
-    def get_data_from_url(self, url_in):
+    def get_response(self, url_in):
         """
-        Return raw data loaded from an URL.
+        Return the response for an URL.
 
-        Helper function. Put in an URL and it sets the agent, sends
-        the requests, checks that we got error code 200 and returns
-        the raw data only when everything is OK.
+        Helper function. Put in an URL and it sets the agent and
+        sends the request, using one of the connections kept open by
+        the http_pool. Responses are kept for a while in the
+        http_cache, and taken from there when possible.
         """
         try:
             # There have been reports that the request was send in a
             # 32-bit encoding (UTF-32?). Avoid that. (The whole things
             # is a bit curious, but there shouldn't really be any harm
             # in this.)
-            request = urllib2.Request(url_in.encode('ascii'))
-        except UnicodeDecodeError:
-            request = urllib2.Request(url_in)
-        try:
-            # dto. But i guess this is even less necessary.
-            request.add_header('User-agent', self.user_agent.encode('ascii'))
-        except UnicodeDecodeError:
-            request.add_header('User-agent', self.user_agent)
-        response = urllib2.urlopen(request)
+            url_in = url_in.encode('ascii')
+        except UnicodeError:
+            pass
+        headers = {}
+        if self.user_agent:
+            try:
+                # dto. But i guess this is even less necessary.
+                headers['User-agent'] = self.user_agent.encode('ascii')
+            except UnicodeError:
+                headers['User-agent'] = self.user_agent
+        return http_cache.get(url_in, headers, http_pool.get)
+
+    def get_data_from_url(self, url_in):
+        """
+        Return raw data loaded from an URL.
+
+        Helper function. Put in an URL and it sets the agent, sends
+        the requests, checks that we got error code 200 and returns
+        the raw data only when everything is OK. When the site says
+        there is no such page, raise a NotFoundError.
+        """
+        response = self.get_response(url_in)
+        if response.code in not_found_codes:
+            raise NotFoundError(str(response.code) + ': ' + response.msg)
         if 200 != response.code:
             raise ValueError(str(response.code) + ': ' + response.msg)
         return response.read()
@@ -247,18 +402,46 @@ class AudioDownloader(object):
         """
         return soup(self.get_data_from_url(url_in))
 
-    def get_file_name(self):
+    def extract_from_url(self, url_in, targets):
+        """
+        Return the tags we want from the page at an URL.
+
+        targets is a dict of name: extract.Target. Return a dict of
+        name: list of extract.Elements. This is much faster than
+        building a BeautifulSoup for the page, and should be used when
+        only the attributes of some tags are needed.
+        """
+        return extract.extract(self.get_data_from_url(url_in), targets)
+
+    def get_file_name(self, job):
         """
         Get a free file name.
 
         Determine where we should write the data and build a free name
         based on that. This looks at self.use_temp_files and
-        self.download_diretory. Read their docstrings.
+        self.download_diretory. Read their docstrings. The name is
+        based on job.base_name. When job.use_temp_files is set, that
+        is used instead of self.use_temp_files.
+
+        When the job has a journal, temp files go to the journal's
+        temp folder, and a file in the media folder is noted in the
+        journal before it is created.
         """
-        if self.use_temp_files:
+        use_temp_files = job.use_temp_files
+        if use_temp_files is None:
+            use_temp_files = self.use_temp_files
+        if use_temp_files:
+            temp_dir = None
+            if job.journal:
+                temp_dir = job.journal.temp_dir
             tfile = tempfile.NamedTemporaryFile(
-                delete=False, suffix=self.file_extension)
+                delete=False, suffix=self.file_extension, dir=temp_dir)
             tfile.close()
+            if job.journal:
+                # The whole temp folder goes after a crash. Note the
+                # file anyway, so that we know which site wrote it.
+                job.journal.fetched(tfile.name)
+            job.files_made.append(tfile.name)
             # Hack, free_media_name returns full path and file name,
             # so return two files here as well. But there is no real
             # need to split off the file name from the direcotry bit.
@@ -269,9 +452,33 @@ class AudioDownloader(object):
             # best done with Anki functions. So, when
             # self.use_temp_files is False, we need anki, bits of
             # which are imported by ..exists.
-            from ..exists import free_media_name
-            return free_media_name(
-                self.base_name, self.file_extension)
+            from ..exists import free_media_name, media_file_created
+            with media_name_lock:
+                media_path, media_name = free_media_name(
+                    job.base_name, self.file_extension)
+                if job.journal:
+                    job.journal.fetched(media_path)
+                # Create the file right away, so that it isn't free
+                # any more for the next downloader.
+                open(media_path, 'wb').close()
+                media_file_created(media_path)
+                job.files_made.append(media_path)
+            return media_path, media_name
+
+    def save_data(self, job, data):
+        """
+        Write data to a new file and return its path and name.
+
+        Get a free file name with self.get_file_name() and write the
+        data there. Hash the data on the way and store the hash in
+        job.file_hashes. When the job has a journal, the file is
+        noted there before it is created, see get_file_name().
+        """
+        file_path, file_name = self.get_file_name(job)
+        with open(file_path, 'wb') as data_file:
+            data_file.write(data)
+        job.file_hashes[file_path] = hashlib.sha256(data)
+        return file_path, file_name
 
     def uniqify_list(self, seq):
         """Return a copy of the list with every element appearing only once."""
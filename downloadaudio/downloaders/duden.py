@@ -15,6 +15,7 @@ import unicodedata
 import urlparse
 
 from .downloader import AudioDownloader
+from .extract import Target
 
 transliterations = [(u'Ä', 'Ae'), (u'Ö', 'Oe'), (u'Ü', 'Ue'), (u'ä', 'ae'),
                     (u'ö', 'oe'), (u'ü', 'ue'), (u'ß', 'sz')]
@@ -26,28 +27,31 @@ class DudenDownloader(AudioDownloader):
     """Download audio from Duden"""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ['de']
         self.file_extension = u'.mp3'
         self.icon_url = 'http://www.duden.de/'
         self.url = 'http://www.duden.de/rechtschreibung/'
+        self.word_targets = dict(links=Target(
+            'a', {'target': '_blank', 'title': True, 'href': True}))
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get pronunciations of a word from the right duden.
         """
-        self.downloads_list = []
-        if split:
+        if job.split:
             # Avoid double downloads.
             return
-        self.set_names(word, base, ruby)
-        if not self.language.lower().startswith('de'):
+        self.set_names(job)
+        if not job.language.lower().startswith('de'):
             return
+        word = job.word
         if not word:
             return
         # TODO: below.
         m_word = self.munge_word(word)
         self.maybe_get_icon()
-        word_soup = self.get_soup_from_url(self.url + m_word)
-        blank_links = word_soup.findAll(name='a', target="_blank")
+        blank_links = self.extract_from_url(
+            self.url + m_word, self.word_targets)['links']
         for link in blank_links:
             # I expect no more than one result. So we don't catch
             # anything here. When something goes wrong with the first
@@ -61,10 +65,8 @@ class DudenDownloader(AudioDownloader):
                     # 'NoneType' object has no attribute 'group' ...
                     pass
                 word_data = self.get_data_from_url(link['href'])
-                word_path, word_fname = self.get_file_name()
-                with open(word_path, 'wb') as word_file:
-                    word_file.write(word_data)
-                self.downloads_list.append(
+                word_path, word_fname = self.save_data(job, word_data)
+                job.downloads_list.append(
                     (word_path, word_fname, extras))
 
     def munge_word(self, word):
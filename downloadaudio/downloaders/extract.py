@@ -0,0 +1,159 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Get the few tags we need from a web page, fast.
+
+Most downloaders only look at the attributes of a few kinds of tags,
+like the href of all the links. Building a whole BeautifulSoup tree
+for that takes a lot of time for big pages. Here we run through the
+page once with the HTMLParser from the standard library, keep the
+attributes of the tags we want and drop everything else. When we
+have as many tags as we want, we stop.
+'''
+
+from HTMLParser import HTMLParser, HTMLParseError
+
+from BeautifulSoup import BeautifulSoup as soup
+
+
+class Target(object):
+    """
+    A kind of tag we want from a page.
+
+    tag is the tag name, or None for any tag. attrs is a dict of
+    attribute values the tag must have. The value True means the
+    attribute must be there, with any value. For class, the value
+    must be one of the classes of the tag. limit is how many of these
+    tags we want at most, or None for all.
+    """
+    def __init__(self, tag=None, attrs=None, limit=None):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.limit = limit
+
+    def matches(self, tag, attrs):
+        if self.tag and tag != self.tag:
+            return False
+        for name, wanted in self.attrs.items():
+            try:
+                value = attrs[name]
+            except KeyError:
+                return False
+            if wanted is True:
+                continue
+            if 'class' == name:
+                if wanted not in value.split():
+                    return False
+            elif value != wanted:
+                return False
+        return True
+
+
+class Element(dict):
+    """
+    The attributes of one tag we found, and its name.
+
+    Use it like a BeautifulSoup tag: element['href'] raises a
+    KeyError when there is no href.
+    """
+    def __init__(self, name, attrs):
+        dict.__init__(self, attrs)
+        self.name = name
+
+
+class StopParsing(Exception):
+    pass
+
+
+class TargetParser(HTMLParser):
+    """Collect the Elements for a dict of named Targets."""
+    def __init__(self, targets):
+        HTMLParser.__init__(self)
+        self.targets = targets
+        self.found = dict((name, []) for name in targets)
+        self.open_targets = dict(targets)
+        """The targets that don't have their limit yet."""
+
+    def handle_starttag(self, tag, attrs):
+        attr_dict = None
+        for name, target in self.open_targets.items():
+            if attr_dict is None:
+                attr_dict = dict(
+                    (key, value or u'') for key, value in attrs)
+            if not target.matches(tag, attr_dict):
+                continue
+            self.found[name].append(Element(tag, attr_dict))
+            if target.limit and len(self.found[name]) >= target.limit:
+                del self.open_targets[name]
+                if not self.open_targets:
+                    raise StopParsing()
+
+    handle_startendtag = handle_starttag
+
+
+def extract(data, targets):
+    """
+    Return the tags for the targets from the page data.
+
+    targets is a dict of name: Target. Return a dict of name: list of
+    Elements, in the order they appear on the page.
+    """
+    if isinstance(data, str):
+        data = decode(data)
+    parser = TargetParser(targets)
+    try:
+        parser.feed(data)
+        parser.close()
+    except StopParsing:
+        pass
+    except HTMLParseError:
+        # Some pages are too broken for HTMLParser. BeautifulSoup
+        # copes with nearly everything.
+        return extract_with_soup(data, targets)
+    return parser.found
+
+
+def extract_with_soup(data, targets):
+    """Do the same as extract(), the slow way."""
+    page_soup = soup(data)
+    found = {}
+    for name, target in targets.items():
+        found[name] = []
+        for tag in page_soup.findAll(target.tag or True):
+            attr_dict = dict(tag.attrs)
+            if target.matches(tag.name, attr_dict):
+                found[name].append(Element(tag.name, attr_dict))
+                if target.limit and len(found[name]) >= target.limit:
+                    break
+    return found
+
+
+def decode(data):
+    """
+    Return the page data as unicode.
+
+    Look for a charset in the first bit of the page, use UTF-8 when
+    there is none.
+    """
+    head = data[:2048].lower()
+    encoding = 'utf-8'
+    start = head.find('charset=')
+    if start >= 0:
+        start += len('charset=')
+        while start < len(head) and head[start] in ' "\'':
+            # As in <meta charset="utf-8">
+            start += 1
+        end = start
+        while end < len(head) and head[end] not in ' ;"\'/>':
+            end += 1
+        encoding = head[start:end].strip() or encoding
+    try:
+        return data.decode(encoding, 'replace')
+    except LookupError:
+        return data.decode('utf-8', 'replace')
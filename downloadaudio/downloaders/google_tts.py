@@ -32,29 +32,30 @@ class GooglettsDownloader(AudioDownloader):
         self.icon_url = 'http://translate.google.com/'
         self.url = 'http://translate.google.com/translate_tts?'
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get text from GoogleTTS.
         """
-        self.maybe_get_icon()
-        self.downloads_list = []
-        if split:
+        if job.split:
             return
-        if self.language.lower().startswith('zh'):
+        word = job.word
+        if job.language.lower().startswith('zh'):
             if not get_chinese:
                 return
-            word = base
-        self.set_names(word, base, ruby)
+            word = job.base
+        # Not self.set_names(job). For Chinese we use the base.
+        job.base_name = word
+        job.display_text = word
         if not word:
             raise ValueError('Nothing to download')
-        word_data = self.get_data_from_url(self.build_url(word))
-        word_path, word_file_name = self.get_file_name()
-        with open(word_path, 'wb') as word_file:
-            word_file.write(word_data)
+        word_data = self.get_data_from_url(self.build_url(word, job.language))
+        # Only get the icon when we have something to show it with.
+        self.maybe_get_icon()
+        word_path, word_file_name = self.save_data(job, word_data)
         # We have a file, but not much to say about it.
-        self.downloads_list.append(
+        job.downloads_list.append(
             (word_path, word_file_name, dict(Source='GoogleTTS')))
 
-    def build_url(self, source):
-        qdict = dict(tl=self.language, q=source.encode('utf-8'))
+    def build_url(self, source, language):
+        qdict = dict(tl=language, q=source.encode('utf-8'))
         return self.url + urllib.urlencode(qdict)
@@ -0,0 +1,262 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Keep the pages and audio files we load on disk for a while.
+
+When we download audio for the same word again, or for another word
+that leads to the same page, we don't have to ask the site again.
+'''
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import urlparse
+
+# As in the main Anki code.
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from .http_pool import Response
+
+
+use_cache = True
+"""Set this to False to always ask the sites."""
+
+cache_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
+"""Where we keep the files. The cache folder in the add-on folder."""
+
+max_cache_size = 100 * 1024 * 1024
+"""
+Size of the cache, in bytes.
+
+When the files in the cache get bigger than this, the ones used least
+recently are removed.
+"""
+
+default_ttl = 7 * 24 * 60 * 60
+"""Seconds we use a cached response without asking the site again."""
+
+site_ttls = {
+    # Robot voice. The same text should always give the same audio.
+    'translate.google.com': 60 * 24 * 60 * 60,
+    # Dictionaries. Not updated that often.
+    'www.merriam-webster.com': 30 * 24 * 60 * 60,
+    'www.duden.de': 30 * 24 * 60 * 60,
+    'oaadonline.oxfordlearnersdictionaries.com': 30 * 24 * 60 * 60,
+    'www.macmillandictionary.com': 30 * 24 * 60 * 60,
+    'dict.tu-chemnitz.de': 30 * 24 * 60 * 60,
+    # Wikis. People add pronunciations all the time.
+    'de.wiktionary.org': 2 * 24 * 60 * 60,
+    'en.wiktionary.org': 2 * 24 * 60 * 60,
+    'fr.wiktionary.org': 2 * 24 * 60 * 60,
+    # Japanesepod adds missing words now and then.
+    'assets.languagepod101.com': 7 * 24 * 60 * 60,
+}
+"""
+Seconds we use a cached response, by host name.
+
+Hosts that don't appear here use default_ttl. After that time we
+still keep the file, but ask the site if it has changed.
+"""
+
+cached_headers = ('etag', 'last-modified', 'content-type')
+"""The response headers we keep."""
+
+
+class HTTPCache(object):
+    """
+    A cache of HTTP responses on disk.
+
+    Every response is stored as two files, <key>.data with the body
+    and <key>.meta with the status and a few headers as JSON. The key
+    is built from the URL and the request headers.
+    """
+    def __init__(self, directory=cache_dir, max_size=max_cache_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = None
+        """Dict of key: [size, time last used]. Filled lazily."""
+
+    def key(self, url, headers):
+        key_text = url
+        for name, value in sorted(
+                (n.lower(), v) for n, v in (headers or {}).items()):
+            key_text += u'\n{0}: {1}'.format(name, value)
+        if isinstance(key_text, unicode):
+            key_text = key_text.encode('utf-8')
+        return hashlib.sha1(key_text).hexdigest()
+
+    def path(self, key, ending):
+        return os.path.join(self.directory, key + ending)
+
+    def ttl(self, url):
+        return site_ttls.get(urlparse.urlsplit(url).hostname, default_ttl)
+
+    def get(self, url, headers, fetch):
+        """
+        Return a Response for url, from the cache when possible.
+
+        When we have a fresh copy, return that. Otherwise use
+        fetch(url, headers) to ask the site, with If-None-Match or
+        If-Modified-Since headers when we have an old copy, and
+        store the answer.
+        """
+        key = self.key(url, headers)
+        meta = self.load_meta(key)
+        if meta and time.time() - meta['stored'] < self.ttl(url):
+            cached = self.load_response(key, meta)
+            if cached:
+                return cached
+        request_headers = dict(headers or {})
+        if meta:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last-modified'):
+                request_headers['If-Modified-Since'] = meta['last-modified']
+        response = fetch(url, request_headers)
+        if 304 == response.code and meta:
+            cached = self.load_response(key, meta)
+            if cached:
+                meta['stored'] = time.time()
+                try:
+                    self.write_meta(key, meta)
+                except (IOError, OSError):
+                    # Then we ask again next time. No harm done.
+                    pass
+                return cached
+            # The data file has gone missing. Ask again, normally.
+            response = fetch(url, headers)
+        if 200 == response.code \
+                and 'no-store' not in response.headers.get(
+                    'cache-control', ''):
+            self.store(key, response)
+        return response
+
+    def load_meta(self, key):
+        try:
+            with open(self.path(key, '.meta'), 'rb') as meta_file:
+                return json.load(meta_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def load_response(self, key, meta):
+        data_path = self.path(key, '.data')
+        try:
+            with open(data_path, 'rb') as data_file:
+                data = data_file.read()
+            # Touch the file. We use its mtime to decide what to
+            # remove first.
+            os.utime(data_path, None)
+        except (IOError, OSError):
+            return None
+        with self.lock:
+            if self.entries is not None:
+                self.entries[key] = [len(data), time.time()]
+        headers = dict((name, meta[name]) for name in cached_headers
+                       if meta.get(name))
+        return Response(
+            meta['url'], 200, meta.get('msg', 'OK'), headers, data)
+
+    def store(self, key, response):
+        meta = dict(url=response.url, msg=response.msg, stored=time.time())
+        for name in cached_headers:
+            if response.headers.get(name):
+                meta[name] = response.headers[name]
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            self.write_file(self.path(key, '.data'), response.data)
+            self.write_meta(key, meta)
+        except (IOError, OSError):
+            # Caching is nice to have. Don't let it stop the download.
+            return
+        with self.lock:
+            self.load_entries()
+            self.entries[key] = [len(response.data), time.time()]
+        self.maybe_evict()
+
+    def write_meta(self, key, meta):
+        self.write_file(self.path(key, '.meta'), json.dumps(meta))
+
+    def write_file(self, path, data):
+        """
+        Write the data to path, replacing the file in one step.
+
+        When that fails, remove the temp file and raise the error.
+        """
+        temp_file = tempfile.NamedTemporaryFile(
+            delete=False, dir=self.directory, suffix='.tmp')
+        try:
+            with temp_file:
+                temp_file.write(data)
+            if os.path.exists(path) and 'nt' == os.name:
+                # os.rename doesn't replace files on Windows.
+                os.remove(path)
+            os.rename(temp_file.name, path)
+        except (IOError, OSError):
+            try:
+                os.remove(temp_file.name)
+            except OSError:
+                pass
+            raise
+
+    def load_entries(self):
+        """Look at the files in the cache, once. Call with the lock held."""
+        if self.entries is not None:
+            return
+        self.entries = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            key, ending = os.path.splitext(name)
+            if '.data' != ending:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            self.entries[key] = [stat.st_size, stat.st_mtime]
+
+    def maybe_evict(self):
+        """Remove the least recently used files until we are small enough."""
+        with self.lock:
+            total = sum(size for size, used in self.entries.values())
+            if total <= self.max_size:
+                return
+            by_use = sorted(
+                self.entries.items(), key=lambda item: item[1][1])
+            for key, (size, used) in by_use:
+                if total <= self.max_size:
+                    break
+                for ending in ('.data', '.meta'):
+                    try:
+                        os.remove(self.path(key, ending))
+                    except OSError:
+                        pass
+                del self.entries[key]
+                total -= size
+
+
+cache = HTTPCache()
+"""The cache used by all downloaders."""
+
+
+def get(url, headers, fetch):
+    """Return a response for url, from the cache or by calling fetch."""
+    if not use_cache:
+        return fetch(url, headers)
+    return cache.get(url, headers, fetch)
@@ -0,0 +1,252 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Keep-alive HTTP connections, shared by all downloaders.
+
+urllib2 opens a new connection for every request. Some downloaders
+load two or three things from the same host for one word. Keep the
+connections open and use them again.
+'''
+
+import httplib
+import socket
+import threading
+import time
+import urllib
+import urllib2
+import urlparse
+
+from . import throttle
+
+
+pool_size = 4
+"""How many idle connections we keep open per host."""
+
+idle_timeout = 30
+"""Seconds after which we close a connection that wasn't used."""
+
+max_redirects = 5
+"""How many redirects we follow for one request."""
+
+redirect_codes = (301, 302, 303, 307, 308)
+
+stand_in = None
+"""
+(host, port) of a local server to send all requests to, or None.
+
+Used by tools/bench.py to replay recorded pages. The server gets the
+full URL in the request line, as a proxy would.
+"""
+
+request_timeout = 20
+"""
+Seconds we wait for a host to answer.
+
+Without this, a dead host can keep us waiting for minutes. See also
+throttle.
+"""
+
+
+class Response(object):
+    """
+    The parts of a HTTP response we use.
+
+    Looks enough like what urllib2.urlopen() returns for our
+    purposes. The data has already been read.
+    """
+    def __init__(self, url, code, msg, headers, data):
+        self.url = url
+        """The final URL, after redirects."""
+        self.code = code
+        self.msg = msg
+        self.headers = headers
+        """The response headers, as dict with lower-case keys."""
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class ConnectionPool(object):
+    """
+    A pool of open HTTP(S) connections, keyed by host.
+
+    A connection is used by one request at a time. Afterwards it is
+    put back, unless the server closed it or we already have
+    pool_size idle connections to that host.
+
+    Without size and timeout, pool_size and idle_timeout are used.
+    They are looked at every time, so they can be changed after the
+    pool has been made.
+    """
+    def __init__(self, size=None, timeout=None):
+        self.size = size
+        self.idle_timeout = timeout
+        self.lock = threading.Lock()
+        self.idle_connections = {}
+        """Lists of (connection, time last used), keyed by host."""
+
+    def max_idle(self):
+        """Return how many idle connections we keep per host."""
+        if self.size is None:
+            return pool_size
+        return self.size
+
+    def max_idle_time(self):
+        """Return the seconds after which we close idle connections."""
+        if self.idle_timeout is None:
+            return idle_timeout
+        return self.idle_timeout
+
+    def get_connection(self, key):
+        """
+        Return a (connection, reused) tuple for the host.
+
+        Use an idle connection when there is one young enough, or
+        make a new one.
+        """
+        now = time.time()
+        max_idle_time = self.max_idle_time()
+        with self.lock:
+            idle_list = self.idle_connections.get(key, [])
+            while idle_list:
+                connection, last_used = idle_list.pop()
+                if now - last_used < max_idle_time:
+                    return connection, True
+                connection.close()
+        return new_connection(key), False
+
+    def put_connection(self, key, connection):
+        with self.lock:
+            idle_list = self.idle_connections.setdefault(key, [])
+            if len(idle_list) < self.max_idle():
+                idle_list.append((connection, time.time()))
+                return
+        connection.close()
+
+    def close(self):
+        """Close all idle connections."""
+        with self.lock:
+            for idle_list in self.idle_connections.values():
+                for connection, last_used in idle_list:
+                    connection.close()
+            self.idle_connections = {}
+
+    def request(self, url, headers=None):
+        """
+        Send a GET request for url and return a Response.
+
+        Redirects are followed. Other non-200 codes are returned, not
+        raised.
+        """
+        headers = headers or {}
+        for dummy in range(max_redirects + 1):
+            response = self.single_request(url, headers)
+            if response.code not in redirect_codes \
+                    or 'location' not in response.headers:
+                return response
+            url = urlparse.urljoin(url, response.headers['location'])
+        return response
+
+    def single_request(self, url, headers):
+        split_url = urlparse.urlsplit(url)
+        scheme = split_url.scheme.lower()
+        if stand_in:
+            key = ('http', ) + tuple(stand_in)
+            path = url
+            headers = dict(headers, Host=split_url.netloc)
+        elif scheme not in ('http', 'https') \
+                or use_proxy(scheme, split_url):
+            return urllib2_request(url, headers)
+        else:
+            key = (scheme, split_url.hostname, split_url.port)
+            path = split_url.path or '/'
+            if split_url.query:
+                path += '?' + split_url.query
+        connection, reused = self.get_connection(key)
+        try:
+            http_response = send(connection, path, headers)
+        except (httplib.HTTPException, socket.error):
+            connection.close()
+            if not reused:
+                raise
+            # The server has probably closed the connection while it
+            # was idle. Try again, once, with a new one.
+            connection = new_connection(key)
+            try:
+                http_response = send(connection, path, headers)
+            except:
+                connection.close()
+                raise
+        try:
+            data = http_response.read()
+        except:
+            connection.close()
+            raise
+        if http_response.will_close:
+            connection.close()
+        else:
+            self.put_connection(key, connection)
+        return Response(
+            url, http_response.status, http_response.reason,
+            dict((k.lower(), v) for k, v in http_response.getheaders()),
+            data)
+
+
+def new_connection(key):
+    scheme, host, port = key
+    if 'https' == scheme:
+        return httplib.HTTPSConnection(host, port, timeout=request_timeout)
+    return httplib.HTTPConnection(host, port, timeout=request_timeout)
+
+
+def send(connection, path, headers):
+    connection.request('GET', path, headers=headers)
+    return connection.getresponse()
+
+
+def use_proxy(scheme, split_url):
+    """Return whether the system wants us to use a proxy for this."""
+    return scheme in urllib.getproxies() \
+        and not urllib.proxy_bypass(split_url.hostname)
+
+
+def urllib2_request(url, headers):
+    """
+    Do the request the old way.
+
+    We use this when there is a proxy set, as urllib2 knows how to
+    deal with those.
+    """
+    request = urllib2.Request(url)
+    for name, value in headers.items():
+        request.add_header(name, value)
+    try:
+        url_response = urllib2.urlopen(request, timeout=request_timeout)
+    except urllib2.HTTPError as http_error:
+        # Like the pool, return these instead of raising.
+        url_response = http_error
+    return Response(
+        url_response.geturl(), url_response.code, url_response.msg,
+        dict((k.lower(), v) for k, v in url_response.info().items()),
+        url_response.read())
+
+
+pool = ConnectionPool()
+"""The pool used by all downloaders."""
+
+
+def get(url, headers=None):
+    """
+    Send a GET request for url using the shared pool.
+
+    The request goes through throttle, so it may wait, be retried or
+    fail with a throttle.HostDownError right away.
+    """
+    return throttle.call(url, lambda: pool.request(url, headers))
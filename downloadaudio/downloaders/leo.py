@@ -15,13 +15,6 @@ import os
 import sys
 import urllib
 
-# Make this work without PyQt
-with_pyqt = True
-try:
-    from PyQt4.QtGui import QImage
-except ImportError:
-    with_pyqt = False
-
 from .downloader import AudioDownloader
 
 
@@ -35,11 +28,9 @@ class LeoDownloader(AudioDownloader):
         # (I'm not sure if they really have anything for ru or it.)
         self.language_dict = {'de': 'de', 'en': 'en', 'es': 'es', 'fr': 'fr',
                               'it': 'it', 'ru': 'ru', 'zh': 'ch'}
+        self.languages = self.language_dict.keys()
         # It kind of looks like they have Swiss pronunciations, but hey don't.
         self.chinese_code = 'ch'
-        # We should keep a number of site icons handy, with the right
-        # flag for the request.
-        self.site_icon_dict = {}
         self.site_file_name_encoding = 'ISO-8859-1'
         self.icon_url_dict = {
             'de': 'http://dict.leo.org/favicon.ico',
@@ -56,7 +47,7 @@ class LeoDownloader(AudioDownloader):
         self.have_tried_cjklib_hack = False
         self.reading_factory = None
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Download a word from LEO
 
@@ -65,33 +56,31 @@ class LeoDownloader(AudioDownloader):
         Chinese. There may not be any pronunciations available for
         Italian or Russian.
         """
-        self.downloads_list = []
-        # Fix the language. EAFP.
-        self.language = self.language_dict[self.language[:2].lower()]
+        # Fix the language. EAFP. Don't change job.language, the
+        # miss cache and the routing use that.
+        language = self.language_dict[job.language[:2].lower()]
         # set_names also checks the language.
-        self.set_names(word, base, ruby)
-        if self.chinese_code == self.language and not split:
+        self.set_names(job, language)
+        if self.chinese_code == language and not job.split:
             return
         # Only get the icon when we have a word
         # self.maybe_get_icon()
-        self.get_flag_icon()
+        job.site_icon = self.get_flag_icon(language)
         # EAFP. self.query_url may return None...
-        word_url = self.query_url(word, ruby)
+        word_url = self.query_url(job.word, job.ruby, language)
         # ... then the get_data will blow up
         word_data = self.get_data_from_url(word_url)
-        word_file_path, word_file_name = self.get_file_name()
-        with open(word_file_path, 'wb') as word_file:
-            word_file.write(word_data)
+        word_file_path, word_file_name = self.save_data(job, word_data)
         # We have a file, but not much to say about it.
-        self.downloads_list.append(
+        job.downloads_list.append(
             (word_file_path, word_file_name, dict(Source='Leo')))
 
-    def query_url(self, word, ruby):
+    def query_url(self, word, ruby, language):
         """Build query URL"""
-        if self.chinese_code == self.language:
+        if self.chinese_code == language:
             word = self.fix_pinyin(ruby)
         return self.url.format(
-            language=self.language, word=urllib.quote(word.encode(
+            language=language, word=urllib.quote(word.encode(
                     self.site_file_name_encoding)))
 
     def fix_pinyin(self, pinyin):
@@ -128,38 +117,35 @@ class LeoDownloader(AudioDownloader):
             pinyin, 'Pinyin',  'Pinyin', targetOptions={
                 'toneMarkType': 'numbers'}).replace('5', '0')
 
-    def get_flag_icon(self):
+    def get_flag_icon(self, language):
         """
-        Set self.site_icon to the right icon.
+        Return the right icon for the language.
 
         We should use different icons, depending on the request
-        language.  We store these icons in self.site_icon_dict and use the
-        AudioDownloader.maybe_get_icon() if we don't have it yet.
+        language. The site_icons store keeps them by language.
         """
-        if not with_pyqt:
-            return
-        try:
-            # If this works we already have it.
-            self.site_icon = self.site_icon_dict[self.language]
-        except KeyError:
-            # We have to get it ourself. (We know it's just 16x16, so
-            # no resize. And we know the address).
-            self.site_icon_dict[self.language] = \
-                QImage.fromData(self.get_data_from_url(
-                    self.icon_url_dict[self.language]))
-            self.site_icon = self.site_icon_dict[self.language]
+        return self.get_site_icon(language)
 
-    def set_names(self, text, base, ruby):
+    def get_icon_data(self, language=None):
+        # We know the address.
+        return self.get_data_from_url(self.icon_url_dict[language])
+
+    def set_names(self, job, language=None):
         """
         Set the display text and file base name variables.
+
+        language is the Leo language code, worked out from
+        job.language when not given.
         """
-        if self.language == self.chinese_code:
-            if not ruby:
+        if language is None:
+            language = self.language_dict[job.language[:2].lower()]
+        if language == self.chinese_code:
+            if not job.ruby:
                 raise ValueError('Nothing to download')
-            self.base_name = u"{0}_{1}".format(base, ruby)
-            self.display_text = u"{1} ({0})".format(base, ruby)
+            job.base_name = u"{0}_{1}".format(job.base, job.ruby)
+            job.display_text = u"{1} ({0})".format(job.base, job.ruby)
         else:
-            if not text:
+            if not job.word:
                 raise ValueError('Nothing to download')
-            self.base_name = text
-            self.display_text = text
+            job.base_name = job.word
+            job.display_text = job.word
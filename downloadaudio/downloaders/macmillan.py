@@ -14,16 +14,22 @@ from copy import copy
 import urllib
 
 from .downloader import AudioDownloader
+from .extract import Target
 
 
 class MacmillanDownloader(AudioDownloader):
     """Download audio from Macmillan Dictionary."""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ['en']
         self.file_extension = u'.mp3'
         self.icon_url = 'http://www.macmillandictionary.com/'
+        # The audio clips are stored as images with class sound and
+        # the link hidden in the onclick bit.
+        self.word_targets = dict(
+            sounds=Target(attrs={'class': 'sound', 'onclick': True}))
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get pronunciations of a word from Macmillan Dictionary.
 
@@ -31,23 +37,20 @@ class MacmillanDownloader(AudioDownloader):
         pronunciations in the page and get audio files for those.
 
         """
-        self.downloads_list = []
-        if split:
+        if job.split:
             # Avoid double downloads
             return
-        self.set_names(word, base, ruby)
-        if not self.language.lower().startswith('en'):
+        self.set_names(job)
+        if not job.language.lower().startswith('en'):
             return
+        word = job.word
         if not word:
             return
         word = word.replace("'", "-")
         self.maybe_get_icon()
-        # Do our parsing with BeautifulSoup
-        word_soup = self.get_soup_from_url(
-            self.url + urllib.quote(word.encode('utf-8')))
-        # The audio clips are stored as images with class sound and
-        # the link hidden in the onclick bit.
-        sounds = word_soup.findAll(attrs={'class': 'sound'})
+        sounds = self.extract_from_url(
+            self.url + urllib.quote(word.encode('utf-8')),
+            self.word_targets)['sounds']
         # The interesting bit it the onclick attribute and looks like
         # """playSoundFromFlash('http://www.macmillandictionary.com/',
         # 'http://www.macmillandictionary.com/media/british/uk_pron/\
@@ -73,9 +76,7 @@ class MacmillanDownloader(AudioDownloader):
             audio_url = audio_url.lstrip("'").rstrip("'")
             word_data = self.get_data_from_url(audio_url)
 
-            word_file_path, word_file_name = self.get_file_name()
-            with open(word_file_path, 'wb') as word_file:
-                word_file.write(word_data)
+            word_file_path, word_file_name = self.save_data(job, word_data)
             extras = self.extras
             try:
                 alt_string = sound_tag['alt']
@@ -85,5 +86,5 @@ class MacmillanDownloader(AudioDownloader):
                 if not 'pronunciation' in alt_string.lower():
                     extras = copy(self.extras)
                     extras['Alt text'] = alt_string
-            self.downloads_list.append(
+            job.downloads_list.append(
                 (word_file_path, word_file_name, extras))
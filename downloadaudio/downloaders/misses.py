@@ -0,0 +1,122 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Remember which sites had nothing for a word.
+
+Most requests don't find anything. When a site had nothing for a
+word, don't ask it again for a while.
+'''
+
+import os
+import sqlite3
+import threading
+import time
+
+
+use_miss_cache = True
+"""Set this to False to always ask all the sites."""
+
+miss_db_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'misses.db')
+"""Where we store the misses. In the add-on folder."""
+
+miss_expiry = 30 * 24 * 60 * 60
+"""
+Seconds we remember a miss.
+
+After that we ask the site again. It may have added the word by now.
+"""
+
+
+def site_name(downloader):
+    """Return the name we use for the site of a downloader."""
+    return downloader.__class__.__name__
+
+
+def request_text(job):
+    """Return the text we use to remember a DownloadJob."""
+    if job.split:
+        return u'{0}\t{1}'.format(job.base, job.ruby)
+    return job.word
+
+
+class MissCache(object):
+    """
+    Store of (site, language, text) triples that gave no result.
+
+    The misses are kept in a small sqlite database.
+    """
+    def __init__(self, path=miss_db_path, expiry=miss_expiry):
+        self.path = path
+        self.expiry = expiry
+        self.lock = threading.Lock()
+        self.db = None
+
+    def open_db(self):
+        """Open the database, once. Call with the lock held."""
+        if self.db:
+            return
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute(
+            'create table if not exists misses (site text, language text, '
+            'request text, time real, primary key (site, language, request))')
+        # Clean up while we are at it.
+        self.db.execute('delete from misses where time < ?',
+                        (time.time() - self.expiry, ))
+        self.db.commit()
+
+    def is_miss(self, site, language, text):
+        """Return whether we have a fresh miss for this request."""
+        with self.lock:
+            self.open_db()
+            row = self.db.execute(
+                'select time from misses where site=? and language=? '
+                'and request=?', (site, language, text)).fetchone()
+        return bool(row) and time.time() - row[0] < self.expiry
+
+    def add_misses(self, miss_list):
+        """Store a list of (site, language, text) misses."""
+        if not miss_list:
+            return
+        now = time.time()
+        with self.lock:
+            self.open_db()
+            self.db.executemany(
+                'insert or replace into misses values (?, ?, ?, ?)',
+                [(site, language, text, now)
+                 for site, language, text in miss_list])
+            self.db.commit()
+
+    def remove_misses(self, miss_list):
+        """Forget a list of (site, language, text) misses."""
+        if not miss_list:
+            return
+        with self.lock:
+            self.open_db()
+            self.db.executemany(
+                'delete from misses where site=? and language=? '
+                'and request=?', miss_list)
+            self.db.commit()
+
+
+miss_cache = MissCache()
+"""The miss store used by the add-on."""
+
+
+def is_miss(downloader, job):
+    """Return whether downloader recently had nothing for job."""
+    if not use_miss_cache:
+        return False
+    return miss_cache.is_miss(
+        site_name(downloader), job.language, request_text(job))
+
+
+def miss_key(downloader, job):
+    """Return the (site, language, text) triple for downloader and job."""
+    return site_name(downloader), job.language, request_text(job)
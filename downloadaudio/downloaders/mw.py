@@ -14,18 +14,26 @@ import urllib
 import re
 
 from .downloader import AudioDownloader
+from .extract import Target
 
 
 class MerriamWebsterDownloader(AudioDownloader):
     """Download audio from Meriam-Webster"""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ['en']
         self.url = 'http://www.merriam-webster.com/dictionary/'
         # Here the word page url works to get the favicon.
         self.icon_url = self.url
         self.popup_url = 'http://www.merriam-webster.com/audio.php?'
+        # The audio clips are stored as input tags with class au
+        self.word_targets = dict(
+            au=Target('input', {'class': 'au', 'onclick': True}))
+        # The audio clip is the only embed tag.
+        self.popup_targets = dict(
+            embed=Target('embed', {'src': True}, limit=1))
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get pronunciations of a word from Meriam-Webster
 
@@ -35,20 +43,18 @@ class MerriamWebsterDownloader(AudioDownloader):
         There may be more than one pronunciation (eg row: \ˈrō\ and
         \ˈrau̇\), so return a list.
         """
-        self.downloads_list = []
-        if split:
+        if job.split:
             # Avoid double downloads
             return
-        self.set_names(word, base, ruby)
-        if not self.language.lower().startswith('en'):
+        self.set_names(job)
+        if not job.language.lower().startswith('en'):
             return
+        word = job.word
         if not word:
             return
-        # Do our parsing with BeautifulSoup
-        word_soup = self.get_soup_from_url(
-            self.url + urllib.quote(word.encode('utf-8')))
-        # The audio clips are stored as input tags with class au
-        word_input_aus = word_soup.findAll(name='input', attrs={'class': 'au'})
+        word_input_aus = self.extract_from_url(
+            self.url + urllib.quote(word.encode('utf-8')),
+            self.word_targets)['au']
         # The interesting bit it the onclick attribute and looks like
         # "return au('moore01v', 'Moore\'s law')" Isolate those. Make
         # it readable. We do the whole processing EAFP style. When MW
@@ -57,6 +63,11 @@ class MerriamWebsterDownloader(AudioDownloader):
         file_list = []
         meaning_no_list = []
         for input_tag in word_input_aus:
+            title = input_tag.get('title')
+            if not title:
+                # Not one of the pronunciation buttons we know. Don't
+                # let it spoil the others.
+                continue
             onclick_string = input_tag['onclick']
             # Now cut off the bits on the left and right that should be
             # there. If not, this will fail. (Most likely the split.)
@@ -73,7 +84,7 @@ class MerriamWebsterDownloader(AudioDownloader):
             # title..
             match = re.search(
                 "Listen to the pronunciation of ([0-9]+)" + re.escape(word),
-                input_tag['title'])
+                title)
             try:
                 meaning_no = match.group(1)
             except AttributeError:
@@ -106,12 +117,12 @@ class MerriamWebsterDownloader(AudioDownloader):
             if meaning_no:
                 extras['Meaning #'] = meaning_no
             try:
-                word_path, word_file = self.get_word_file(mw_fn, word)
+                word_path, word_file = self.get_word_file(job, mw_fn, word)
             except ValueError:
                 continue
-            self.downloads_list.append((word_path, word_file, extras))
+            job.downloads_list.append((word_path, word_file, extras))
 
-    def get_word_file(self, base_name, word):
+    def get_word_file(self, job, base_name, word):
         """
         Get an audio file from MW.
 
@@ -119,14 +130,14 @@ class MerriamWebsterDownloader(AudioDownloader):
         isolate the "Use your default player" link from that, get the
         file that points to and get that.
         """
-        popup_soup = self.get_soup_from_url(
-            self.get_popup_url(base_name, word))
-        # The audio clip is the only embed tag.
-        popup_embed = popup_soup.find(name='embed')
+        try:
+            popup_embed = self.extract_from_url(
+                self.get_popup_url(base_name, word),
+                self.popup_targets)['embed'][0]
+        except IndexError:
+            raise ValueError('No audio on the MW pop-up.')
         word_data = self.get_data_from_url(popup_embed['src'])
-        word_path, word_fname = self.get_file_name()
-        with open(word_path, 'wb') as word_file:
-            word_file.write(word_data)
+        word_path, word_fname = self.save_data(job, word_data)
         return word_path, word_fname
 
     def get_popup_url(self, base_name, source):
@@ -15,41 +15,44 @@ from copy import copy
 import urllib
 
 from .downloader import AudioDownloader
+from .extract import Target
 
 
 class OaadDownloader(AudioDownloader):
     """Download audio from Oxford Advanced American Dictionary."""
     def __init__(self):
         AudioDownloader.__init__(self)
+        self.languages = ['en']
         self.file_extension = u'.mp3'
         self.icon_url = 'http://oaadonline.oxfordlearnersdictionaries.com/'
         self.url = \
             'http://oaadonline.oxfordlearnersdictionaries.com/dictionary/'
         self.url_sound = self.icon_url
+        # The audio clips are stored as images with class sound and
+        # the link hidden in the onclick bit.
+        self.word_targets = dict(
+            sounds=Target(attrs={'class': 'sound', 'onclick': True}))
         self.extras = dict(
             Source="Oxford Advanced American Dictionary", Variant="US")
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get pronunciations of a word from Oxford Advanced American Dictionary.
         """
-        self.downloads_list = []
-        if split:
+        if job.split:
             # Avoid double downloads
             return
-        self.set_names(word, base, ruby)
-        if not self.language.lower().startswith('en'):
+        self.set_names(job)
+        if not job.language.lower().startswith('en'):
             return
+        word = job.word
         if not word:
             return
         word = word.replace("'", "-")
         self.maybe_get_icon()
-        # Do our parsing with BeautifulSoup
-        word_soup = self.get_soup_from_url(
-            self.url + urllib.quote(word.encode('utf-8')))
-        # The audio clips are stored as images with class sound and
-        # the link hidden in the onclick bit.
-        sounds = word_soup.findAll(attrs={'class': 'sound'})
+        sounds = self.extract_from_url(
+            self.url + urllib.quote(word.encode('utf-8')),
+            self.word_targets)['sounds']
         # <img src="/external/images/pron-us.gif"
         #  alt="mutilate pronunciation American"
         #  title="mutilate pronunciation American"
@@ -71,9 +74,7 @@ class OaadDownloader(AudioDownloader):
             audio_url = self.url_sound + audio_url.lstrip("'").rstrip("'")
             word_data = self.get_data_from_url(audio_url)
 
-            word_file_path, word_file_name = self.get_file_name()
-            with open(word_file_path, 'wb') as word_file:
-                word_file.write(word_data)
+            word_file_path, word_file_name = self.save_data(job, word_data)
             extras = self.extras
             try:
                 alt_string = sound_tag['alt']
@@ -83,5 +84,5 @@ class OaadDownloader(AudioDownloader):
                 if not 'pronunciation' in alt_string.lower():
                     extras = copy(self.extras)
                     extras['Alt text'] = alt_string
-            self.downloads_list.append(
+            job.downloads_list.append(
                 (word_file_path, word_file_name, extras))
@@ -0,0 +1,237 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Decide which downloaders to ask, and in which order.
+
+Only ask the downloaders that can do something with the language.
+Keep track of how often each site had something, and how long it
+took, and use that to skip sites that (almost) never have anything
+for a language.
+'''
+
+import os
+import tempfile
+import threading
+import time
+
+# As in the main Anki code.
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+stats_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'site_stats.json')
+"""Where we keep the statistics. In the add-on folder."""
+
+prune_sites = True
+"""Skip sites that almost never had anything for a language."""
+
+prune_min_tries = 50
+"""Only skip a site after we have asked it this often."""
+
+prune_below = 0.02
+"""Skip sites that had something less often than this."""
+
+probe_every = 25
+"""Ask a skipped site anyway every this many times."""
+
+adaptive_order = False
+"""
+Ask the sites in order of their hit rate and speed.
+
+Normally the sites are asked, and the files shown, in the order of
+the downloaders list. That list is ordered by the quality of the
+audio. Set this to True to put the sites that have something most
+often, and the fast ones, first.
+"""
+
+latency_weight = 0.2
+"""How much a new time counts for the mean download time."""
+
+save_interval = 60
+"""
+Seconds between two writes of the statistics.
+
+Each download adds a little to them, so we don't write them every
+time. What is left is written at the end of a batch and when the
+profile is closed.
+"""
+
+
+def language_key(language):
+    """Return the two-letter code we use for the language."""
+    return (language or '')[:2].lower()
+
+
+def site_name(downloader):
+    """Return the name we use for the site of a downloader."""
+    return downloader.__class__.__name__
+
+
+class SiteStats(object):
+    """
+    How often the sites had something, and how long they took.
+
+    Kept by (site, language). Saved as JSON in site_stats.json.
+    """
+    def __init__(self, path=stats_path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = None
+        """Dict of 'site language': dict(tries, hits, time, skipped)."""
+        self.dirty = False
+        self.saved_at = None
+
+    def load(self):
+        """Load the statistics, once. Call with the lock held."""
+        if self.stats is not None:
+            return
+        try:
+            with open(self.path, 'r') as stats_file:
+                self.stats = json.load(stats_file)
+        except (IOError, ValueError):
+            self.stats = {}
+
+    def entry(self, site, language):
+        """Return the stats for site and language. Call with the lock held."""
+        self.load()
+        return self.stats.setdefault(
+            u'{0} {1}'.format(site, language),
+            dict(tries=0, hits=0, time=None, skipped=0))
+
+    def record(self, site, language, hit, seconds):
+        """Remember one request to the site."""
+        with self.lock:
+            entry = self.entry(site, language)
+            entry['tries'] += 1
+            if hit:
+                entry['hits'] += 1
+            if entry['time'] is None:
+                entry['time'] = seconds
+            else:
+                entry['time'] += latency_weight * (seconds - entry['time'])
+            self.dirty = True
+
+    def hit_rate(self, site, language):
+        with self.lock:
+            entry = self.entry(site, language)
+            # Count a new site as a fifty-fifty chance.
+            return (entry['hits'] + 1.0) / (entry['tries'] + 2.0)
+
+    def mean_time(self, site, language):
+        with self.lock:
+            return self.entry(site, language)['time'] or 0
+
+    def should_skip(self, site, language):
+        """
+        Return whether we should skip the site for now.
+
+        Sites we asked often and that had hardly ever anything are
+        skipped. Every probe_every times we ask them anyway, as they
+        may have changed.
+        """
+        with self.lock:
+            entry = self.entry(site, language)
+            if entry['tries'] < prune_min_tries \
+                    or float(entry['hits']) / entry['tries'] >= prune_below:
+                return False
+            entry['skipped'] += 1
+            self.dirty = True
+            return bool(entry['skipped'] % probe_every)
+
+    def save(self, force=False):
+        """
+        Write the statistics to disk, when they have changed.
+
+        Unless force is set, only write them when we didn't in the
+        last save_interval seconds.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            if not force and self.saved_at is not None \
+                    and time.time() - self.saved_at < save_interval:
+                return
+            directory = os.path.dirname(self.path)
+            try:
+                temp_file = tempfile.NamedTemporaryFile(
+                    delete=False, dir=directory, suffix='.tmp')
+                with temp_file:
+                    json.dump(self.stats, temp_file, indent=1)
+                if os.path.exists(self.path) and 'nt' == os.name:
+                    # os.rename doesn't replace files on Windows.
+                    os.remove(self.path)
+                os.rename(temp_file.name, self.path)
+            except (IOError, OSError):
+                return
+            self.dirty = False
+            self.saved_at = time.time()
+
+
+class Router(object):
+    """
+    Pick the downloaders for a language.
+
+    Keep an index of language: downloaders, built from the
+    downloaders' languages lists, in the order of the downloaders
+    list.
+    """
+    def __init__(self, downloaders, stats):
+        self.downloaders = downloaders
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.index = {}
+
+    def candidates(self, language):
+        """Return the downloaders that can do something with language."""
+        key = language_key(language)
+        with self.lock:
+            try:
+                return self.index[key]
+            except KeyError:
+                self.index[key] = [
+                    dl for dl in self.downloaders
+                    if dl.languages is None or key in dl.languages]
+                return self.index[key]
+
+    def route(self, language, prune=True):
+        """
+        Return the list of downloaders to ask for language.
+
+        When prune is True, skip the sites that hardly ever have
+        anything for the language.
+        """
+        key = language_key(language)
+        route_list = self.candidates(language)
+        if prune and prune_sites:
+            route_list = [
+                dl for dl in route_list
+                if not self.stats.should_skip(site_name(dl), key)]
+        if adaptive_order:
+            route_list = sorted(
+                route_list, key=lambda dl: (
+                    -self.stats.hit_rate(site_name(dl), key),
+                    self.stats.mean_time(site_name(dl), key)))
+        return route_list
+
+    def record(self, downloader, language, hit, seconds):
+        self.stats.record(
+            site_name(downloader), language_key(language), hit, seconds)
+
+
+site_stats = SiteStats()
+"""The statistics used by the add-on."""
+
+
+def make_router(downloaders):
+    """Return a Router for the downloaders that uses site_stats."""
+    return Router(downloaders, site_stats)
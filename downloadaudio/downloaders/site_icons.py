@@ -0,0 +1,203 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Keep the site icons on disk.
+
+The icons hardly ever change. Load each one once, keep it in the
+site_icons folder and only ask the site again after a long time, in
+the background.
+'''
+
+import os
+import re
+import tempfile
+import threading
+import time
+
+# Make this work without PyQt
+with_pyqt = True
+try:
+    from PyQt4.QtGui import QImage
+    from PyQt4.QtCore import QSize, Qt
+except ImportError:
+    with_pyqt = False
+
+
+icon_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'site_icons')
+"""Where we keep the icons. The site_icons folder in the add-on folder."""
+
+icon_ttl = 90 * 24 * 60 * 60
+"""Seconds after which we load an icon again, in the background."""
+
+no_icon_ttl = 24 * 60 * 60
+"""Seconds after which we try again to load an icon that didn't load."""
+
+max_icon_size = 20
+"""Max size we scale the site icons down to, if larger."""
+
+
+class IconStore(object):
+    """
+    Site icons on disk and in memory.
+
+    The icons are kept as the data we got from the site, in files
+    named after site and language. An empty file means the site had
+    no icon. The QImages are built when an icon is first asked for.
+    """
+    def __init__(self, directory=icon_dir):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.images = {}
+        """QImages (or None) by key."""
+        self.refreshing = set()
+        """Keys of the icons that are being loaded in the background."""
+        self.loading = {}
+        """
+        Events for the icons that are being loaded the first time, by key.
+
+        The threads that want the same icon at the same time wait for
+        the first one, instead of all asking the site.
+        """
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.icon')
+
+    def get(self, site, language, fetch):
+        """
+        Return the icon for site and language as QImage, or None.
+
+        Use the icon from memory or from disk. When we have none, call
+        fetch() to get the icon data. When the one we have is old,
+        call fetch() in the background, and return the old one for now.
+        fetch() should return the data or None.
+        """
+        if not with_pyqt:
+            return None
+        key = icon_key(site, language)
+        with self.lock:
+            if key in self.images:
+                image = self.images[key]
+                self.maybe_refresh(key, fetch)
+                return image
+            loading = self.loading.get(key)
+            if loading is None:
+                loading = threading.Event()
+                self.loading[key] = loading
+                first = True
+            else:
+                first = False
+        if not first:
+            # Wait with a time-out. A plain wait() blocks Ctrl-C on
+            # Python 2.
+            while not loading.wait(1):
+                pass
+            with self.lock:
+                return self.images.get(key)
+        image = None
+        try:
+            try:
+                with open(self.path(key), 'rb') as icon_file:
+                    data = icon_file.read()
+            except IOError:
+                # Never loaded. Do it now, once.
+                data = self.fetch_and_store(key, fetch)
+            image = make_image(data)
+        finally:
+            with self.lock:
+                self.images[key] = image
+                self.maybe_refresh(key, fetch)
+                del self.loading[key]
+            loading.set()
+        return image
+
+    def maybe_refresh(self, key, fetch):
+        """Load the icon again when it is old. Call with the lock held."""
+        if key in self.refreshing:
+            return
+        try:
+            stat = os.stat(self.path(key))
+        except OSError:
+            return
+        if stat.st_size:
+            ttl = icon_ttl
+        else:
+            ttl = no_icon_ttl
+        if time.time() - stat.st_mtime < ttl:
+            return
+        self.refreshing.add(key)
+        thread = threading.Thread(target=self.refresh, args=(key, fetch))
+        thread.daemon = True
+        thread.start()
+
+    def refresh(self, key, fetch):
+        try:
+            data = self.fetch_and_store(key, fetch)
+            image = make_image(data)
+            with self.lock:
+                self.images[key] = image
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def fetch_and_store(self, key, fetch):
+        """Get the icon data with fetch() and write it to disk."""
+        try:
+            data = fetch()
+        except Exception:
+            data = None
+        try:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            temp_file = tempfile.NamedTemporaryFile(
+                delete=False, dir=self.directory, suffix='.tmp')
+            with temp_file:
+                temp_file.write(data or '')
+            if os.path.exists(self.path(key)) and 'nt' == os.name:
+                # os.rename doesn't replace files on Windows.
+                os.remove(self.path(key))
+            os.rename(temp_file.name, self.path(key))
+        except (IOError, OSError):
+            # We can still use the icon this time.
+            pass
+        return data
+
+
+def icon_key(site, language):
+    """Return the name we use for the icon file."""
+    key = site
+    if language:
+        key += u'_' + language
+    return re.sub(r'[^\w-]', '_', key)
+
+
+def make_image(data):
+    """Return a QImage made from data, scaled down if needed, or None."""
+    if not data:
+        return None
+    image = QImage.fromData(data)
+    if image.isNull():
+        return None
+    max_size = QSize(max_icon_size, max_icon_size)
+    image_size = image.size()
+    if image_size.width() > max_size.width() \
+            or image_size.height() > max_size.height():
+        image = image.scaled(
+            max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image
+
+
+store = IconStore()
+"""The icon store used by all downloaders."""
+
+
+def get_icon(site, language, fetch):
+    """Return the icon for site and language, see IconStore.get()."""
+    return store.get(site, language, fetch)
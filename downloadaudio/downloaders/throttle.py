@@ -0,0 +1,291 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+Be nice to the sites, and don't wait for dead ones.
+
+For every host, limit the number of requests per second (a token
+bucket), try again a few times after errors, waiting a bit longer
+each time, and stop asking a host for a while after a row of errors
+(a circuit breaker).
+
+A thread can also watch a threading.Event, see watch(). Once that is
+set, its requests stop waiting and retrying.
+'''
+
+import httplib
+import random
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+
+
+default_rate = 2.0
+"""Requests per second we send to one host, on average."""
+
+default_burst = 4
+"""How many requests we send to one host at once, at most."""
+
+host_rates = {
+    # They don't like robots that ask for robot voices.
+    'translate.google.com': (1.0, 2),
+}
+"""(rate, burst) by host name, for hosts that need something else."""
+
+max_retries = 2
+"""How often we try again after an error."""
+
+base_backoff = 0.5
+"""Seconds we wait before the first retry. Doubled every time."""
+
+max_backoff = 10.0
+"""We never wait longer than this before a retry."""
+
+retry_codes = (429, 500, 502, 503, 504)
+"""HTTP codes that mean "try again later"."""
+
+failure_threshold = 5
+"""Stop asking a host after this many errors in a row."""
+
+cool_down = 120
+"""Seconds we don't ask a host after it had failure_threshold errors."""
+
+network_errors = (socket.error, httplib.HTTPException, urllib2.URLError)
+
+
+class HostDownError(IOError):
+    """Raised when we don't ask a host because of recent errors."""
+    pass
+
+
+class RequestCancelled(IOError):
+    """Raised when the download the request is for was cancelled."""
+    pass
+
+
+watched = threading.local()
+"""The cancel event of each thread, see watch()."""
+
+
+def watch(cancelled):
+    """
+    Give up the requests of this thread once cancelled is set.
+
+    cancelled is a threading.Event, or None to stop watching. We
+    don't wait for our turn or retry any more after that, but raise a
+    RequestCancelled. A request that has already been sent still has
+    to finish.
+    """
+    watched.cancelled = cancelled
+
+
+def check_cancelled():
+    cancelled = getattr(watched, 'cancelled', None)
+    if cancelled and cancelled.is_set():
+        raise RequestCancelled('Download cancelled')
+
+
+def pause(seconds):
+    """Wait, but not after the download was cancelled."""
+    cancelled = getattr(watched, 'cancelled', None)
+    if cancelled:
+        cancelled.wait(seconds)
+        check_cancelled()
+    else:
+        time.sleep(seconds)
+
+
+class HostState(object):
+    """
+    Rate limiter and circuit breaker for one host.
+
+    Also counts requests, errors and time spent waiting, to show
+    what is going on.
+    """
+    def __init__(self, host, rate, burst):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.last_fill = time.time()
+        self.failures = 0
+        """Errors in a row."""
+        self.open_until = 0
+        self.trial = None
+        """
+        The thread doing a test request while the breaker is open.
+
+        None when there is no test request.
+        """
+        self.requests = 0
+        self.errors = 0
+        self.skipped = 0
+        self.waited = 0.0
+
+    def acquire(self):
+        """Wait until we may send the next request."""
+        with self.lock:
+            now = time.time()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.last_fill) * self.rate)
+            self.last_fill = now
+            # Take the token now, even when it isn't there yet. Then
+            # the requests waiting at the same time queue up nicely.
+            self.tokens -= 1
+            wait = max(0, -self.tokens / self.rate)
+            self.requests += 1
+            self.waited += wait
+        if wait:
+            pause(wait)
+
+    def allow(self):
+        """
+        Return whether we should ask the host at all.
+
+        After the cool-down, let one request through to see if the
+        host is back.
+        """
+        with self.lock:
+            if self.failures < failure_threshold:
+                return True
+            if time.time() < self.open_until or self.trial:
+                self.skipped += 1
+                return False
+            self.trial = threading.current_thread()
+            return True
+
+    def end_trial(self):
+        """
+        Forget the test request of this thread, if there is one.
+
+        For requests that ended without success() or failure(), so
+        that the next one may try again.
+        """
+        with self.lock:
+            if self.trial is threading.current_thread():
+                self.trial = None
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.errors += 1
+            self.trial = None
+            if self.failures >= failure_threshold:
+                self.open_until = time.time() + cool_down
+
+    def is_open(self):
+        with self.lock:
+            return self.failures >= failure_threshold
+
+    def state(self):
+        """Return a dict describing the state, for diagnostics."""
+        with self.lock:
+            if self.failures < failure_threshold:
+                breaker = 'closed'
+            elif time.time() < self.open_until:
+                breaker = 'open'
+            else:
+                breaker = 'half-open'
+            return dict(
+                host=self.host, breaker=breaker, failures=self.failures,
+                open_for=max(0, self.open_until - time.time()),
+                tokens=self.tokens, requests=self.requests,
+                errors=self.errors, skipped=self.skipped,
+                waited=self.waited)
+
+
+host_states = {}
+"""The HostState objects, by host name."""
+host_states_lock = threading.Lock()
+
+
+def host_state(host):
+    """Return the HostState for the host."""
+    with host_states_lock:
+        try:
+            return host_states[host]
+        except KeyError:
+            rate, burst = host_rates.get(
+                host, (default_rate, default_burst))
+            host_states[host] = HostState(host, rate, burst)
+            return host_states[host]
+
+
+def backoff(attempt, response=None):
+    """
+    Return the seconds to wait before retry number attempt + 1.
+
+    Use the Retry-After header when the site sent one. Otherwise wait
+    a random time up to base_backoff * 2 ** attempt, so that the
+    requests that failed together don't come back together.
+    """
+    try:
+        return min(max_backoff, float(response.headers['retry-after']))
+    except (AttributeError, KeyError, ValueError):
+        pass
+    return random.uniform(0, min(max_backoff, base_backoff * 2 ** attempt))
+
+
+def call(url, request):
+    """
+    Return request(), rate-limited and retried for the host of url.
+
+    request should do the request for url and return a Response.
+    Raise a HostDownError when the host had too many errors recently.
+    After the last retry return the last response, or raise the last
+    error. Raise a RequestCancelled when the thread's download was
+    cancelled, see watch().
+    """
+    check_cancelled()
+    state = host_state(urlparse.urlsplit(url).hostname)
+    if not state.allow():
+        raise HostDownError(
+            'Not asking {0} after {1} errors.'.format(
+                state.host, state.failures))
+    try:
+        attempt = 0
+        while True:
+            state.acquire()
+            response = None
+            try:
+                response = request()
+            except network_errors:
+                state.failure()
+                if attempt >= max_retries or state.is_open():
+                    raise
+            else:
+                if response.code not in retry_codes:
+                    # That includes 404s. The host is there, it just
+                    # doesn't have what we want.
+                    state.success()
+                    return response
+                state.failure()
+                if attempt >= max_retries or state.is_open():
+                    return response
+            pause(backoff(attempt, response))
+            attempt += 1
+    finally:
+        # Other errors say nothing about the host, but when this was
+        # the test request, the next request has to be able to try.
+        state.end_trial()
+
+
+def report():
+    """Return a list of state dicts, one for every host we asked."""
+    with host_states_lock:
+        states = host_states.values()
+    return sorted((state.state() for state in states),
+                  key=lambda state: state['host'])
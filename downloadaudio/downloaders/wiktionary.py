@@ -15,14 +15,7 @@ import urlparse
 import re
 
 from .downloader import AudioDownloader
-
-# Make this work without PyQt
-with_pyqt = True
-try:
-    from PyQt4.QtGui import QImage
-    from PyQt4.QtCore import QSize, Qt
-except ImportError:
-    with_pyqt = False
+from .extract import Target
 
 
 class WiktionaryDownloader(AudioDownloader):
@@ -41,27 +34,31 @@ class WiktionaryDownloader(AudioDownloader):
         # This seems to work to extract the url from a <button> tag's
         # onclick attribute.
         self.button_onclick_re = '"videoUrl":"([^"]+)"'
+        self.word_targets = dict(
+            links=Target('a', {'href': True}),
+            sources=Target('source', {'src': True}),
+            buttons=Target('button', {'onclick': True}))
 
-    def download_files(self, word, base, ruby, split):
+    def download_job(self, job):
         """
         Get pronunciations of a word from the right wiktionary.
         """
-        self.downloads_list = []
-        if split:
+        if job.split:
             # Avoid double downloads.
             return
-        self.set_names(word, base, ruby)
+        self.set_names(job)
+        word = job.word
         if not word:
             return
         u_word = urllib.quote(word.encode('utf-8'))
         self.maybe_get_icon()
-        self.language = self.language[:2]
-        word_soup = self.get_soup_from_url(
-            self.url.format(self.language, u_word))
+        language = job.language[:2]
+        found = self.extract_from_url(
+            self.url.format(language, u_word), self.word_targets)
         # There are a number of ways the audio files can be present:
         ogg_url_list = []
         # As simple links:
-        a_list = word_soup.findAll('a')
+        a_list = found['links']
         for a in a_list:
             try:
                 # Caveat. I have seen an <a> without a href! (It was '<a
@@ -76,7 +73,7 @@ class WiktionaryDownloader(AudioDownloader):
                 ogg_url_list.append(href)
         # Next, look for source and src. Seen those inside audio tags.
         # I'm not sure if this is any use, but i guess it does no harm.
-        source_list = word_soup.findAll('source')
+        source_list = found['sources']
         for source in source_list:
             try:
                 # Take the same precaution as above
@@ -88,7 +85,7 @@ class WiktionaryDownloader(AudioDownloader):
             if re.search(self.word_ogg_re.format(word=re.escape(word)), src):
                 ogg_url_list.append(src)
         # At least from fr.wiktionary.org i got a <button>.
-        button_list = word_soup.findAll('button')
+        button_list = found['buttons']
         for button in button_list:
             try:
                 video_url = re.search(
@@ -103,32 +100,17 @@ class WiktionaryDownloader(AudioDownloader):
             # We may have to add a scheme or a scheme and host
             # name (netloc). urlparse to the rescue!
             word_url = urlparse.urljoin(
-                self.url.format(self.language, ''), url_to_get)
+                self.url.format(language, ''), url_to_get)
             try:
                 word_data = self.get_data_from_url(word_url)
             except:
                 continue
-            word_path, word_fname = self.get_file_name()
-            with open(word_path, 'wb') as word_file:
-                word_file.write(word_data)
-            self.downloads_list.append(
+            word_path, word_fname = self.save_data(job, word_data)
+            job.downloads_list.append(
                 (word_path, word_fname, dict(Source="Wiktionary")))
 
-    def maybe_get_icon(self):
-        if self.site_icon:
-            return
-        if not with_pyqt:
-            self.site_icon = None
-            return
+    def get_icon_data(self, language=None):
         try:
-            icon_data = self.get_data_from_url(self.full_icon_url)
+            return self.get_data_from_url(self.full_icon_url)
         except:
-            AudioDownloader.maybe_get_icon(self)
-        else:
-            self.site_icon = QImage.fromData(icon_data)
-            max_size = QSize(self.max_icon_size, self.max_icon_size)
-            ico_size = self.site_icon.size()
-            if ico_size.width() > max_size.width() \
-                    or ico_size.height() > max_size.height():
-                self.site_icon = self.site_icon.scaled(
-                    max_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            return AudioDownloader.get_icon_data(self, language)
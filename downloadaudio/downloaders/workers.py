@@ -0,0 +1,170 @@
+# -*- mode: python; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, ospalh@gmail.com
+#
+# License: GNU AGPL, version 3 or later;
+# http://www.gnu.org/copyleft/agpl.html
+
+
+'''
+A small pool of worker threads.
+
+Most of the time a download spends waiting for some web site to
+answer. Running the requests in a few threads lets us wait for all
+the sites at the same time.
+'''
+
+import Queue
+import threading
+
+
+class CancelledError(Exception):
+    """Raised when we ask for the result of a task that was cancelled."""
+    pass
+
+
+class Task(object):
+    """
+    One function call that is run by the pool.
+
+    Store the result or the exception, so that the caller can get at
+    it later, in the thread that asks for it. When a done_queue is
+    given, the task puts itself there once it is done or cancelled.
+    """
+    def __init__(self, function, args, done_queue=None):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.exception = None
+        self.cancelled = False
+        self.done = threading.Event()
+        self.done_queue = done_queue
+        self.lock = threading.Lock()
+
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            self.result = self.function(*self.args)
+        except Exception as e:
+            self.exception = e
+        finally:
+            self.finish()
+
+    def cancel(self):
+        """Cancel the task if it has not been started yet."""
+        with self.lock:
+            if self.done.is_set():
+                return
+            self.cancelled = True
+        self.finish()
+
+    def finish(self):
+        with self.lock:
+            if self.done.is_set():
+                # Cancelled while it ran. We have already told.
+                return
+            self.done.set()
+        if self.done_queue is not None:
+            self.done_queue.put(self)
+
+    def get(self):
+        """
+        Return the result of the function call.
+
+        Wait for the task to finish. Raise what the function raised,
+        or a CancelledError.
+        """
+        # Wait with a time-out. A plain wait() blocks Ctrl-C on Python 2.
+        while not self.done.wait(1):
+            pass
+        if self.cancelled:
+            raise CancelledError('Task cancelled')
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+class WorkerPool(object):
+    """
+    A bounded pool of daemon threads.
+
+    The threads are started the first time they are needed and then
+    wait for more tasks.
+    """
+    def __init__(self, size=4):
+        self.size = max(1, size)
+        self.queue = Queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, function, *args):
+        """Run function(*args) in one of the threads. Return the Task."""
+        return self.submit_task(Task(function, args))
+
+    def submit_task(self, task):
+        """Run the Task in one of the threads. Return it."""
+        self.start_threads()
+        self.queue.put(task)
+        return task
+
+    def imap(self, function, items):
+        """
+        Call function for every item, yield the results in order.
+
+        Like itertools.imap, but all the calls run in parallel. The
+        results are yielded in the order of items, each one as soon as
+        it and all the ones before it are done.
+        """
+        tasks = [self.submit(function, item) for item in items]
+        for task in tasks:
+            yield task.get()
+
+    def imap_unordered(self, function, items):
+        """
+        Call function for every item, yield the results as they come.
+
+        Like imap(), but each result is yielded as soon as it is
+        done, in whatever order that is. For a task that was
+        cancelled, a CancelledError is raised.
+        """
+        finished = Queue.Queue()
+        tasks = [self.submit_task(Task(function, (item, ), finished))
+                 for item in items]
+        for dummy in tasks:
+            while True:
+                # As in Task.get(), don't block Ctrl-C.
+                try:
+                    task = finished.get(timeout=1)
+                    break
+                except Queue.Empty:
+                    pass
+            yield task.get()
+
+    def map(self, function, items):
+        """Call function for every item, return the list of results."""
+        return list(self.imap(function, items))
+
+    def cancel(self):
+        """Cancel all tasks that have not been started yet."""
+        while True:
+            try:
+                task = self.queue.get_nowait()
+            except Queue.Empty:
+                return
+            task.cancel()
+
+    def start_threads(self):
+        with self.lock:
+            # Dead threads should not happen, as run() catches
+            # everything. Be careful anyway.
+            self.threads = [t for t in self.threads if t.is_alive()]
+            while len(self.threads) < self.size:
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def work(self):
+        while True:
+            self.queue.get().run()
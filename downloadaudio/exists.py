@@ -6,6 +6,8 @@
 
 import os
 import re
+import sys
+import threading
 import unicodedata
 
 from aqt import mw
@@ -20,6 +22,123 @@ deal with the resulting problems by hand.
 """
 
 
+def normalized(name):
+    """Return the name the way we compare names."""
+    return unicodedata.normalize('NFD', name.lower())
+
+
+class MediaIndex(object):
+    """
+    Index of the normalized, lower-case names of the files in a directory.
+
+    For every base name and ending we also keep the highest number n
+    used in a name like base_n.end, so that we can find a free name
+    without trying one number after the other.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.names = set()
+        self.max_suffix = {}
+        """Highest number used, by (normalized base, normalized end)."""
+        self.mtime = None
+
+    def maybe_rescan(self):
+        """
+        Read the directory again if it has changed. Call with lock.
+
+        Reading it only every few seconds would miss files that were
+        added in between, e.g. by the user or a sync. The names we
+        hand out ourselves are added to the index right away.
+        """
+        try:
+            mtime = os.stat(self.directory).st_mtime
+        except OSError:
+            mtime = None
+        if self.mtime is not None and mtime == self.mtime:
+            return
+        self.names = set()
+        self.max_suffix = {}
+        for fname in os.listdir(self.directory):
+            if isinstance(fname, str):
+                fname = fname.decode(sys.getfilesystemencoding(), 'replace')
+            self.add(fname)
+        self.mtime = mtime
+
+    def add(self, name):
+        """Add the name to the index. Call with the lock held."""
+        n_name = normalized(name)
+        self.names.add(n_name)
+        stem, end = os.path.splitext(n_name)
+        match = re.search(r'^(.*)_([0-9]+)$', stem)
+        if match:
+            key = (match.group(1), end)
+            number = int(match.group(2))
+        else:
+            key = (stem, end)
+            number = 0
+        if number > self.max_suffix.get(key, -1):
+            self.max_suffix[key] = number
+
+    def exists(self, name):
+        with self.lock:
+            self.maybe_rescan()
+            return normalized(name) in self.names
+
+    def reserve_free_name(self, base, end):
+        """
+        Return a free name based on base and end, and reserve it.
+
+        Either base + end, or base_n + end with n one higher than the
+        highest number already used.
+        """
+        with self.lock:
+            self.maybe_rescan()
+            name = base + end
+            number = self.max_suffix.get(
+                (normalized(base), normalized(end)), 0)
+            while normalized(name) in self.names \
+                    or os.path.exists(os.path.join(self.directory, name)):
+                number += 1
+                if number >= 10000:
+                    # Don't be silly. Give up after 9999 tries.
+                    raise ValueError('Could not find free name.')
+                name = u'{0}_{1}{2}'.format(base, number, end)
+            self.add(name)
+            return name
+
+    def created(self, name):
+        """
+        Note that we have just made the file name in the directory.
+
+        Making the file changes the mtime of the directory. Take the
+        new mtime as seen, so that our own files don't make us read
+        the whole folder again. Only changes from outside do that.
+        """
+        with self.lock:
+            try:
+                self.mtime = os.stat(self.directory).st_mtime
+            except OSError:
+                self.mtime = None
+            self.add(name)
+
+
+media_indexes = {}
+"""The MediaIndex objects, by directory."""
+media_indexes_lock = threading.Lock()
+
+
+def media_index(path):
+    """Return the MediaIndex for the directory path."""
+    path = os.path.normpath(path)
+    with media_indexes_lock:
+        try:
+            return media_indexes[path]
+        except KeyError:
+            media_indexes[path] = MediaIndex(path)
+            return media_indexes[path]
+
+
 def free_media_name(base, end):
     """
     Return a useful media name.
@@ -34,18 +153,14 @@ def free_media_name(base, end):
     if normalize_file_names_on_cards and isMac:
         base = unicodedata.normalize('NFD', base)
     mdir = mw.col.media.dir()
-    if not exists_lc(mdir, base + end):
-        return os.path.join(mdir, base + end), base + end
-    for i in range(1, 10000):
-        # Don't be silly. Give up after 9999 tries (by falling out of
-        # this loop).
-        long_name = u'{0}_{1}{2}'.format(base, i, end)
-        if not exists_lc(mdir, long_name):
-            # New: return both full path and the file name (with ending).
-            return os.path.join(mdir, long_name), long_name
-    # The only way we can have arrived here is by unsuccessfully
-    # trying the 10000 names.
-    raise ValueError('Could not find free name.')
+    # New: return both full path and the file name (with ending).
+    name = media_index(mdir).reserve_free_name(base, end)
+    return os.path.join(mdir, name), name
+
+
+def media_file_created(path):
+    """Tell the index that we have made the file path."""
+    media_index(os.path.dirname(path)).created(os.path.basename(path))
 
 
 def exists_lc(path, name):
@@ -62,9 +177,4 @@ def exists_lc(path, name):
     # do on Macs, then.
     if isMac:
         return os.path.exists(os.path.join(path, name))
-    ln_name = unicodedata.normalize('NFD', name.lower())
-    for fname in os.listdir(path):
-        if unicodedata.normalize('NFD', fname.lower()) == ln_name:
-            return True
-    # After the loop, none found. (Could have used for: ... else: ...)
-    return False
+    return media_index(path).exists(name)
@@ -61,14 +61,169 @@ Do or do not remove katakana interpuncts 「・」 before sending requests.
 field_name_re = '{{(?:[/^#]|[^:}]+:|)([^:}{]*%s[^:}{]*)}}'
 
 
+audio_field_res = [
+    re.compile(field_name_re % (re.escape(afk), ), flags=re.IGNORECASE)
+    for afk in audio_field_keys]
+"""The compiled field_name_re for each of the audio_field_keys."""
+
+
 def uniqify_list(seq):
     """Return a copy of the list with every element appearing only once."""
-    # From http://www.peterbe.com/plog/uniqifiers-benchmark
+    # Also from http://www.peterbe.com/plog/uniqifiers-benchmark, the
+    # order preserving one that doesn't go through the list for
+    # every element.
+    seen = set()
     no_dupes = []
-    [no_dupes.append(i) for i in seq if not no_dupes.count(i)]
+    for i in seq:
+        if i not in seen:
+            seen.add(i)
+            no_dupes.append(i)
     return no_dupes
 
 
+class FieldPlan(object):
+    """
+    Which fields to use for the audio fields of one note type.
+
+    Worked out once per note type and kept in model_plans, so that we
+    don't have to look at all the field names for every note.
+    """
+    def __init__(self, model):
+        self.mod = model['mod']
+        self.field_names = [fld['name'] for fld in model['flds']]
+        self.f_names = [fn.lower() for fn in self.field_names]
+        self.audio_fields = [fn for afk in audio_field_keys
+                             for fn in self.field_names if afk in fn.lower()]
+        """
+        The audio field names, for each key in audio_field_keys.
+
+        A field that contains more than one key appears more than
+        once.
+        """
+        self.sources = {}
+        """The source field index or a KeyError, by (fname, readings)."""
+        self.side_fields = {}
+        """The audio field names on a card side, by (ord, side)."""
+
+    def source_index(self, fname, readings):
+        """
+        Return the index of the source field for fname.
+
+        Raise a KeyError when there is none. See field_data() for how
+        the source field is found.
+        """
+        try:
+            source = self.sources[(fname, readings)]
+        except KeyError:
+            try:
+                source = self.find_source(fname, readings)
+            except KeyError as ke:
+                source = ke
+            self.sources[(fname, readings)] = source
+        if isinstance(source, KeyError):
+            raise source
+        return source
+
+    def side_audio_fields(self, card, side):
+        """
+        Return the names of the audio fields on one side of a card.
+
+        These are the fields of the note type that appear in the
+        template for that side and contain a string from
+        audio_field_keys.
+        """
+        try:
+            return self.side_fields[(card.ord, side)]
+        except KeyError:
+            pass
+        if 'question' == side:
+            template = card.template()[u'qfmt']
+        else:
+            template = card.template()[u'afmt']
+        audio_field_name_list = []
+        for afr in audio_field_res:
+            # Append all fields in the current template/side that contain
+            # 'audio' or 'sound'
+            audio_field_name_list += afr.findall(template)
+        # Filter out non-existing fields.
+        audio_field_name_list = [
+            fn for fn in uniqify_list(audio_field_name_list)
+            if fn in self.field_names]
+        self.side_fields[(card.ord, side)] = audio_field_name_list
+        return audio_field_name_list
+
+    def find_source(self, fname, readings):
+        t_name = fname.lower()
+        f_names = self.f_names
+        # First, look for just audio fields
+        for afk in audio_field_keys:
+            if t_name == afk:
+                if readings:
+                    sources_list = reading_keys
+                else:
+                    sources_list = expression_fields
+                for cnd in sources_list:
+                    for idx, lname in enumerate(f_names):
+                        if cnd == lname:
+                            return idx
+                # At this point: The target name is good, but we found no
+                # source name.
+                if not readings:
+                    # Don't give for most languages. Simply use the first
+                    # field. That should work for a lot of people
+                    return 0
+                else:
+                    # But that doesn't really work for Japanese.
+                    raise KeyError('No source name found (case 1)')
+            # This point: target name is not exactly the field name
+            if not afk in t_name:
+                # And not a substring either
+                continue
+            # Here: the field name contains an audio or sound.
+            # Mangle the name as described. For the readings case we get a
+            # list. So do a list for the other case as well.
+            if readings:
+                sources_list = [t_name.replace(afk, rk)
+                                for rk in reading_keys]
+            else:
+                # Here the tricky bit is to remove the right number of '_'
+                # or ' ' characters, 0 or 1, but not 2. What we want is:
+                # ExampleAudio -> Example
+                # Example_Audio -> Example
+                # Audio_Example -> Example
+                # but
+                # Another_Audio_Example -> Another_Example, not Another_Example
+                # While a bit tricky, this is not THAT hard to do. (Not
+                # lookbehind needed.)
+                sources_list = [re.sub(
+                    '[\s_]{0}|{0}[\s_]?'.format(re.escape(afk)),
+                    '', t_name, count=1)]
+            for cnd in sources_list:
+                for idx, lname in enumerate(f_names):
+                    if cnd == lname:
+                        return idx
+            # We do have audio or sound as sub-string but did not find a
+            # maching field.
+            raise KeyError('No source field found. (case 2)')
+        # No audio field at all.
+        raise KeyError('No source field found. (case 3)')
+
+
+model_plans = {}
+"""The FieldPlans, by model id."""
+
+
+def get_plan(note):
+    """Return the FieldPlan for the note's type."""
+    model = note.model()
+    plan = model_plans.get(model['id'])
+    if plan is None or plan.mod != model['mod']:
+        # New, or the note type has been changed.
+        plan = FieldPlan(model)
+        model_plans[model['id']] = plan
+    return plan
+
+
 def field_data(note, fname, readings, get_empty=False):
     """
     Return a suitable source field name and the text in that field.
@@ -91,117 +246,47 @@ def field_data(note, fname, readings, get_empty=False):
 
     The first field that matches the candidate is used.  Comparisions
     are done with lowercase strings, the uppercase name is returned.
+    Which field that is is worked out once per note type, see
+    FieldPlan.
 
     Also returned is the text from the field, always as three strings
     now, just cleaned up and split into base (kanji) and ruby (furigana).
     """
-    def return_data(idx):
-        """
-        Return a cleaned-up version of the field content.
+    plan = get_plan(note)
+    idx = plan.source_index(fname, readings)
+    text = note.fields[idx]
+    # This is taken from aqt/browser.py.
+    text = text.replace(u'<br>', u' ')
+    text = text.replace(u'<br />', u' ')
+    if strip_interpunct:
+        text = text.replace(u'・', u'')
+    text = stripHTML(text)
+    text = stripSounds(text)
+    # Reformat so we have exactly one space between words.
+    text = u' '.join(text.split())
+    if not text and not get_empty:
+        raise ValueError('Source field empty')
+    # We pass the reading/plain on to the update dialog. We don't
+    # look at the texts any more to decide what to do. So don't
+    # set anything to empty here. Rather do the split even if it
+    # is pointless.
+    base = furigana.kanji(text)
+    ruby = furigana.kana(text)
+    return plan.field_names[idx], fname, text, base, ruby, readings
 
-        Get the text, remove html, and return the field name, the
-        clean text, and what we got when we tried to split into kanji
-        and kana, when different from the text.
-        """
-        text = note[field_names[idx]]
-        # This is taken from aqt/browser.py.
-        text = text.replace(u'<br>', u' ')
-        text = text.replace(u'<br />', u' ')
-        if strip_interpunct:
-            text = text.replace(u'・', u'')
-        text = stripHTML(text)
-        text = stripSounds(text)
-        # Reformat so we have exactly one space between words.
-        text = u' '.join(text.split())
-        if not text and not get_empty:
-            raise ValueError('Source field empty')
-        # We pass the reading/plain on to the update dialog. We don't
-        # look at the texts any more to decide what to do. So don't
-        # set anything to empty here. Rather do the split even if it
-        # is pointless.
-        base = furigana.kanji(text)
-        ruby = furigana.kana(text)
-        return field_names[idx], fname, text, base, ruby, readings
-
-    t_name = fname.lower()
-    field_names = [item[0] for item in note.items()]
-    f_names = [fn.lower() for fn in field_names]
-    # First, look for just audio fields
-    for afk in audio_field_keys:
-        if t_name == afk:
-            if readings:
-                sources_list = reading_keys
-            else:
-                sources_list = expression_fields
-            for cnd in sources_list:
-                for idx, lname in enumerate(f_names):
-                    if cnd == lname:
-                        return return_data(idx)
-            # At this point: The target name is good, but we found no
-            # source name.
-            if not readings:
-                # Don't give for most languages. Simply use the first
-                # field. That should work for a lot of people
-                return return_data(0)
-            else:
-                # But that doesn't really work for Japanese.
-                raise KeyError('No source name found (case 1)')
-        # This point: target name is not exactly the field name
-        if not afk in t_name:
-            # And not a substring either
-            continue
-        # Here: the field name contains an audio or sound.
-        # Mangle the name as described. For the readings case we get a
-        # list. So do a list for the other case as well.
-        if readings:
-            sources_list = [t_name.replace(afk, rk)
-                            for rk in reading_keys]
-        else:
-            # Here the tricky bit is to remove the right number of '_'
-            # or ' ' characters, 0 or 1, but not 2. What we want is:
-            # ExampleAudio -> Example
-            # Example_Audio -> Example
-            # Audio_Example -> Example
-            # but
-            # Another_Audio_Example -> Another_Example, not Another_Example
-            # While a bit tricky, this is not THAT hard to do. (Not
-            # lookbehind needed.)
-            sources_list = [re.sub('[\s_]{0}|{0}[\s_]?'.format(re.escape(afk)),
-                                   '', t_name, count=1)]
-        for cnd in sources_list:
-            for idx, lname in enumerate(f_names):
-                if cnd == lname:
-                    return return_data(idx)
-        # We do have audio or sound as sub-string but did not find a
-        # maching field.
-        raise KeyError('No source field found. (case 2)')
-    # No audio field at all.
-    raise KeyError('No source field found. (case 3)')
-
-
-def get_side_fields(card, note):
+
+def get_side_fields(card, note, side=None):
     """
     Get a list of field data for "visible" download fields.
 
     Check the visible side of the current card for fields that contain
     a string from audio_field_keys.  Then check the note for these
-    fields and suitable data source fields.
+    fields and suitable data source fields. Pass 'question' or
+    'answer' as side to look at that side instead of the visible one.
     """
-    if 'question' == mw.reviewer.state:
-        template = card.template()[u'qfmt']
-    else:
-        template = card.template()[u'afmt']
-    audio_field_name_list = []
-    for afk in audio_field_keys:
-        # Append all fields in the current template/side that contain
-        # 'audio' or 'sound'
-        audio_field_name_list += re.findall(field_name_re % (re.escape(afk), ),
-                                            template, flags=re.IGNORECASE)
-    audio_field_name_list = uniqify_list(audio_field_name_list)
-    all_field_names = [item[0] for item in note.items()]
-    # Filter out non-existing fields.
-    audio_field_name_list = [fn for fn in audio_field_name_list
-                             if fn in all_field_names]
+    if not side:
+        side = mw.reviewer.state
+    audio_field_name_list = get_plan(note).side_audio_fields(card, side)
     field_data_list = []
     for fname in audio_field_name_list:
         try:
@@ -228,48 +313,45 @@ def get_note_fields(note, get_empty=False):
     Check all field names and return source and destination fields for
     downloading audio.
     """
-    field_names = [item[0] for item in note.items()]
     field_data_list = []
-    for afk in audio_field_keys:
-        for fn in field_names:
-            if afk in fn.lower():
-                if meaning_in_reading_field:
-                    try:
-                        # Here, too, first try reading, then try other
-                        # fields.
-                        field_data_list.append(field_data(
-                                note, fn, readings=True, get_empty=get_empty))
-                    except (KeyError, ValueError):
-                        # No or empty readings field.
-                        pass
-                    try:
-                        field_data_list.append(field_data(
-                                note, fn, readings=False, get_empty=get_empty))
-                    except (KeyError, ValueError):
-                        # No or empty 'normal' field
-                        pass
-                else:
-                    # We have to call field_data twice to get the base
-                    # text and reading.
-                    try:
-                        fd_base = field_data(
-                            note, fn, readings=False, get_empty=get_empty)
-                    except (KeyError, ValueError):
-                        continue
-                    try:
-                        fd_read = field_data(
-                            note, fn, readings=True, get_empty=get_empty)
-                    except (KeyError, ValueError):
-                        # No reading field after all.
-                        pass
-                    else:
-                        # Now we have to put together the two
-                        # results. I guess i could have used a named
-                        # tuple above. Oh, well. Kludge branch.
-                        field_data_list.append(
-                            (fd_base[0], fd_base[1], fd_base[2], fd_base[3],
-                             fd_read[4], True))
-                    # Use what we have from the first try, so that we
-                    # try GoogleTTS (wiktionary) as well.
-                    field_data_list.append(fd_base)
+    for fn in get_plan(note).audio_fields:
+        if meaning_in_reading_field:
+            try:
+                # Here, too, first try reading, then try other
+                # fields.
+                field_data_list.append(field_data(
+                        note, fn, readings=True, get_empty=get_empty))
+            except (KeyError, ValueError):
+                # No or empty readings field.
+                pass
+            try:
+                field_data_list.append(field_data(
+                        note, fn, readings=False, get_empty=get_empty))
+            except (KeyError, ValueError):
+                # No or empty 'normal' field
+                pass
+        else:
+            # We have to call field_data twice to get the base
+            # text and reading.
+            try:
+                fd_base = field_data(
+                    note, fn, readings=False, get_empty=get_empty)
+            except (KeyError, ValueError):
+                continue
+            try:
+                fd_read = field_data(
+                    note, fn, readings=True, get_empty=get_empty)
+            except (KeyError, ValueError):
+                # No reading field after all.
+                pass
+            else:
+                # Now we have to put together the two
+                # results. I guess i could have used a named
+                # tuple above. Oh, well. Kludge branch.
+                field_data_list.append(
+                    (fd_base[0], fd_base[1], fd_base[2], fd_base[3],
+                     fd_read[4], True))
+            # Use what we have from the first try, so that we
+            # try GoogleTTS (wiktionary) as well.
+            field_data_list.append(fd_base)
     return field_data_list
@@ -0,0 +1,244 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""
+Journal for batch downloads.
+
+A batch download writes what it does to a journal file, one JSON
+object per line, before it does it: which notes it wants to do, every
+file it is about to write, every file it is about to put into the
+media folder, which notes are about to be saved, with their new
+files. After the fact, it writes which downloaded files have been
+processed and which notes have been saved. The file records also say
+for which note, field and site the file is. When the batch is done,
+the journal is removed.
+
+When Anki crashes during a batch, the journal is still there on the
+next start. Then we remove the files that were written but never made
+it into a saved note, and go on with the notes that were not done.
+When we crashed while saving, we can't tell from the journal alone
+whether the save went through. See settle_pending().
+
+There is one journal per media folder, that is, per profile. The
+journal of another profile is left alone until that profile is
+loaded.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+# As in the main Anki code.
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+journal_dir = os.path.dirname(os.path.abspath(__file__))
+"""Where we keep the journals. The add-on folder."""
+
+
+def journal_path(media_dir):
+    """Return the path of the journal for the media folder."""
+    media_dir = os.path.abspath(media_dir)
+    if isinstance(media_dir, unicode):
+        media_dir = media_dir.encode('utf-8')
+    return os.path.join(
+        journal_dir, 'batch_journal_{0}.log'.format(
+            hashlib.sha1(media_dir).hexdigest()[:12]))
+
+
+class BatchJournal(object):
+    """
+    Write-ahead log of one batch download.
+
+    The downloaders write their temp files to self.temp_dir, which is
+    in the journal before any file is written there.
+    """
+    def __init__(self, media_dir):
+        self.media_dir = os.path.abspath(media_dir)
+        self.path = journal_path(media_dir)
+        self.lock = threading.Lock()
+        self.journal_file = None
+        self.temp_dir = None
+
+    def write(self, **record):
+        """Append the record and make sure it is on disk."""
+        with self.lock:
+            if not self.journal_file:
+                self.journal_file = open(self.path, 'a')
+            self.journal_file.write(json.dumps(record) + '\n')
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+
+    def start(self, nids):
+        self.temp_dir = tempfile.mkdtemp(prefix='anki_download_audio_')
+        self.write(op='start', nids=list(nids), media_dir=self.media_dir,
+                   temp_dir=self.temp_dir)
+
+    def fetched(self, nid, path, field=None, site=None):
+        """Record a file before it is written."""
+        self.write(op='fetched', nid=nid, field=field, site=site, path=path)
+
+    def processed(self, nid, path, name, field=None, site=None):
+        """Record that the file path is done and is now name."""
+        self.write(op='processed', nid=nid, field=field, site=site,
+                   path=path, name=name)
+
+    def moved(self, nid, name, field=None, site=None):
+        """Record a file before the audio processor puts it there."""
+        self.write(op='moved', nid=nid, field=field, site=site, name=name)
+
+    def committing(self, nids, names):
+        """Record that we are about to save the notes."""
+        self.write(op='committing', nids=list(nids), names=list(names))
+
+    def committed(self, nids, names):
+        """Record that the notes with their new files have been saved."""
+        self.write(op='committed', nids=list(nids), names=list(names))
+
+    def for_note(self, nid):
+        return NoteJournal(self, nid)
+
+    def finish(self):
+        """The batch is done or was cancelled. Remove the journal."""
+        with self.lock:
+            if self.journal_file:
+                self.journal_file.close()
+                self.journal_file = None
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        remove(self.path)
+
+
+class NoteJournal(object):
+    """
+    The part of the journal for one note, for the downloaders.
+
+    Use for_site() to get the part for one field and one site. The
+    records written through that say so.
+    """
+    def __init__(self, journal, nid, field=None, site=None):
+        self.journal = journal
+        self.nid = nid
+        self.field = field
+        self.site = site
+
+    @property
+    def temp_dir(self):
+        return self.journal.temp_dir
+
+    def for_site(self, field, site):
+        return NoteJournal(self.journal, self.nid, field, site)
+
+    def fetched(self, path):
+        self.journal.fetched(self.nid, path, self.field, self.site)
+
+    def processed(self, path, name):
+        self.journal.processed(self.nid, path, name, self.field, self.site)
+
+    def moved(self, name):
+        self.journal.moved(self.nid, name, self.field, self.site)
+
+
+def read_journal(path):
+    """
+    Return what the journal says about an unfinished batch, or None.
+
+    Return a dict with the note ids of the batch (nids), the ones
+    that are done (done), all files written (paths), all files moved
+    to the media folder (names), all files in saved notes (attached),
+    the media folder of the batch (media_dir) and the folder for its
+    temp files (temp_dir). When we crashed while saving notes, pending
+    is a list with the (nids, names) of that save.
+    """
+    try:
+        journal_file = open(path, 'r')
+    except IOError:
+        return None
+    state = dict(nids=[], done=set(), paths=[], names=[], attached=set(),
+                 pending=[], media_dir=None, temp_dir=None)
+    with journal_file:
+        for line in journal_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may be cut off by the crash.
+                continue
+            op = record.get('op')
+            if 'start' == op:
+                state['nids'] = record['nids']
+                state['media_dir'] = record.get('media_dir')
+                state['temp_dir'] = record.get('temp_dir')
+            elif 'fetched' == op:
+                state['paths'].append(record['path'])
+            elif 'moved' == op:
+                state['names'].append(record['name'])
+            elif 'committing' == op:
+                state['pending'].append((record['nids'], record['names']))
+            elif 'committed' == op:
+                state['done'].update(record['nids'])
+                state['attached'].update(record['names'])
+                state['pending'] = []
+    return state
+
+
+def settle_pending(state, is_used):
+    """
+    Decide whether the save we crashed in went through.
+
+    The collection saves all the notes of one flush, or none. So
+    when is_used(name) says that one of the new files of the pending
+    save is used by a note, the save went through, and its notes are
+    done. Otherwise their files are garbage. When the save had no new
+    files, its notes are simply done again.
+    """
+    for nids, names in state['pending']:
+        if any(is_used(name) for name in names):
+            state['done'].update(nids)
+            state['attached'].update(names)
+    state['pending'] = []
+
+
+def belongs_to(state, media_dir):
+    """Return whether the journal is from a batch in media_dir."""
+    return bool(state.get('media_dir')) and \
+        os.path.abspath(state['media_dir']) == os.path.abspath(media_dir)
+
+
+def collect_garbage(state, media_dir):
+    """
+    Remove the files of the batch that are not in a saved note.
+
+    Return the number of files removed. Do nothing when the journal
+    is from another media folder.
+    """
+    if not belongs_to(state, media_dir):
+        return 0
+    removed = 0
+    if state.get('temp_dir'):
+        shutil.rmtree(state['temp_dir'], ignore_errors=True)
+    candidates = state['paths'] + [
+        os.path.join(media_dir, name) for name in state['names']]
+    for path in candidates:
+        if os.path.basename(path) in state['attached'] \
+                and os.path.dirname(os.path.abspath(path)) \
+                == os.path.abspath(media_dir):
+            continue
+        if remove(path):
+            removed += 1
+    return removed
+
+
+def remove(path):
+    """Remove the file if it is there. Return whether we did."""
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
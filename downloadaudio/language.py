@@ -10,6 +10,7 @@ Return a language code.
 
 import re
 from aqt import mw
+from anki.hooks import addHook
 
 
 default_audio_language_code = "ja"
@@ -25,6 +26,18 @@ learning Japanese.
 ### Dont't change this!
 al_code_code = 'addon_audio_download_language'
 
+lang_tag_re = re.compile('^lang_([a-z]{2,3})$', flags=re.IGNORECASE)
+"""Tags that set the language of a note, like lang_de."""
+
+deck_languages = {}
+"""
+The language codes from the deck confs, by conf id.
+
+Most notes we look at share a few confs. Kept by conf, not by deck,
+so that moving a deck to another conf is seen at once. Cleared when
+a conf is changed, see forget_deck_languages().
+"""
+
 
 def get_language_code(card=None, note=None):
     """
@@ -36,12 +49,10 @@ def get_language_code(card=None, note=None):
         note = card.note()
     # First look at the tags
     for tag in note.tags:
-        try:
-            return re.search('^lang_([a-z]{2,3})$', tag,
-                             flags=re.IGNORECASE).group(1).lower()
-        except:
-            continue
-    # Then, look at the deck conf. First get it.
+        match = lang_tag_re.search(tag)
+        if match:
+            return match.group(1).lower()
+    # Then, look at the deck conf.
     if card:
         did = card.did
     else:
@@ -49,6 +60,29 @@ def get_language_code(card=None, note=None):
             did = note.model()['did']
         except (TypeError, KeyError):
             did = 1
+    conf_id = deck_conf_id(did)
+    try:
+        return deck_languages[conf_id]
+    except KeyError:
+        pass
+    language = deck_language(did)
+    deck_languages[conf_id] = language
+    return language
+
+
+def deck_conf_id(did):
+    """
+    Return the id of the conf of the deck.
+
+    Filtered decks don't have a conf. For them, return None.
+    """
+    # Like confForDid, this gives the default deck when there is no
+    # deck did.
+    return mw.col.decks.get(did).get('conf')
+
+
+def deck_language(did):
+    """Return the language code from the conf of the deck."""
     try:
         deck_conf = mw.col.decks.confForDid(did)
     except AssertionError:
@@ -60,3 +94,17 @@ def get_language_code(card=None, note=None):
         return deck_conf[al_code_code]
     except (TypeError, KeyError):
         return default_audio_language_code
+
+
+def forget_deck_languages():
+    """
+    Clear the stored deck languages.
+
+    Call this when a deck conf has changed. One conf may be used by
+    many decks, so we just forget them all.
+    """
+    deck_languages.clear()
+
+
+# Another profile, another collection. Deck ids may be the same.
+addHook("profileLoaded", forget_deck_languages)
@@ -0,0 +1,142 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""
+Load audio for the next cards in the background.
+
+While you look at one card, ask the sites for the audio of the next
+few cards, and throw the files away. What the sites sent is kept in
+the HTTP cache, and the sites that had nothing are remembered in the
+miss cache. When you then ask for side audio on one of those cards,
+the answer comes (mostly) from disk.
+
+Nothing is added to the notes or the media folder here.
+"""
+
+import os
+from collections import OrderedDict
+
+from aqt import mw
+from anki.hooks import addHook
+
+from .download import good_hit, router, run_job
+from .downloaders import DownloadJob, misses
+from .downloaders.workers import WorkerPool
+from .get_fields import get_side_fields
+from .language import get_language_code
+
+
+use_prefetch = False
+"""
+Set this to True to load audio for the next cards in the background.
+
+This sends requests to the sites for cards you may never ask audio
+for, so it is off by default.
+"""
+
+prefetch_count = 3
+"""How many cards we look ahead, from each of the scheduler's queues."""
+
+prefetch_pool = WorkerPool(2)
+"""Few threads. We don't want to slow down real downloads."""
+
+max_prefetched = 500
+"""How many of the cards we have done we remember."""
+
+prefetched = OrderedDict()
+"""
+(card id, note mod) pairs we have already done, oldest first.
+
+Only the last max_prefetched are kept. A card we have forgotten
+is looked at again, but the downloads then mostly come from the
+caches.
+"""
+
+
+def upcoming_card_ids(count):
+    """
+    Return the ids of the cards the scheduler will probably show next.
+
+    This looks at the scheduler's private queues, so it may stop
+    working with a new Anki version. Then we just don't prefetch.
+    """
+    sched = mw.col.sched
+    cids = []
+    try:
+        cids += [cid for due, cid in sorted(sched._lrnQueue)[:count]]
+    except (AttributeError, TypeError, ValueError):
+        pass
+    for queue_name in ('_revQueue', '_newQueue'):
+        # The scheduler pops the cards from the end of these.
+        try:
+            cids += list(reversed(getattr(sched, queue_name)))[:count]
+        except (AttributeError, TypeError):
+            pass
+    return cids
+
+
+def warm_caches(field_data, language):
+    """
+    Run the downloaders for the field data, and remove the files.
+
+    Called in a background thread.
+    """
+    miss_list = []
+    for source, dest, text, base, ruby, split in field_data:
+        for downloader in router.route(language):
+            job = DownloadJob(text, base, ruby, split, language)
+            if misses.is_miss(downloader, job):
+                continue
+            job.use_temp_files = True
+            if not run_job(downloader, job):
+                # Something went wrong. Don't remember anything.
+                continue
+            if not good_hit(job):
+                miss_list.append(misses.miss_key(downloader, job))
+            for word_path, file_name, extras in job.downloads_list:
+                try:
+                    os.remove(word_path)
+                except OSError:
+                    pass
+    if misses.use_miss_cache:
+        misses.miss_cache.add_misses(miss_list)
+
+
+def prefetch_upcoming():
+    """Start loading the audio for the next cards."""
+    if not use_prefetch:
+        return
+    current_card = mw.reviewer.card
+    for cid in upcoming_card_ids(prefetch_count):
+        if current_card and cid == current_card.id:
+            continue
+        try:
+            card = mw.col.getCard(cid)
+            note = card.note()
+        except Exception:
+            # Deleted in the meantime, or some such.
+            continue
+        key = (cid, note.mod)
+        if key in prefetched:
+            continue
+        prefetched[key] = True
+        while len(prefetched) > max_prefetched:
+            prefetched.popitem(last=False)
+        field_data = []
+        for side in ('question', 'answer'):
+            field_data += [fd for fd in get_side_fields(card, note, side)
+                           if fd not in field_data]
+        if field_data:
+            prefetch_pool.submit(
+                warm_caches, field_data, get_language_code(card=card))
+
+
+def forget_prefetched():
+    """Forget the cards we have done. They were from another profile."""
+    prefetched.clear()
+
+
+addHook("showQuestion", prefetch_upcoming)
+addHook("profileLoaded", forget_prefetched)
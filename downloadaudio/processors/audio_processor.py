@@ -10,7 +10,7 @@ possible.
 
 import shutil
 
-from ..exists import free_media_name
+from ..exists import free_media_name, media_file_created
 
 
 class AudioProcessor(object):
@@ -25,8 +25,10 @@ class AudioProcessor(object):
         moving the content of that file.
         """
         self.useful = False
+        self.thread_safe = False
+        """Whether process_and_move can run in more than one thread."""
 
-    def process_and_move(self, in_name, base_name):
+    def process_and_move(self, in_name, base_name, journal=None):
         """
         Make a sound file in the Anki media directory.
 
@@ -39,13 +41,19 @@ class AudioProcessor(object):
 
         When pysox and pydub are installed, the file is normalised and
         changed to the format set in the processor (flac).
+
+        When a journal is given, the new file is noted there before
+        it is put into the media folder.
         """
         raise NotImplementedError("Use a class derived from this.")
 
-    def unmunge_to_mediafile(self, in_name, base_name, suffix):
+    def unmunge_to_mediafile(self, in_name, base_name, suffix, journal=None):
         # New style: we now get both the path and just the file name out
         # of free_media_name.
         media_path, media_file_name = free_media_name(base_name, suffix)
+        if journal:
+            journal.moved(media_file_name)
         # Don't copy and delete, let the os do the work.
         shutil.move(in_name, media_path)
+        media_file_created(media_path)
         return media_file_name
@@ -16,7 +16,7 @@ class AudioMover(AudioProcessor):
         # not work.)
         AudioProcessor.__init__(self)
 
-    def process_and_move(self, in_name, base_name):
+    def process_and_move(self, in_name, base_name, journal=None):
         """
         Copy content of temp_file_name to a file in the media directory.
 
@@ -24,4 +24,5 @@ class AudioMover(AudioProcessor):
         with a name based on . media_base_name and suffix.
         """
         suffix = os.path.splitext(in_name)[1]
-        self.unmunge_to_mediafile(in_name, base_name, suffix)
+        return self.unmunge_to_mediafile(
+            in_name, base_name, suffix, journal)
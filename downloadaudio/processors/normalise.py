@@ -3,12 +3,34 @@
 # Copyright © 2012 Roland Sieker, <ospalh@gmail.com>
 # License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
 
+from distutils.spawn import find_executable
 from pydub import AudioSegment
 import os
 import pysox
+import subprocess
 import tempfile
 
 from .audio_processor import AudioProcessor
+from ..downloaders.downloader import media_name_lock
+from ..exists import free_media_name, media_file_created
+
+
+sox_binary = find_executable('sox')
+"""
+The sox program, or None.
+
+When we have it, we pipe the audio through it and write only the
+final file in the media folder. Otherwise we use pysox, with a few
+temp files.
+"""
+
+temp_prefix = '.download_audio_'
+"""
+Start of the names of our temp files in the media folder.
+
+Anki leaves files that start with a dot alone, so a file left over
+after a crash isn't synced or reported by Check Media.
+"""
 
 
 class AudioNormaliser(AudioProcessor):
@@ -17,15 +39,85 @@ class AudioNormaliser(AudioProcessor):
         AudioProcessor.__init__(self)
         self.output_format = ".flac"
         self.useful = True
+        # The sox program runs in its own process. pysox runs inside
+        # Anki, and we don't know if that is safe.
+        self.thread_safe = bool(sox_binary)
 
-    def process_and_move(self, in_name, base_name):
+    def process_and_move(self, in_name, base_name, journal=None):
         """
         Make new audio file in the media directory.
 
         Take the audio file with in_name, normalize, convert to
         self.output_format, put in the media folder with a suitable
-        file name, delete the old file and return the new name.
+        file name, delete the old file and return the new name. When
+        a journal is given, the new file is noted there before it is
+        put into the media folder.
         """
+        if sox_binary:
+            return self.sox_process_and_move(in_name, base_name, journal)
+        return self.pysox_process_and_move(in_name, base_name, journal)
+
+    def sox_process_and_move(self, in_name, base_name, journal=None):
+        """
+        Normalize and convert in one sox run.
+
+        Let sox read the downloaded file and write the final file
+        straight into the media folder. When this sox can't read mp3s,
+        decode them with pydub and pipe the raw samples into sox.
+        """
+        suffix = os.path.splitext(in_name)[1]
+        with media_name_lock:
+            media_path, media_file_name = free_media_name(
+                base_name, self.output_format)
+            if journal:
+                journal.moved(media_file_name)
+            # Create the file right away, as get_file_name() does, so
+            # that the name isn't free any more.
+            open(media_path, 'wb').close()
+            media_file_created(media_path)
+        # Let sox write to a plain ASCII name in the media folder and
+        # rename that afterwards. Renaming in the same folder doesn't
+        # copy the data, and we avoid passing non-ASCII names to
+        # another program.
+        try:
+            tof = tempfile.NamedTemporaryFile(
+                delete=False, dir=os.path.dirname(media_path),
+                prefix=temp_prefix, suffix=self.output_format)
+        except:
+            os.remove(media_path)
+            raise
+        temp_out_file_name = tof.name
+        tof.close()
+        try:
+            try:
+                run_sox([in_name], temp_out_file_name)
+            except ValueError:
+                if not '.mp3' == suffix:
+                    raise
+                segments = AudioSegment.from_mp3(in_name)
+                if 1 == segments.sample_width:
+                    encoding = 'unsigned-integer'
+                else:
+                    encoding = 'signed-integer'
+                run_sox(
+                    ['-t', 'raw', '-r', str(segments.frame_rate),
+                     '-e', encoding, '-b', str(8 * segments.sample_width),
+                     '-c', str(segments.channels), '-'],
+                    temp_out_file_name, segments.raw_data)
+            if 'nt' == os.name:
+                # os.rename doesn't replace files on Windows.
+                os.remove(media_path)
+            os.rename(temp_out_file_name, media_path)
+            media_file_created(media_path)
+        except:
+            os.remove(temp_out_file_name)
+            if os.path.exists(media_path):
+                os.remove(media_path)
+            raise
+        os.remove(in_name)
+        return media_file_name
+
+    def pysox_process_and_move(self, in_name, base_name, journal=None):
         # NB. We don't check the sox import *here*. We only use this
         # when the import worked in __init.py__.
         suffix = os.path.splitext(in_name)[1]
@@ -72,4 +164,25 @@ class AudioNormaliser(AudioProcessor):
         sox_out_file.close()
         os.remove(in_name)
         return self.unmunge_to_mediafile(
-            temp_out_file_name, base_name, self.output_format)
+            temp_out_file_name, base_name, self.output_format, journal)
+
+
+def run_sox(in_args, out_name, in_data=None):
+    """
+    Run sox to normalize the input and write it to out_name.
+
+    in_args are the sox arguments that describe the input. When that
+    is '-', pass in_data on stdin. Raise a ValueError when sox fails.
+    """
+    startupinfo = None
+    if 'nt' == os.name:
+        # Don't flash a console window for every file.
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    sox_process = subprocess.Popen(
+        [sox_binary, '-q'] + in_args + [out_name, 'gain', '-n'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, startupinfo=startupinfo)
+    dummy_out, err = sox_process.communicate(in_data)
+    if sox_process.returncode:
+        raise ValueError('sox failed: {0}'.format(err.strip()))
@@ -20,14 +20,19 @@ choices what to do wit each:
 """
 
 import os
+import Queue
 
 from PyQt4.QtGui import QButtonGroup, QDialog, QDialogButtonBox, QGridLayout, \
-    QIcon, QLabel, QPixmap, QPushButton
-from PyQt4.QtCore import SIGNAL, SLOT
+    QIcon, QLabel, QPixmap, QPushButton, QVBoxLayout
+from PyQt4.QtCore import QTimer, SIGNAL, SLOT
 
 from aqt import mw
 from anki.lang import _
-from anki.sound import play, playFromText
+from anki.sound import clearAudioQueue, play, playFromText
+try:
+    from anki.sound import ensureMplayerThreads
+except ImportError:
+    ensureMplayerThreads = None
 
 from blacklist import add_black_hash
 
@@ -37,13 +42,29 @@ icons_dir = os.path.join(mw.pm.addonFolder(), 'downloadaudio', 'icons')
 # to make the code a bit more readable
 action = {'add': 0, 'keep': 1, 'delete': 2, 'blacklist': 3}
 
+poll_interval = 100
+"""Milliseconds between two looks for new files from the download."""
 
-def store_or_blacklist(note, retrieved_data, show_skull_and_bones, hide_text):
-    if not note or not retrieved_data:
+
+def store_or_blacklist(note, download, hide_text):
+    """
+    Show the files from the download and do what the user says.
+
+    download is a running StreamingDownload. The dialog is shown at
+    once, and the files are added as they come in. When the dialog is
+    closed, the rest of the download is cancelled.
+    """
+    if not note:
+        download.cancel()
         raise ValueError('Nothing downloaded')
-    review_files = ReviewFiles(
-        note, retrieved_data, show_skull_and_bones, hide_text)
-    if not review_files.exec_():
+    review_files = ReviewFiles(note, download, hide_text)
+    accepted = review_files.exec_()
+    # Whatever is still to come, we don't want it any more.
+    download.cancel()
+    retrieved_data = review_files.list
+    if review_files.nothing_found:
+        raise ValueError('Nothing downloaded')
+    if not accepted:
         remove_all_files(retrieved_data)
         raise RuntimeError('User cancel')
     # Go through the list once and just do what needs to be done.
@@ -57,7 +78,7 @@ def store_or_blacklist(note, retrieved_data, show_skull_and_bones, hide_text):
             note[dest] += '[sound:' + dl_fname + ']'
         if action_id == action['delete']:
             os.remove(os.path.join(mw.col.media.dir(), dl_fname))
-        if action_id == action['blacklist']:
+        if action_id == action['blacklist'] and dl_hash:
             add_black_hash(dl_hash)
     if items_added:
         note.flush()
@@ -78,6 +99,23 @@ def store_or_blacklist(note, retrieved_data, show_skull_and_bones, hide_text):
             mw.reviewer.replayAudio()
 
 
+def warm_up_player():
+    """
+    Get Anki's audio player ready.
+
+    Anki plays everything through one mplayer that it keeps
+    running. Start the thread that looks after it now, while we wait
+    for the downloads, not with the first click on a play button.
+    """
+    if ensureMplayerThreads:
+        try:
+            ensureMplayerThreads()
+        except Exception:
+            # Not worth bothering the user with. It will be tried
+            # again when we play something.
+            pass
+
+
 def remove_all_files(files_etc):
     for source, dest, text, dl_fname, dl_hash, extras, icon\
             in files_etc:
@@ -87,12 +125,16 @@ def remove_all_files(files_etc):
 class ReviewFiles(QDialog):
     """
     A Dialog to let the user keep or discard files.
+
+    The files are added as the download brings them in.
     """
 
-    def __init__(self, note, files_list, show_skull_and_bones, hide_text):
+    def __init__(self, note, download, hide_text):
         super(ReviewFiles, self).__init__()  # Cut-and-pasted
         self.note = note
-        self.list = files_list
+        self.download = download
+        self.list = []
+        self.nothing_found = False
         self.num_columns = 8
         self.play_column = 2
         self.play_old_column = 3
@@ -100,9 +142,8 @@ class ReviewFiles(QDialog):
         self.keep_column = 5
         self.delete_column = 6
         self.blacklist_column = 7
-        self.show_skull_and_bones = show_skull_and_bones
-        if not self.show_skull_and_bones:
-            self.num_columns -= 1
+        # We only show the blacklist column once a site asks for it.
+        self.show_skull_and_bones = False
         self.hide_text = hide_text
         if self.hide_text:
             self.num_columns -= 1
@@ -113,6 +154,7 @@ class ReviewFiles(QDialog):
             self.delete_column -= 1
             self.blacklist_column -= 1
         self.buttons_groups = []
+        self.blacklist_buttons = []
         self.text_help = _(u"""<h4>Text used to retrieve audio.</h4>
 <p>Mouse over the icons or texts below to see further information.</p>""")
         self.text_hide_help = _(u"""<h4>Audio source</h4>
@@ -147,20 +189,25 @@ downloaded again, it will be silently dropped. This behaviour is
 useful for Japanesepod downloads. When your downloaded file tells you
 that they are sorry, will add this soon &c., click on this.""")
         self.blacklist_help_text_short = _(u"Blacklist this file")
+        self.waiting_text = _(u"Waiting for the sites to answer…")
         self.initUI()
+        warm_up_player()
+        self.timer = QTimer(self)
+        self.connect(self.timer, SIGNAL("timeout()"), self.poll_download)
+        self.timer.start(poll_interval)
 
     def initUI(self):
         self.setWindowTitle(_(u'Anki – Download audio'))
         self.setWindowIcon(QIcon(":/icons/anki.png"))
+        outer_layout = QVBoxLayout()
+        self.setLayout(outer_layout)
         layout = QGridLayout()
-        self.setLayout(layout)
-        explanation = QLabel(self)
-        if len(self.list) > 1:
-            explanation.setText(
-                _(u'Please select an action for each downloaded file:'))
-        else:
-            explanation.setText(_(u'Please select what to do with the file:'))
-        layout.addWidget(explanation, 0, 0, 1, self.num_columns)
+        self.grid = layout
+        outer_layout.addLayout(layout)
+        self.explanation = QLabel(self)
+        self.explanation.setText(
+            _(u'Please select what to do with the file:'))
+        layout.addWidget(self.explanation, 0, 0, 1, self.num_columns)
         if not self.hide_text:
             text_head_label = QLabel(_(u'<b>Source text</b>'), self)
             layout.addWidget(text_head_label, 1, 0, 1, 2)
@@ -187,13 +234,22 @@ that they are sorry, will add this soon &c., click on this.""")
         delete_head_label = QLabel(_(u'delete'), self)
         delete_head_label.setToolTip(self.delete_help_text_long)
         layout.addWidget(delete_head_label, 1, self.delete_column)
-        if self.show_skull_and_bones:
-            blacklist_head_label = QLabel(_(u'blacklist'), self)
-            blacklist_head_label.setToolTip(self.blacklist_help_text_long)
-            layout.addWidget(blacklist_head_label, 1, self.blacklist_column)
+        self.blacklist_head_label = QLabel(_(u'blacklist'), self)
+        self.blacklist_head_label.setToolTip(self.blacklist_help_text_long)
+        layout.addWidget(self.blacklist_head_label, 1, self.blacklist_column)
+        self.blacklist_head_label.hide()
         rule_label = QLabel('<hr>')
         layout.addWidget(rule_label, 2, 0, 1, self.num_columns)
-        self.create_rows(layout)
+        self.play_button_group = QButtonGroup(self)
+        self.old_play_button_group = QButtonGroup(self)
+        self.play_button_group.buttonClicked.connect(
+            lambda button: self.play_new(
+                self.play_button_group.id(button)))
+        self.old_play_button_group.buttonClicked.connect(
+            lambda button: self.play_old(
+                self.old_play_button_group.id(button)))
+        self.status_label = QLabel(self.waiting_text, self)
+        outer_layout.addWidget(self.status_label)
         dialog_buttons = QDialogButtonBox(self)
         dialog_buttons.addButton(QDialogButtonBox.Cancel)
         dialog_buttons.addButton(QDialogButtonBox.Ok)
@@ -201,90 +257,144 @@ that they are sorry, will add this soon &c., click on this.""")
                      self, SLOT("accept()"))
         self.connect(dialog_buttons, SIGNAL("rejected()"),
                      self, SLOT("reject()"))
-        layout.addWidget(dialog_buttons,
-                         len(self.buttons_groups) + 3, 0, 1, self.num_columns)
-
-    def create_rows(self, layout):
-        play_button_group = QButtonGroup(self)
-        old_play_button_group = QButtonGroup(self)
-        for num, (source, dest, text, dl_fname, dl_hash, extras, icon)\
-                in enumerate(self.list, 3):
-            tt_text = self.build_text_help_label(text, source, extras)
-            ico_label = QLabel('', self)
-            ico_label.setToolTip(tt_text)
-            if icon:
-                ico_label.setPixmap(QPixmap.fromImage(icon))
-            layout.addWidget(ico_label, num, 0)
-            tt_label = QLabel(text, self)
-            tt_label.setToolTip(tt_text)
-            layout.addWidget(tt_label, num, 1)
-            if self.hide_text:
-                tt_label.hide()
-            # Play button.
-            t_play_button = QPushButton(self)
-            play_button_group.addButton(t_play_button, num - 3)
-            t_play_button.setToolTip(self.play_help)
-            t_play_button.setIcon(QIcon(os.path.join(icons_dir, 'play.png')))
-            layout.addWidget(t_play_button, num, self.play_column)
-            if self.note[dest]:
-                t_play_old_button = QPushButton(self)
-                old_play_button_group.addButton(t_play_old_button, num - 3)
-                t_play_old_button.setIcon(
-                    QIcon(os.path.join(icons_dir, 'play.png')))
-                if not self.hide_text:
-                    t_play_old_button.setToolTip(self.note[dest])
-                else:
-                    t_play_old_button.setToolTip(self.play_old_help_short)
-                layout.addWidget(t_play_old_button, num, self.play_old_column)
-            else:
-                dummy_label = QLabel('', self)
-                dummy_label.setToolTip(self.play_old_empty_line_help)
-                layout.addWidget(dummy_label, num, self.play_old_column)
-            # The group where we later look what to do:
-            t_button_group = QButtonGroup(self)
-            t_button_group.setExclusive(True)
-            # Now the four buttons
-            t_add_button = QPushButton(self)
-            t_add_button.setCheckable(True)
-            t_add_button.setChecked(True)
-            t_add_button.setFlat(True)
-            t_add_button.setToolTip(self.add_help_text_short)
-            t_add_button.setIcon(QIcon(os.path.join(icons_dir, 'add.png')))
-            layout.addWidget(t_add_button, num, self.add_column)
-            t_button_group.addButton(t_add_button, action['add'])
-            t_keep_button = QPushButton(self)
-            t_keep_button.setCheckable(True)
-            t_keep_button.setFlat(True)
-            t_keep_button.setToolTip(self.keep_help_text_short)
-            t_keep_button.setIcon(QIcon(os.path.join(icons_dir, 'keep.png')))
-            layout.addWidget(t_keep_button, num, self.keep_column)
-            t_button_group.addButton(t_keep_button,  action['keep'])
-            t_delete_button = QPushButton(self)
-            t_delete_button.setCheckable(True)
-            t_delete_button.setFlat(True)
-            t_delete_button.setToolTip(self.delete_help_text_short)
-            t_delete_button.setIcon(QIcon(os.path.join(icons_dir,
-                                                       'delete.png')))
-            layout.addWidget(t_delete_button, num, self.delete_column)
-            t_button_group.addButton(t_delete_button,  action['delete'])
-            t_blacklist_button = QPushButton(self)
-            t_blacklist_button.setCheckable(True)
-            t_blacklist_button.setFlat(True)
-            t_blacklist_button.setToolTip(self.blacklist_help_text_short)
-            t_blacklist_button.setIcon(QIcon(os.path.join(icons_dir,
-                                                          'blacklist.png')))
-            if self.show_skull_and_bones:
-                layout.addWidget(
+        outer_layout.addWidget(dialog_buttons)
+
+    def play_new(self, idx):
+        """Play the downloaded file in row idx."""
+        # Stop what is playing now. Otherwise the file is only played
+        # after that, and comparing files takes ages.
+        clearAudioQueue()
+        play(self.list[idx][3])
+
+    def play_old(self, idx):
+        """Play what is in the audio field of row idx now."""
+        clearAudioQueue()
+        playFromText(self.note[self.list[idx][1]])
+
+    def poll_download(self):
+        """Add the files the download has brought in since last time."""
+        while True:
+            try:
+                result = self.download.results.get_nowait()
+            except Queue.Empty:
+                return
+            if result is None:
+                self.download_done()
+                return
+            retrieved_file, show_skull_and_bones = result
+            if show_skull_and_bones:
+                self.show_blacklist_column()
+            self.add_row(retrieved_file)
+
+    def download_done(self):
+        self.timer.stop()
+        self.status_label.hide()
+        if not self.list:
+            # Nothing to show. Close the dialog and let
+            # store_or_blacklist() complain.
+            self.nothing_found = True
+            self.reject()
+
+    def done(self, result):
+        # Don't add any more rows once the user has decided.
+        self.timer.stop()
+        super(ReviewFiles, self).done(result)
+
+    def show_blacklist_column(self):
+        """Show the blacklist buttons, for this and all later rows."""
+        if self.show_skull_and_bones:
+            return
+        self.show_skull_and_bones = True
+        self.blacklist_head_label.show()
+        for num, (t_blacklist_button, dl_hash) \
+                in enumerate(self.blacklist_buttons, 3):
+            if dl_hash:
+                self.grid.addWidget(
                     t_blacklist_button, num, self.blacklist_column)
+                t_blacklist_button.show()
+
+    def add_row(self, retrieved_file):
+        """Add the buttons &c. for one more file."""
+        source, dest, text, dl_fname, dl_hash, extras, icon = retrieved_file
+        self.list.append(retrieved_file)
+        if len(self.list) > 1:
+            self.explanation.setText(
+                _(u'Please select an action for each downloaded file:'))
+        layout = self.grid
+        num = len(self.list) + 2
+        tt_text = self.build_text_help_label(text, source, extras)
+        ico_label = QLabel('', self)
+        ico_label.setToolTip(tt_text)
+        if icon:
+            ico_label.setPixmap(QPixmap.fromImage(icon))
+        layout.addWidget(ico_label, num, 0)
+        tt_label = QLabel(text, self)
+        tt_label.setToolTip(tt_text)
+        layout.addWidget(tt_label, num, 1)
+        if self.hide_text:
+            tt_label.hide()
+        # Play button.
+        t_play_button = QPushButton(self)
+        self.play_button_group.addButton(t_play_button, num - 3)
+        t_play_button.setToolTip(self.play_help)
+        t_play_button.setIcon(QIcon(os.path.join(icons_dir, 'play.png')))
+        layout.addWidget(t_play_button, num, self.play_column)
+        if self.note[dest]:
+            t_play_old_button = QPushButton(self)
+            self.old_play_button_group.addButton(t_play_old_button, num - 3)
+            t_play_old_button.setIcon(
+                QIcon(os.path.join(icons_dir, 'play.png')))
+            if not self.hide_text:
+                t_play_old_button.setToolTip(self.note[dest])
             else:
-                t_blacklist_button.hide()
-            t_button_group.addButton(t_blacklist_button,  action['blacklist'])
-            self.buttons_groups.append(t_button_group)
-        play_button_group.buttonClicked.connect(
-            lambda button: play(self.list[play_button_group.id(button)][3]))
-        old_play_button_group.buttonClicked.connect(
-            lambda button: playFromText(
-                self.note[self.list[old_play_button_group.id(button)][1]]))
+                t_play_old_button.setToolTip(self.play_old_help_short)
+            layout.addWidget(t_play_old_button, num, self.play_old_column)
+        else:
+            dummy_label = QLabel('', self)
+            dummy_label.setToolTip(self.play_old_empty_line_help)
+            layout.addWidget(dummy_label, num, self.play_old_column)
+        # The group where we later look what to do:
+        t_button_group = QButtonGroup(self)
+        t_button_group.setExclusive(True)
+        # Now the four buttons
+        t_add_button = QPushButton(self)
+        t_add_button.setCheckable(True)
+        t_add_button.setChecked(True)
+        t_add_button.setFlat(True)
+        t_add_button.setToolTip(self.add_help_text_short)
+        t_add_button.setIcon(QIcon(os.path.join(icons_dir, 'add.png')))
+        layout.addWidget(t_add_button, num, self.add_column)
+        t_button_group.addButton(t_add_button, action['add'])
+        t_keep_button = QPushButton(self)
+        t_keep_button.setCheckable(True)
+        t_keep_button.setFlat(True)
+        t_keep_button.setToolTip(self.keep_help_text_short)
+        t_keep_button.setIcon(QIcon(os.path.join(icons_dir, 'keep.png')))
+        layout.addWidget(t_keep_button, num, self.keep_column)
+        t_button_group.addButton(t_keep_button,  action['keep'])
+        t_delete_button = QPushButton(self)
+        t_delete_button.setCheckable(True)
+        t_delete_button.setFlat(True)
+        t_delete_button.setToolTip(self.delete_help_text_short)
+        t_delete_button.setIcon(QIcon(os.path.join(icons_dir,
+                                                   'delete.png')))
+        layout.addWidget(t_delete_button, num, self.delete_column)
+        t_button_group.addButton(t_delete_button,  action['delete'])
+        t_blacklist_button = QPushButton(self)
+        t_blacklist_button.setCheckable(True)
+        t_blacklist_button.setFlat(True)
+        t_blacklist_button.setToolTip(self.blacklist_help_text_short)
+        t_blacklist_button.setIcon(QIcon(os.path.join(icons_dir,
+                                                      'blacklist.png')))
+        if self.show_skull_and_bones and dl_hash:
+            # Without a hash we can't blacklist the file.
+            layout.addWidget(
+                t_blacklist_button, num, self.blacklist_column)
+        else:
+            t_blacklist_button.hide()
+        t_button_group.addButton(t_blacklist_button,  action['blacklist'])
+        self.blacklist_buttons.append((t_blacklist_button, dl_hash))
+        self.buttons_groups.append(t_button_group)
 
     def build_text_help_label(self, text, source, extras):
         ret_text = u''
@@ -0,0 +1,55 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""
+The few bits of Anki the tested modules import.
+
+Import this before the add-on modules that import aqt or anki. When
+Anki is there, it is used. Otherwise we put small modules with the
+names those modules import in its place, enough to import them and
+test the parts that don't talk to Anki.
+
+Run the tests from the top folder with
+
+    python -m unittest discover -s tests
+"""
+
+import re
+import sys
+import types
+
+try:
+    import aqt
+    import anki.sound
+    import anki.template
+    import anki.utils
+except ImportError:
+    def module(name, **names):
+        new_module = types.ModuleType(name)
+        new_module.__dict__.update(names)
+        sys.modules[name] = new_module
+        return new_module
+
+    def strip_html(text):
+        return re.sub(r'<[^>]*>', u'', text)
+
+    def strip_sounds(text):
+        return re.sub(r'\[sound:[^]]+\]', u'', text)
+
+    def kanji(text):
+        return re.sub(r' ?([^ >]+?)\[(.+?)\]', r'\1', text)
+
+    def kana(text):
+        return re.sub(r' ?([^ >]+?)\[(.+?)\]', r'\2', text)
+
+    aqt = module('aqt', mw=None)
+    anki = module('anki')
+    anki.utils = module(
+        'anki.utils', isMac=False, stripHTML=strip_html)
+    anki.sound = module('anki.sound', stripSounds=strip_sounds)
+    anki.hooks = module('anki.hooks', addHook=lambda hook, function: None)
+    anki.template = module('anki.template')
+    anki.template.furigana = module(
+        'anki.template.furigana', kanji=kanji, kana=kana)
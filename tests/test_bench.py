@@ -0,0 +1,42 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Replay the recorded pages with the downloaders, see tools/bench.py."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools'))
+import bench
+
+
+class ReplayTest(unittest.TestCase):
+    def test_replay(self):
+        fixtures = bench.Fixtures(bench.fixture_dir)
+        site_runs, notes, unknown = bench.replay(
+            fixtures, 1, [(u'water', 'en', u'')])
+        runs = dict((run['site'], run) for run in site_runs)
+        self.assertEqual(2, runs['WiktionaryDownloader']['files'])
+        self.assertEqual(3, runs['WiktionaryDownloader']['requests'])
+        self.assertEqual(None, runs['WiktionaryDownloader']['error'])
+        self.assertEqual(1, runs['GooglettsDownloader']['files'])
+        self.assertEqual(None, runs['GooglettsDownloader']['error'])
+        # The page also has a button without a title.
+        self.assertEqual(1, runs['MerriamWebsterDownloader']['files'])
+        self.assertEqual(None, runs['MerriamWebsterDownloader']['error'])
+        # Only the recorded sites found anything.
+        self.assertEqual(
+            4, sum(run['files'] for run in site_runs))
+        self.assertEqual(1, len(notes))
+        self.assertTrue(unknown)
+        self.assertFalse([url for url in unknown if url in fixtures.index])
+        summary = bench.summarize(site_runs)
+        self.assertEqual(1, summary['WiktionaryDownloader']['words'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the blacklist of unwanted files."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from downloadaudio import blacklist
+
+# As in the main Anki code.
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+
+class BlacklistTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_values = (
+            blacklist.addon_path, blacklist.bl_file_path,
+            blacklist.bl_log_path, blacklist.hash_file)
+        blacklist.addon_path = self.directory
+        blacklist.bl_file_path = os.path.join(
+            self.directory, 'blacklist.json')
+        blacklist.bl_log_path = os.path.join(self.directory, 'blacklist.log')
+        blacklist.blacklist_hashes = None
+        self.hashed = []
+
+        def hash_file(file_name):
+            self.hashed.append(file_name)
+            return self.old_values[3](file_name)
+        blacklist.hash_file = hash_file
+
+    def tearDown(self):
+        blacklist.addon_path, blacklist.bl_file_path, \
+            blacklist.bl_log_path, blacklist.hash_file = self.old_values
+        blacklist.blacklist_hashes = None
+        shutil.rmtree(self.directory)
+
+    def write_list(self, entries):
+        with open(blacklist.bl_file_path, 'w') as bl_file:
+            json.dump(entries, bl_file)
+
+    def make_file(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as data_file:
+            data_file.write(data)
+        return path
+
+    def hex_hash(self, data):
+        return blacklist.hashlib.sha256(data).hexdigest()
+
+    def test_listed(self):
+        self.write_list([[self.hex_hash('bad'), 3]])
+        self.assertRaises(
+            ValueError, blacklist.get_hash, self.make_file('a', 'bad'))
+        file_hash = blacklist.get_hash(self.make_file('b', 'good'))
+        self.assertEqual(self.hex_hash('good'), file_hash.hexdigest())
+        self.assertEqual(4, file_hash.size)
+
+    def test_size_filter(self):
+        self.write_list([[self.hex_hash('bad'), 3]])
+        self.assertEqual(None, blacklist.get_hash(
+            self.make_file('a', 'good'), need_hash=False))
+        self.assertEqual([], self.hashed)
+        self.assertRaises(
+            ValueError, blacklist.get_hash, self.make_file('b', 'bad'),
+            need_hash=False)
+
+    def test_unsized_entry(self):
+        self.write_list([[self.hex_hash('bad'), 3], self.hex_hash('worse')])
+        # The size is no help while we don't know the size of "worse".
+        good = self.make_file('a', 'good')
+        self.assertNotEqual(
+            None, blacklist.get_hash(good, need_hash=False))
+        self.assertRaises(
+            ValueError, blacklist.get_hash, self.make_file('b', 'worse'),
+            need_hash=False)
+        # Now we do.
+        self.assertEqual(set(), blacklist.unsized_hashes)
+        self.assertEqual(None, blacklist.get_hash(good, need_hash=False))
+        blacklist.blacklist_hashes = None
+        blacklist.load_hashes()
+        self.assertEqual(set(), blacklist.unsized_hashes)
+        self.assertTrue(5 in blacklist.size_index)
+
+    def test_add_black_hash(self):
+        path = self.make_file('a', 'bad')
+        file_hash = blacklist.get_hash(path)
+        blacklist.add_black_hash(file_hash)
+        self.assertRaises(ValueError, blacklist.get_hash, path)
+        blacklist.blacklist_hashes = None
+        self.assertRaises(ValueError, blacklist.get_hash, path)
+        self.assertEqual({file_hash.hexdigest(): 3}, blacklist.blacklist_sizes)
+
+    def test_compaction(self):
+        with open(blacklist.bl_log_path, 'w') as log_file:
+            for number in range(blacklist.compact_after + 1):
+                log_file.write('{0} {1}\n'.format(
+                    self.hex_hash(str(number)), len(str(number))))
+        blacklist.load_hashes()
+        self.assertFalse(os.path.exists(blacklist.bl_log_path))
+        with open(blacklist.bl_file_path, 'r') as bl_file:
+            self.assertEqual(
+                blacklist.compact_after + 1, len(json.load(bl_file)))
+
+    def test_compaction_fails(self):
+        with open(blacklist.bl_log_path, 'w') as log_file:
+            for number in range(blacklist.compact_after + 1):
+                log_file.write(self.hex_hash(str(number)) + '\n')
+        # Can't write the list there.
+        os.mkdir(blacklist.bl_file_path)
+        blacklist.load_hashes()
+        self.assertEqual(
+            blacklist.compact_after + 1, len(blacklist.blacklist_hashes))
+        self.assertTrue(os.path.exists(blacklist.bl_log_path))
+        self.assertEqual(
+            ['blacklist.json', 'blacklist.log'],
+            sorted(os.listdir(self.directory)))
+        self.assertRaises(
+            ValueError, blacklist.get_hash, self.make_file('a', '1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the downloader base class and the download jobs."""
+
+import os
+import unittest
+
+from downloadaudio.downloaders.downloader import AudioDownloader, \
+    DownloadJob
+
+
+class DownloadJobTest(unittest.TestCase):
+    def setUp(self):
+        self.downloader = AudioDownloader()
+        self.downloader.use_temp_files = True
+        self.job = DownloadJob(u'water', u'water', u'', False, 'en')
+
+    def tearDown(self):
+        for path in self.job.files_made:
+            os.remove(path)
+
+    def save(self, data, listed):
+        path, name = self.downloader.save_data(self.job, data)
+        if listed:
+            self.job.downloads_list.append((path, name, {}))
+        return path
+
+    def test_files_made(self):
+        path = self.save('one', True)
+        self.assertEqual([path], self.job.files_made)
+        self.assertEqual(
+            'one', open(path, 'rb').read())
+
+    def test_remove_stray_files(self):
+        listed = self.save('one', True)
+        stray = self.save('two', False)
+        self.job.remove_stray_files()
+        self.assertTrue(os.path.exists(listed))
+        self.assertFalse(os.path.exists(stray))
+        self.assertEqual([listed], self.job.files_made)
+
+    def test_remove_all_files(self):
+        paths = [self.save('one', True), self.save('two', False)]
+        self.job.remove_stray_files(keep_listed=False)
+        self.assertEqual(
+            [False, False], [os.path.exists(path) for path in paths])
+        self.assertEqual([], self.job.files_made)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the index of the names in the media folder."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import anki_stand_in
+from downloadaudio import exists
+
+
+def touch(path):
+    open(path, 'w').close()
+
+
+class MediaIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for name in (u'Water.mp3', u'water_3.mp3', u'Haus.ogg'):
+            touch(os.path.join(self.directory, name))
+        self.index = exists.MediaIndex(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exists_any_case(self):
+        self.assertTrue(self.index.exists(u'water.mp3'))
+        self.assertTrue(self.index.exists(u'HAUS.ogg'))
+        self.assertFalse(self.index.exists(u'water.ogg'))
+
+    def test_normalized(self):
+        self.index.exists(u'water.mp3')
+        with self.index.lock:
+            self.index.add(u'Gr\xfc\xdfe.mp3')
+        # The same, with the umlaut as u + combining diaeresis.
+        self.assertTrue(self.index.exists(u'gru\u0308\xdfe.mp3'))
+
+    def test_free_name(self):
+        self.assertEqual(
+            u'Water_4.mp3', self.index.reserve_free_name(u'Water', u'.mp3'))
+        self.assertEqual(
+            u'Haus.mp3', self.index.reserve_free_name(u'Haus', u'.mp3'))
+
+    def test_reserved_names_not_handed_out_twice(self):
+        names = [self.index.reserve_free_name(u'Haus', u'.mp3')
+                 for dummy in range(3)]
+        self.assertEqual([u'Haus.mp3', u'Haus_1.mp3', u'Haus_2.mp3'], names)
+        self.assertTrue(self.index.exists(u'haus_1.mp3'))
+
+    def new_file(self, name, seconds):
+        touch(os.path.join(self.directory, name))
+        # Make sure the folder gets a new mtime.
+        mtime = time.time() + seconds
+        os.utime(self.directory, (mtime, mtime))
+
+    def test_new_files_seen(self):
+        self.assertFalse(self.index.exists(u'new.mp3'))
+        self.new_file(u'new.mp3', 5)
+        self.assertTrue(self.index.exists(u'new.mp3'))
+        # Also right after the last look.
+        self.new_file(u'newer.mp3', 6)
+        self.assertTrue(self.index.exists(u'newer.mp3'))
+        self.assertEqual(
+            u'newer_1.mp3', self.index.reserve_free_name(u'newer', u'.mp3'))
+
+    def test_own_files_no_rescan(self):
+        scans = []
+        old_listdir = exists.os.listdir
+
+        def listdir(path):
+            scans.append(path)
+            return old_listdir(path)
+        exists.os.listdir = listdir
+        try:
+            for dummy in range(3):
+                name = self.index.reserve_free_name(u'Haus', u'.mp3')
+                touch(os.path.join(self.directory, name))
+                self.index.created(name)
+            self.assertEqual(1, len(scans))
+            self.new_file(u'new.mp3', 5)
+            self.assertTrue(self.index.exists(u'new.mp3'))
+            self.assertEqual(2, len(scans))
+        finally:
+            exists.os.listdir = old_listdir
+
+
+if __name__ == '__main__':
+    unittest.main()
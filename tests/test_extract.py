@@ -0,0 +1,73 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for getting tags from pages."""
+
+import unittest
+
+from downloadaudio.downloaders.extract import Target, decode, extract, \
+    extract_with_soup
+
+
+page = '''<html><head><meta charset="iso-8859-1"></head><body>
+<a id="top"></a>
+<a href="/one.ogg" class="audio big">one</a>
+<img src="x.png"/>
+<a href="/two.mp3" class="big">two</a>
+<span class="audio" data-src="/three.mp3">three</span>
+<p>Gr\xfc\xdfe</p>
+</body></html>
+'''
+
+
+class ExtractTest(unittest.TestCase):
+    def test_targets(self):
+        found = extract(page, dict(
+            links=Target('a', {'href': True}),
+            audio=Target(attrs={'class': 'audio'}),
+            images=Target('img')))
+        self.assertEqual(
+            [u'/one.ogg', u'/two.mp3'], [a['href'] for a in found['links']])
+        self.assertEqual(['a', 'span'], [e.name for e in found['audio']])
+        self.assertEqual(u'/three.mp3', found['audio'][1]['data-src'])
+        self.assertEqual(u'x.png', found['images'][0]['src'])
+        self.assertRaises(KeyError, lambda: found['images'][0]['href'])
+
+    def test_class_is_one_of_the_classes(self):
+        found = extract(page, dict(big=Target('a', {'class': 'big'})))
+        self.assertEqual(2, len(found['big']))
+        found = extract(page, dict(bi=Target('a', {'class': 'bi'})))
+        self.assertEqual([], found['bi'])
+
+    def test_limit(self):
+        found = extract(page, dict(
+            first=Target('a', {'href': True}, limit=1),
+            all=Target('a')))
+        self.assertEqual(1, len(found['first']))
+        self.assertEqual(3, len(found['all']))
+
+    def test_same_as_soup(self):
+        targets = dict(
+            links=Target('a', {'href': True}),
+            audio=Target(attrs={'class': 'audio'}))
+        fast = extract(page, targets)
+        slow = extract_with_soup(decode(page), targets)
+        for name in targets:
+            self.assertEqual(fast[name], slow[name])
+
+    def test_broken_page(self):
+        broken = '<![if !supportLists]><a href="/one.ogg">one</a>'
+        found = extract(broken, dict(links=Target('a', {'href': True})))
+        self.assertEqual([u'/one.ogg'], [a['href'] for a in found['links']])
+
+    def test_decode(self):
+        self.assertTrue(u'Gr\xfc\xdfe' in decode(page))
+        self.assertEqual(u'\xe4', decode('\xc3\xa4'))
+        self.assertEqual(
+            u'\xe4', decode('<meta charset="nonsense">\xc3\xa4')[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
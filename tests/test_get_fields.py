@@ -0,0 +1,104 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for finding the source fields of the audio fields."""
+
+import unittest
+
+import anki_stand_in
+from downloadaudio import get_fields
+
+
+def make_model(names, mod=1, mid=1):
+    return dict(id=mid, mod=mod, flds=[dict(name=name) for name in names])
+
+
+class Note(object):
+    def __init__(self, model, fields):
+        self.the_model = model
+        self.fields = fields
+
+    def model(self):
+        return self.the_model
+
+
+class Card(object):
+    def __init__(self, ord, qfmt, afmt):
+        self.ord = ord
+        self.qfmt = qfmt
+        self.afmt = afmt
+
+    def template(self):
+        return dict(qfmt=self.qfmt, afmt=self.afmt)
+
+
+class FieldPlanTest(unittest.TestCase):
+    def setUp(self):
+        get_fields.model_plans.clear()
+        self.plan = get_fields.FieldPlan(make_model(
+            [u'Expression', u'Reading', u'Audio', u'Example',
+             u'Example_Audio', u'Meaning']))
+
+    def test_audio_fields(self):
+        self.assertEqual(
+            [u'Audio', u'Example_Audio'], self.plan.audio_fields)
+
+    def test_source_index(self):
+        self.assertEqual(0, self.plan.source_index(u'Audio', False))
+        self.assertEqual(1, self.plan.source_index(u'Audio', True))
+        self.assertEqual(3, self.plan.source_index(u'Example_Audio', False))
+
+    def test_no_source(self):
+        self.assertRaises(
+            KeyError, self.plan.source_index, u'Example_Audio', True)
+        self.assertRaises(KeyError, self.plan.source_index, u'Meaning', False)
+        # Cached, and still raised.
+        self.assertTrue(isinstance(
+            self.plan.sources[(u'Meaning', False)], KeyError))
+        self.assertRaises(KeyError, self.plan.source_index, u'Meaning', False)
+
+    def test_first_field(self):
+        plan = get_fields.FieldPlan(make_model([u'Front', u'Sound']))
+        self.assertEqual(0, plan.source_index(u'Sound', False))
+        self.assertRaises(KeyError, plan.source_index, u'Sound', True)
+
+    def test_side_audio_fields(self):
+        card = Card(
+            0, u'{{Expression}}{{Audio}}{{Nonexistent Audio}}',
+            u'{{FrontSide}}<hr id=answer>{{#Example_Audio}}'
+            u'{{Example_Audio}}{{/Example_Audio}}{{text:Audio}}')
+        self.assertEqual(
+            [u'Audio'], self.plan.side_audio_fields(card, 'question'))
+        self.assertEqual(
+            [u'Audio', u'Example_Audio'],
+            sorted(self.plan.side_audio_fields(card, 'answer')))
+
+    def test_get_plan(self):
+        model = make_model([u'Word', u'Audio'])
+        note = Note(model, [u'water', u''])
+        plan = get_fields.get_plan(note)
+        self.assertTrue(plan is get_fields.get_plan(note))
+        model['mod'] = 2
+        model['flds'].insert(0, dict(name=u'Picture'))
+        new_plan = get_fields.get_plan(note)
+        self.assertFalse(plan is new_plan)
+        self.assertEqual(1, new_plan.source_index(u'Audio', False))
+
+    def test_field_data(self):
+        model = make_model([u'Expression', u'Reading', u'Audio'])
+        note = Note(model, [u'<b>今度</b>', u'今度[こんど]', u''])
+        self.assertEqual(
+            (u'Expression', u'Audio', u'今度', u'今度', u'今度', False),
+            get_fields.field_data(note, u'Audio', False))
+        self.assertEqual(
+            (u'Reading', u'Audio', u'今度[こんど]', u'今度', u'こんど', True),
+            get_fields.field_data(note, u'Audio', True))
+        note.fields[0] = u''
+        self.assertRaises(
+            ValueError, get_fields.field_data, note, u'Audio', False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the cache of web pages."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from downloadaudio.downloaders import http_cache
+from downloadaudio.downloaders.http_pool import Response
+
+
+class Site(object):
+    """
+    Answer with a page and count the requests.
+
+    Answer "304 Not Modified" to requests with the right ETag when
+    not_modified is set.
+    """
+    def __init__(self):
+        self.requests = []
+        self.not_modified = False
+        self.headers = {'etag': '"1"', 'last-modified': 'Tue, 1 Oct 2013'}
+
+    def __call__(self, url, headers):
+        self.requests.append(headers)
+        if self.not_modified and '"1"' == headers.get('If-None-Match'):
+            return Response(url, 304, 'Not Modified', {}, '')
+        return Response(url, 200, 'OK', self.headers, 'page for ' + url)
+
+
+class HTTPCacheTest(unittest.TestCase):
+    url = 'http://example.com/word'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = http_cache.HTTPCache(self.directory)
+        self.site = Site()
+        self.old_ttls = http_cache.default_ttl, http_cache.site_ttls
+        http_cache.default_ttl = 100
+        http_cache.site_ttls = {'example.org': 1000}
+
+    def tearDown(self):
+        http_cache.default_ttl, http_cache.site_ttls = self.old_ttls
+        shutil.rmtree(self.directory)
+
+    def age(self, url, seconds):
+        """Make the cached response for url seconds older."""
+        key = self.cache.key(url, {})
+        meta = self.cache.load_meta(key)
+        meta['stored'] -= seconds
+        self.cache.write_meta(key, meta)
+
+    def test_cached(self):
+        first = self.cache.get(self.url, {}, self.site)
+        second = self.cache.get(self.url, {}, self.site)
+        self.assertEqual(1, len(self.site.requests))
+        self.assertEqual(first.data, second.data)
+
+    def test_ttl(self):
+        other_url = 'http://example.org/word'
+        for url in (self.url, other_url):
+            self.cache.get(url, {}, self.site)
+            self.age(url, 200)
+            self.cache.get(url, {}, self.site)
+        # Too old for example.com, still fresh for example.org.
+        self.assertEqual(3, len(self.site.requests))
+        self.assertEqual('"1"', self.site.requests[1]['If-None-Match'])
+        self.assertEqual({}, self.site.requests[2])
+
+    def test_revalidated(self):
+        self.cache.get(self.url, {}, self.site)
+        self.age(self.url, 200)
+        self.site.not_modified = True
+        response = self.cache.get(self.url, {}, self.site)
+        self.assertEqual(
+            {'If-None-Match': '"1"', 'If-Modified-Since': 'Tue, 1 Oct 2013'},
+            self.site.requests[1])
+        self.assertEqual(200, response.code)
+        self.assertEqual('page for ' + self.url, response.data)
+        # Fresh again.
+        self.cache.get(self.url, {}, self.site)
+        self.assertEqual(2, len(self.site.requests))
+
+    def test_not_modified_data_gone(self):
+        self.cache.get(self.url, {}, self.site)
+        self.age(self.url, 200)
+        os.remove(self.cache.path(self.cache.key(self.url, {}), '.data'))
+        self.site.not_modified = True
+        response = self.cache.get(self.url, {}, self.site)
+        self.assertEqual('page for ' + self.url, response.data)
+        # Asked again without the conditional headers.
+        self.assertEqual({}, self.site.requests[-1])
+        self.assertEqual(3, len(self.site.requests))
+
+    def test_no_store(self):
+        self.site.headers = {'cache-control': 'private, no-store'}
+        self.cache.get(self.url, {}, self.site)
+        self.cache.get(self.url, {}, self.site)
+        self.assertEqual(2, len(self.site.requests))
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_evict_least_recently_used(self):
+        urls = ['http://example.com/' + name for name in 'abc']
+        # Room for two pages.
+        self.cache.max_size = 2 * len('page for ' + urls[0])
+        self.cache.get(urls[0], {}, self.site)
+        self.cache.get(urls[1], {}, self.site)
+        # Use a again, so that b is the oldest one now.
+        self.cache.get(urls[0], {}, self.site)
+        self.cache.get(urls[2], {}, self.site)
+        self.assertEqual(3, len(self.site.requests))
+        kept = [os.path.exists(self.cache.path(
+            self.cache.key(url, {}), '.data')) for url in urls]
+        self.assertEqual([True, False, True], kept)
+        self.assertFalse(os.path.exists(self.cache.path(
+            self.cache.key(urls[1], {}), '.meta')))
+
+    def test_write_fails(self):
+        key = self.cache.key(self.url, {})
+        # Can't replace a folder with a file.
+        os.mkdir(self.cache.path(key, '.data'))
+        response = self.cache.get(self.url, {}, self.site)
+        self.assertEqual('page for ' + self.url, response.data)
+        self.assertEqual(
+            [], [name for name in os.listdir(self.directory)
+                 if name.endswith('.tmp')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the pool of HTTP connections."""
+
+import unittest
+
+from downloadaudio.downloaders import http_pool
+
+
+class FakeConnection(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    key = ('http', 'example.com', None)
+
+    def setUp(self):
+        self.old_values = http_pool.pool_size, http_pool.idle_timeout
+
+    def tearDown(self):
+        http_pool.pool_size, http_pool.idle_timeout = self.old_values
+
+    def test_reuse(self):
+        pool = http_pool.ConnectionPool()
+        connection = FakeConnection()
+        pool.put_connection(self.key, connection)
+        self.assertEqual((connection, True), pool.get_connection(self.key))
+
+    def test_size_changed_later(self):
+        pool = http_pool.ConnectionPool()
+        http_pool.pool_size = 1
+        connections = [FakeConnection(), FakeConnection()]
+        for connection in connections:
+            pool.put_connection(self.key, connection)
+        self.assertEqual([False, True], [c.closed for c in connections])
+
+    def test_timeout_changed_later(self):
+        pool = http_pool.ConnectionPool()
+        connection = FakeConnection()
+        pool.put_connection(self.key, connection)
+        http_pool.idle_timeout = -1
+        new_connection, reused = pool.get_connection(self.key)
+        self.assertFalse(reused)
+        self.assertTrue(connection.closed)
+
+    def test_own_size(self):
+        pool = http_pool.ConnectionPool(size=0)
+        connection = FakeConnection()
+        pool.put_connection(self.key, connection)
+        self.assertTrue(connection.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
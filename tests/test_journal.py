@@ -0,0 +1,145 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the batch download journal."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from downloadaudio import journal
+
+
+def touch(path):
+    open(path, 'w').close()
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_journal_dir = journal.journal_dir
+        journal.journal_dir = self.directory
+        self.media_dir = os.path.join(self.directory, 'collection.media')
+        os.mkdir(self.media_dir)
+
+    def tearDown(self):
+        journal.journal_dir = self.old_journal_dir
+        shutil.rmtree(self.directory)
+
+    def crash(self, batch):
+        """Stop writing the journal, without finishing the batch."""
+        batch.journal_file.close()
+
+    def media(self, name):
+        return os.path.join(self.media_dir, name)
+
+    def run_batch(self):
+        """Write a batch with one saved and one unsaved note."""
+        batch = journal.BatchJournal(self.media_dir)
+        batch.start([1, 2])
+        for nid, name in ((1, u'saved.mp3'), (2, u'lost.mp3')):
+            site_journal = batch.for_note(nid).for_site(u'Audio', u'Site')
+            temp_path = os.path.join(site_journal.temp_dir, name)
+            site_journal.fetched(temp_path)
+            touch(temp_path)
+            site_journal.moved(name)
+            touch(self.media(name))
+            site_journal.processed(temp_path, name)
+        batch.committing([1], [u'saved.mp3'])
+        batch.committed([1], [u'saved.mp3'])
+        self.crash(batch)
+        return batch
+
+    def test_read_journal(self):
+        batch = self.run_batch()
+        state = journal.read_journal(batch.path)
+        self.assertEqual([1, 2], state['nids'])
+        self.assertEqual(set([1]), state['done'])
+        self.assertEqual([u'saved.mp3', u'lost.mp3'], state['names'])
+        self.assertEqual(set([u'saved.mp3']), state['attached'])
+        self.assertEqual(batch.temp_dir, state['temp_dir'])
+        self.assertEqual(2, len(state['paths']))
+        self.assertTrue(journal.belongs_to(state, self.media_dir))
+
+    def test_field_and_site(self):
+        batch = self.run_batch()
+        with open(batch.path) as journal_file:
+            records = [journal.json.loads(line) for line in journal_file]
+        moved = [record for record in records if 'moved' == record['op']]
+        self.assertEqual(
+            [(1, u'Audio', u'Site'), (2, u'Audio', u'Site')],
+            [(record['nid'], record['field'], record['site'])
+             for record in moved])
+        self.assertEqual(
+            2, len([record for record in records
+                    if 'processed' == record['op']]))
+
+    def crash_in_save(self, batch):
+        # Go on writing after run_batch(), then crash again.
+        batch.journal_file = None
+        batch.committing([2], [u'lost.mp3'])
+        self.crash(batch)
+        return journal.read_journal(batch.path)
+
+    def test_crash_in_save_went_through(self):
+        batch = self.run_batch()
+        state = self.crash_in_save(batch)
+        self.assertEqual([([2], [u'lost.mp3'])], state['pending'])
+        journal.settle_pending(state, lambda name: u'lost.mp3' == name)
+        self.assertEqual(set([1, 2]), state['done'])
+        self.assertEqual(0, journal.collect_garbage(state, self.media_dir))
+        self.assertTrue(os.path.exists(self.media(u'lost.mp3')))
+
+    def test_crash_in_save_lost(self):
+        batch = self.run_batch()
+        state = self.crash_in_save(batch)
+        journal.settle_pending(state, lambda name: False)
+        self.assertEqual(set([1]), state['done'])
+        self.assertEqual(1, journal.collect_garbage(state, self.media_dir))
+        self.assertFalse(os.path.exists(self.media(u'lost.mp3')))
+
+    def test_cut_off_line(self):
+        batch = self.run_batch()
+        with open(batch.path, 'a') as journal_file:
+            journal_file.write('{"op": "committed", "ni')
+        state = journal.read_journal(batch.path)
+        self.assertEqual(set([1]), state['done'])
+
+    def test_no_journal(self):
+        self.assertEqual(
+            None, journal.read_journal(journal.journal_path(self.media_dir)))
+
+    def test_collect_garbage(self):
+        batch = self.run_batch()
+        state = journal.read_journal(batch.path)
+        self.assertEqual(1, journal.collect_garbage(state, self.media_dir))
+        self.assertTrue(os.path.exists(self.media(u'saved.mp3')))
+        self.assertFalse(os.path.exists(self.media(u'lost.mp3')))
+        self.assertFalse(os.path.exists(batch.temp_dir))
+
+    def test_other_profile(self):
+        batch = self.run_batch()
+        state = journal.read_journal(batch.path)
+        other_dir = os.path.join(self.directory, 'other.media')
+        os.mkdir(other_dir)
+        self.assertFalse(journal.belongs_to(state, other_dir))
+        self.assertEqual(0, journal.collect_garbage(state, other_dir))
+        self.assertTrue(os.path.exists(self.media(u'lost.mp3')))
+        self.assertTrue(os.path.exists(batch.temp_dir))
+        self.assertNotEqual(
+            journal.journal_path(self.media_dir),
+            journal.journal_path(other_dir))
+
+    def test_finish(self):
+        batch = journal.BatchJournal(self.media_dir)
+        batch.start([1])
+        batch.finish()
+        self.assertFalse(os.path.exists(batch.path))
+        self.assertFalse(os.path.exists(batch.temp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the language of a note."""
+
+import unittest
+
+import anki_stand_in
+from downloadaudio import language
+
+
+class Decks(object):
+    """Two decks with one conf, and one with another conf."""
+    def __init__(self):
+        self.decks = {1: dict(id=1, conf=1), 2: dict(id=2, conf=1),
+                      3: dict(id=3, conf=2)}
+        self.confs = {1: {language.al_code_code: 'de'}, 2: {}}
+        self.conf_lookups = 0
+
+    def get(self, did):
+        return self.decks.get(did, self.decks[1])
+
+    def confForDid(self, did):
+        self.conf_lookups += 1
+        return self.confs[self.decks[did]['conf']]
+
+
+class Stand(object):
+    pass
+
+
+class Note(object):
+    def __init__(self, did, tags=()):
+        self.did = did
+        self.tags = list(tags)
+
+    def model(self):
+        return dict(did=self.did)
+
+
+class LanguageTest(unittest.TestCase):
+    def setUp(self):
+        self.old_mw = language.mw
+        language.mw = Stand()
+        language.mw.col = Stand()
+        self.decks = language.mw.col.decks = Decks()
+        language.forget_deck_languages()
+
+    def tearDown(self):
+        language.mw = self.old_mw
+        language.forget_deck_languages()
+
+    def test_cached_by_conf(self):
+        self.assertEqual('de', language.get_language_code(note=Note(1)))
+        self.assertEqual('de', language.get_language_code(note=Note(2)))
+        self.assertEqual(1, self.decks.conf_lookups)
+        self.assertEqual(
+            language.default_audio_language_code,
+            language.get_language_code(note=Note(3)))
+        self.assertEqual(2, self.decks.conf_lookups)
+
+    def test_tag_first(self):
+        self.assertEqual(
+            'fr', language.get_language_code(note=Note(1, ['lang_FR'])))
+        self.assertEqual(0, self.decks.conf_lookups)
+
+    def test_deck_moved(self):
+        language.get_language_code(note=Note(3))
+        self.decks.decks[3]['conf'] = 1
+        self.assertEqual('de', language.get_language_code(note=Note(3)))
+
+    def test_forget(self):
+        language.get_language_code(note=Note(1))
+        self.decks.confs[1][language.al_code_code] = 'es'
+        self.assertEqual('de', language.get_language_code(note=Note(1)))
+        language.forget_deck_languages()
+        self.assertEqual('es', language.get_language_code(note=Note(1)))
+        self.assertEqual(2, self.decks.conf_lookups)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the store of sites that had nothing for a word."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from downloadaudio.downloaders import misses
+
+
+class MissCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'misses.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_add_and_remove(self):
+        cache = misses.MissCache(self.path)
+        self.assertFalse(cache.is_miss('Site', 'en', u'water'))
+        cache.add_misses([('Site', 'en', u'water'), ('Site', 'de', u'Haus')])
+        self.assertTrue(cache.is_miss('Site', 'en', u'water'))
+        self.assertTrue(cache.is_miss('Site', 'de', u'Haus'))
+        self.assertFalse(cache.is_miss('Site', 'de', u'water'))
+        self.assertFalse(cache.is_miss('Other', 'en', u'water'))
+        cache.remove_misses([('Site', 'en', u'water')])
+        self.assertFalse(cache.is_miss('Site', 'en', u'water'))
+        self.assertTrue(cache.is_miss('Site', 'de', u'Haus'))
+
+    def test_kept_on_disk(self):
+        misses.MissCache(self.path).add_misses([('Site', 'en', u'water')])
+        self.assertTrue(
+            misses.MissCache(self.path).is_miss('Site', 'en', u'water'))
+
+    def test_expired(self):
+        misses.MissCache(self.path).add_misses([('Site', 'en', u'water')])
+        self.assertFalse(misses.MissCache(self.path, expiry=0).is_miss(
+            'Site', 'en', u'water'))
+
+    def test_request_text(self):
+        class Job(object):
+            split = False
+            word = u'water'
+            base = u'今度'
+            ruby = u'こんど'
+        self.assertEqual(u'water', misses.request_text(Job()))
+        Job.split = True
+        self.assertEqual(u'今度\tこんど', misses.request_text(Job()))
+
+
+if __name__ == '__main__':
+    unittest.main()
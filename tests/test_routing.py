@@ -0,0 +1,40 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the site statistics."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from downloadaudio.downloaders import routing
+
+
+class SiteStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'site_stats.json')
+        self.stats = routing.SiteStats(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tries(self):
+        return routing.SiteStats(self.path).entry('Site', 'en')['tries']
+
+    def test_save_not_too_often(self):
+        self.stats.record('Site', 'en', True, 0.5)
+        self.stats.save()
+        self.stats.record('Site', 'en', False, 0.5)
+        self.stats.save()
+        self.assertEqual(1, self.tries())
+        self.stats.save(force=True)
+        self.assertEqual(2, self.tries())
+        self.assertFalse(self.stats.dirty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the store of site icons."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from downloadaudio.downloaders import site_icons
+
+
+class IconStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = site_icons.IconStore(self.directory)
+        self.old_values = site_icons.with_pyqt, site_icons.make_image
+        # We don't need real QImages here.
+        site_icons.with_pyqt = True
+        site_icons.make_image = lambda data: data or None
+
+    def tearDown(self):
+        site_icons.with_pyqt, site_icons.make_image = self.old_values
+        shutil.rmtree(self.directory)
+
+    def test_kept_on_disk(self):
+        self.assertEqual(
+            'icon', self.store.get('Site', None, lambda: 'icon'))
+        self.assertTrue(os.path.exists(self.store.path('Site')))
+        other_store = site_icons.IconStore(self.directory)
+        self.assertEqual(
+            'icon', other_store.get('Site', None, lambda: 'not asked'))
+
+    def test_no_icon(self):
+        self.assertEqual(None, self.store.get('Site', 'de', lambda: None))
+        self.assertEqual(
+            0, os.path.getsize(self.store.path(u'Site_de')))
+
+    def test_loaded_once(self):
+        calls = []
+        go = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            go.wait(10)
+            return 'icon'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.store.get('Site', None, fetch))) for dummy in range(4)]
+        for thread in threads:
+            thread.start()
+        go.set()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['icon'] * 4, results)
+        self.assertEqual({}, self.store.loading)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the rate limiter and circuit breaker."""
+
+import socket
+import threading
+import unittest
+
+from downloadaudio.downloaders import throttle
+
+
+class FakeResponse(object):
+    def __init__(self, code, headers=None):
+        self.code = code
+        self.headers = headers or {}
+
+
+class Requests(object):
+    """Answer with the given responses or errors, one after the other."""
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.old_values = (
+            throttle.base_backoff, throttle.default_rate,
+            throttle.default_burst, throttle.host_rates)
+        throttle.base_backoff = 0
+        throttle.default_rate = 1000.0
+        throttle.default_burst = 10
+        throttle.host_rates = {}
+        throttle.host_states.clear()
+        throttle.watch(None)
+
+    def tearDown(self):
+        throttle.base_backoff, throttle.default_rate, \
+            throttle.default_burst, throttle.host_rates = self.old_values
+        throttle.host_states.clear()
+        throttle.watch(None)
+
+    def test_burst_then_wait(self):
+        state = throttle.HostState('host', 100.0, 2)
+        state.acquire()
+        state.acquire()
+        self.assertEqual(0, state.waited)
+        state.acquire()
+        self.assertTrue(state.waited > 0)
+        self.assertEqual(3, state.requests)
+
+    def test_retry_codes(self):
+        request = Requests(FakeResponse(503), FakeResponse(200))
+        response = throttle.call('http://example.com/a', request)
+        self.assertEqual(200, response.code)
+        self.assertEqual(2, request.count)
+
+    def test_not_found_is_no_failure(self):
+        request = Requests(FakeResponse(404))
+        response = throttle.call('http://example.com/a', request)
+        self.assertEqual(404, response.code)
+        self.assertEqual(1, request.count)
+        self.assertEqual(0, throttle.host_state('example.com').failures)
+
+    def test_last_error_raised(self):
+        request = Requests(*[socket.error('down')] * 3)
+        self.assertRaises(
+            socket.error, throttle.call, 'http://example.com/a', request)
+        self.assertEqual(1 + throttle.max_retries, request.count)
+
+    def test_retry_after(self):
+        self.assertEqual(
+            3.0, throttle.backoff(0, FakeResponse(429, {'retry-after': '3'})))
+        self.assertEqual(
+            throttle.max_backoff,
+            throttle.backoff(0, FakeResponse(429, {'retry-after': '9999'})))
+
+    def open_breaker(self, host):
+        state = throttle.host_state(host)
+        for dummy in range(throttle.failure_threshold):
+            state.failure()
+        return state
+
+    def test_breaker_open(self):
+        self.open_breaker('example.com')
+        request = Requests(FakeResponse(200))
+        self.assertRaises(
+            throttle.HostDownError,
+            throttle.call, 'http://example.com/a', request)
+        self.assertEqual(0, request.count)
+
+    def test_breaker_trial(self):
+        state = self.open_breaker('example.com')
+        state.open_until = 0
+        self.assertEqual('half-open', state.state()['breaker'])
+        response = throttle.call(
+            'http://example.com/a', Requests(FakeResponse(200)))
+        self.assertEqual(200, response.code)
+        self.assertEqual('closed', state.state()['breaker'])
+
+    def test_trial_reset_on_odd_error(self):
+        state = self.open_breaker('example.com')
+        state.open_until = 0
+        self.assertRaises(
+            ValueError, throttle.call, 'http://example.com/a',
+            Requests(ValueError('odd')))
+        self.assertEqual(None, state.trial)
+        # The next request may try again.
+        response = throttle.call(
+            'http://example.com/a', Requests(FakeResponse(200)))
+        self.assertEqual(200, response.code)
+
+    def test_cancelled(self):
+        cancelled = threading.Event()
+        cancelled.set()
+        throttle.watch(cancelled)
+        request = Requests(FakeResponse(200))
+        self.assertRaises(
+            throttle.RequestCancelled,
+            throttle.call, 'http://example.com/a', request)
+        self.assertEqual(0, request.count)
+
+    def test_cancel_stops_retries(self):
+        cancelled = threading.Event()
+        throttle.watch(cancelled)
+
+        def request():
+            cancelled.set()
+            return FakeResponse(503)
+        self.assertRaises(
+            throttle.RequestCancelled,
+            throttle.call, 'http://example.com/a', request)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""Tests for the pool of worker threads."""
+
+import threading
+import unittest
+
+from downloadaudio.downloaders.workers import CancelledError, WorkerPool
+
+
+class WorkersTest(unittest.TestCase):
+    def test_map_in_order(self):
+        pool = WorkerPool(3)
+        self.assertEqual(
+            [0, 1, 4, 9, 16], pool.map(lambda x: x * x, range(5)))
+
+    def test_exception(self):
+        pool = WorkerPool(2)
+        self.assertRaises(
+            ZeroDivisionError, pool.map, lambda x: 1 / x, [1, 0])
+
+    def test_imap_unordered_as_they_come(self):
+        pool = WorkerPool(2)
+        go = threading.Event()
+
+        def slow_or_fast(item):
+            if 'slow' == item:
+                go.wait(10)
+            return item
+        results = pool.imap_unordered(slow_or_fast, ['slow', 'fast'])
+        self.assertEqual('fast', next(results))
+        go.set()
+        self.assertEqual('slow', next(results))
+        self.assertRaises(StopIteration, next, results)
+
+    def test_imap_unordered_all(self):
+        pool = WorkerPool(4)
+        self.assertEqual(
+            range(20), sorted(pool.imap_unordered(lambda x: x, range(20))))
+
+    def test_imap_unordered_cancelled(self):
+        pool = WorkerPool(1)
+        started = threading.Event()
+        go = threading.Event()
+
+        def busy():
+            started.set()
+            go.wait(10)
+        # Keep the only thread busy.
+        pool.submit(busy)
+        started.wait(10)
+        results = pool.imap_unordered(lambda x: x, [1])
+        outcome = []
+
+        def first():
+            try:
+                outcome.append(next(results))
+            except CancelledError:
+                outcome.append('cancelled')
+        thread = threading.Thread(target=first)
+        thread.start()
+        # The generator submits the task when it is first asked.
+        for dummy in range(1000):
+            if pool.queue.qsize():
+                break
+            go.wait(0.01)
+        pool.cancel()
+        go.set()
+        thread.join(10)
+        self.assertEqual(['cancelled'], outcome)
+
+
+if __name__ == '__main__':
+    unittest.main()
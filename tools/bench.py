@@ -0,0 +1,422 @@
+#!/usr/bin/env python
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Copyright © 2013 Roland Sieker, <ospalh@gmail.com>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/copyleft/agpl.html
+
+"""
+Measure the downloaders without asking the real sites.
+
+First record the pages and audio files the downloaders load for a
+few words:
+
+    python tools/bench.py record
+
+Then replay them from a local HTTP server as often as you like:
+
+    python tools/bench.py replay
+
+For each downloader this shows the time per word, the number of
+requests and bytes, and the time spent outside the requests, which
+is mostly parsing. It also shows the time for a whole note, with all
+the downloaders for its language running at the same time. Every
+replay run is appended to bench_history.jsonl, and compared with the
+run before.
+
+A small recording is kept in tools/bench_fixtures, so replay works
+without the sites. tests/test_bench.py replays it, too. Record again
+when a downloader changes what it asks for.
+
+This is not part of the add-on. It needs BeautifulSoup, but not Anki.
+"""
+
+import argparse
+import BaseHTTPServer
+import hashlib
+import os
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# As in the main Anki code.
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if __name__ == '__main__':
+    # Run as a script. Find the add-on next to us.
+    sys.path.insert(0, os.path.dirname(tools_dir))
+
+from downloadaudio.downloaders import http_cache, http_pool, routing, \
+    throttle
+from downloadaudio.downloaders.downloader import DownloadJob
+from downloadaudio.downloaders.beolingus import BeolingusDownloader
+from downloadaudio.downloaders.duden import DudenDownloader
+from downloadaudio.downloaders.google_tts import GooglettsDownloader
+from downloadaudio.downloaders.japanesepod import JapanesepodDownloader
+from downloadaudio.downloaders.macmillan_british import \
+    MacmillanBritishDownloader
+from downloadaudio.downloaders.mw import MerriamWebsterDownloader
+from downloadaudio.downloaders.oaad import OaadDownloader
+from downloadaudio.downloaders.wiktionary import WiktionaryDownloader
+from downloadaudio.downloaders.workers import WorkerPool
+
+
+fixture_dir = os.path.join(tools_dir, 'bench_fixtures')
+"""Where we keep the recorded responses."""
+
+history_path = os.path.join(tools_dir, 'bench_history.jsonl')
+"""Where we keep the results of the replay runs."""
+
+bench_downloaders = [
+    MerriamWebsterDownloader(),
+    WiktionaryDownloader(),
+    DudenDownloader(),
+    OaadDownloader(),
+    BeolingusDownloader(),
+    MacmillanBritishDownloader(),
+    JapanesepodDownloader(),
+    GooglettsDownloader(),
+]
+"""The downloaders we measure. Also the ones not in the normal list."""
+
+bench_words = [
+    # text, language, reading
+    (u'water', 'en', u''),
+]
+"""
+The words we download. Each word is one note.
+
+Only words we have recordings for. The others would just measure how
+fast our replay server says 404.
+"""
+
+more_words = [
+    (u'example', 'en', u''),
+    (u'Haus', 'de', u''),
+    (u'sprechen', 'de', u''),
+    (u'casa', 'es', u''),
+    (u'今度', 'ja', u'こんど'),
+]
+"""
+Words to add to bench_words once they are recorded.
+
+Record them with the sites reachable, then move them up.
+"""
+
+
+class Fixtures(object):
+    """
+    Recorded responses, by URL.
+
+    index.json maps the URL to code, message and headers, the body is
+    kept in a file named after the hash of the URL.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path(), 'r') as index_file:
+                self.index = json.load(index_file)
+        except IOError:
+            self.index = {}
+
+    def index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def data_name(self, url):
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return hashlib.sha1(url).hexdigest() + '.data'
+
+    def add(self, url, response):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(os.path.join(
+                self.directory, self.data_name(url)), 'wb') as data_file:
+            data_file.write(response.data)
+        with self.lock:
+            self.index[url] = dict(
+                code=response.code, msg=response.msg,
+                headers=response.headers)
+
+    def get(self, url):
+        """Return (code, msg, headers, data) for url, or None."""
+        try:
+            entry = self.index[url]
+        except KeyError:
+            return None
+        with open(os.path.join(
+                self.directory, self.data_name(url)), 'rb') as data_file:
+            data = data_file.read()
+        return entry['code'], entry['msg'], entry['headers'], data
+
+    def save(self):
+        with open(self.index_path(), 'w') as index_file:
+            json.dump(self.index, index_file, indent=1, sort_keys=True)
+
+
+class ReplayHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer requests with the recorded responses."""
+    # Keep-alive, like the real sites.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        fixture = self.server.fixtures.get(self.path)
+        if fixture is None:
+            self.server.unknown.append(self.path)
+            code, msg, headers, data = 404, 'Not recorded', {}, ''
+        else:
+            code, msg, headers, data = fixture
+        self.send_response(code, msg)
+        for name, value in headers.items():
+            if name not in ('content-length', 'transfer-encoding',
+                            'connection', 'content-encoding'):
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), ReplayHandler)
+        self.fixtures = fixtures
+        self.unknown = []
+
+
+class Meter(object):
+    """
+    Count requests, bytes and the time spent in them, per thread.
+
+    Installed in place of http_pool.get. When fixtures is set, the
+    responses are recorded, too.
+    """
+    def __init__(self, fetch, fixtures=None):
+        self.fetch = fetch
+        self.fixtures = fixtures
+        self.local = threading.local()
+
+    def reset(self):
+        self.local.requests = 0
+        self.local.bytes = 0
+        self.local.time = 0.0
+
+    def __call__(self, url, headers=None):
+        if not hasattr(self.local, 'requests'):
+            # A thread we didn't start, e.g. for a site icon.
+            self.reset()
+        start = time.time()
+        response = self.fetch(url, headers)
+        self.local.time += time.time() - start
+        self.local.requests += 1
+        self.local.bytes += len(response.data)
+        if self.fixtures is not None:
+            self.fixtures.add(url, response)
+        return response
+
+    def results(self):
+        return dict(requests=self.local.requests, bytes=self.local.bytes,
+                    fetch_time=self.local.time)
+
+
+def run_downloader(downloader, word, meter):
+    """Download one word with one downloader, return the measurements."""
+    text, language, reading = word
+    job = DownloadJob(text, text, reading, bool(reading), language)
+    meter.reset()
+    start = time.time()
+    try:
+        downloader.download_files(job)
+        error = None
+    except Exception as e:
+        error = unicode(e)
+    total = time.time() - start
+    for temp_path, dummy_name, dummy_extras in job.downloads_list:
+        os.remove(temp_path)
+    results = meter.results()
+    results.update(
+        site=routing.site_name(downloader), text=text, time=total,
+        parse_time=total - results['fetch_time'],
+        files=len(job.downloads_list), error=error)
+    return results
+
+
+def run_note(word, router, meter, pool):
+    """Download one word with all its downloaders at the same time."""
+    start = time.time()
+    site_results = pool.map(
+        lambda downloader: run_downloader(downloader, word, meter),
+        router.candidates(word[1]))
+    return dict(
+        text=word[0], time=time.time() - start,
+        requests=sum(r['requests'] for r in site_results))
+
+
+def summarize(site_runs):
+    """Return per-site averages of the measurements."""
+    summary = {}
+    for run in site_runs:
+        site = summary.setdefault(run['site'], dict(
+            words=0, time=0.0, parse_time=0.0, requests=0, bytes=0,
+            files=0, errors=0))
+        site['words'] += 1
+        for name in ('time', 'parse_time', 'requests', 'bytes', 'files'):
+            site[name] += run[name]
+        if run['error']:
+            site['errors'] += 1
+    for site in summary.values():
+        for name in ('time', 'parse_time', 'requests', 'bytes'):
+            site[name] = float(site[name]) / site['words']
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=tools_dir).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(summary, notes, previous):
+    old_summary = (previous or {}).get('sites', {})
+    print u'{0:28} {1:>8} {2:>8} {3:>6} {4:>9} {5:>8}'.format(
+        'site', 'ms/word', 'parse', 'req', 'bytes', 'change')
+    for name in sorted(summary):
+        site = summary[name]
+        change = u''
+        if name in old_summary and old_summary[name]['time']:
+            change = u'{0:+.0%}'.format(
+                site['time'] / old_summary[name]['time'] - 1)
+        print u'{0:28} {1:8.1f} {2:8.1f} {3:6.1f} {4:9.0f} {5:>8}'.format(
+            name, 1000 * site['time'], 1000 * site['parse_time'],
+            site['requests'], site['bytes'], change)
+    for note in notes:
+        print u'note {0}: {1:.1f} ms, {2} requests'.format(
+            note['text'], 1000 * note['time'], note['requests']).encode(
+                'utf-8')
+
+
+def setup():
+    """Prepare the downloaders and the add-on for measuring."""
+    for downloader in bench_downloaders:
+        downloader.use_temp_files = True
+    # We want to measure the downloads, not the cache.
+    http_cache.use_cache = False
+    return routing.Router(bench_downloaders, routing.site_stats)
+
+
+def record(fixtures, words=bench_words):
+    """Download the words from the real sites and keep the responses."""
+    router = setup()
+    meter = Meter(http_pool.get, fixtures)
+    http_pool.get = meter
+    try:
+        for word in words:
+            for downloader in router.candidates(word[1]):
+                run_downloader(downloader, word, meter)
+    finally:
+        http_pool.get = meter.fetch
+    fixtures.save()
+
+
+def replay(fixtures, rounds, words=bench_words):
+    """
+    Download the words from the recording.
+
+    Return the runs for each site and word, the runs for each note
+    and the URLs we asked for that were not recorded.
+    """
+    router = setup()
+    server = ReplayServer(fixtures)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    old_limits = (
+        throttle.default_rate, throttle.default_burst, throttle.host_rates)
+    http_pool.stand_in = server.server_address
+    # Don't let the rate limiter spoil the numbers.
+    throttle.default_rate = 1000.0
+    throttle.default_burst = 1000
+    throttle.host_rates = {}
+    meter = Meter(http_pool.get)
+    http_pool.get = meter
+    try:
+        site_runs = []
+        for dummy in range(rounds):
+            for word in words:
+                for downloader in router.candidates(word[1]):
+                    site_runs.append(
+                        run_downloader(downloader, word, meter))
+        pool = WorkerPool(len(bench_downloaders))
+        notes = [run_note(word, router, meter, pool) for word in words]
+    finally:
+        http_pool.get = meter.fetch
+        http_pool.stand_in = None
+        # Drop the connections to our server, or its threads hang on.
+        http_pool.pool.close()
+        throttle.default_rate, throttle.default_burst, \
+            throttle.host_rates = old_limits
+        server.shutdown()
+        server.server_close()
+    return site_runs, notes, server.unknown
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python tools/bench.py',
+        description='Record and replay downloader benchmarks.')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('-d', '--directory', default=fixture_dir,
+                        help='folder for the recordings')
+    parser.add_argument('-r', '--rounds', type=int, default=3,
+                        help='how often each word is downloaded (replay)')
+    parser.add_argument('-m', '--more', action='store_true',
+                        help='also record the words in more_words (record)')
+    args = parser.parse_args(argv)
+    fixtures = Fixtures(args.directory)
+    if 'record' == args.mode:
+        if args.more:
+            record(fixtures, bench_words + more_words)
+        else:
+            record(fixtures)
+        print 'Recorded {0} responses.'.format(len(fixtures.index))
+        return 0
+    if not fixtures.index:
+        sys.exit('Nothing recorded yet. Run "record" first.')
+    site_runs, notes, unknown = replay(fixtures, args.rounds)
+    summary = summarize(site_runs)
+    previous = None
+    try:
+        with open(history_path, 'r') as history_file:
+            lines = history_file.readlines()
+        if lines:
+            previous = json.loads(lines[-1])
+    except (IOError, ValueError):
+        pass
+    print_report(summary, notes, previous)
+    if unknown:
+        print '{0} requests were not recorded, e.g. {1}'.format(
+            len(unknown), unknown[0])
+    with open(history_path, 'a') as history_file:
+        history_file.write(json.dumps(dict(
+            time=time.time(), commit=git_commit(), rounds=args.rounds,
+            sites=summary, notes=notes)) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())